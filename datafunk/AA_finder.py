@@ -34,6 +34,19 @@ def parse_AA_file(file):
     return(ls)
 
 
+def get_AA_genotype(seq, pos):
+    """
+    the amino acid coded for by the codon starting at pos (1-based) of
+    an aligned Seq, or 'X' if the codon has a gap or missing data in it
+    """
+    QUERY_seq = seq[pos - 1: pos + 2]
+
+    if any([x in ['-', '?'] for x in QUERY_seq]):
+        return('X')
+
+    return(str(Seq(str(QUERY_seq)).translate()))
+
+
 def AA_finder(fasta_in, AA_file, genotypes_file):
     """
     For every record in the query fasta file, for every codon start defined in AA_file,
@@ -61,14 +74,7 @@ def AA_finder(fasta_in, AA_file, genotypes_file):
         for entry in AAs:
             pos = entry[1]
 
-            QUERY_seq = seq[pos - 1: pos + 2]
-
-            if any([x in ['-', '?'] for x in QUERY_seq]):
-                QUERY_allele = 'X'
-            else:
-                QUERY_allele = str(seq[pos - 1: pos + 2].translate())
-
-            genotypes.append(QUERY_allele)
+            genotypes.append(get_AA_genotype(seq, pos))
 
         g_out.write(ID + "," + ",".join(genotypes) + "\n")
 
@@ -11,6 +11,7 @@ __all__ = ["repair_names","clean_names","remove_fasta","merge_fasta",
            "process_gisaid_data", "pad_alignment", "exclude_uk_seqs", "get_CDS",
            "distance_to_root", "mask", "curate_lineages", "snp_finder", "add_header_column",
            "extract_unannotated_seqs", "del_finder", "AA_finder",
-           "bootstrap"]
+           "bootstrap", "ingest_gisaid", "index_gisaid", "fetch_gisaid", "snp_dists",
+           "genotype", "aa_mutations", "sparse_alignment"]
 
 from datafunk import *
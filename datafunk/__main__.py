@@ -453,6 +453,11 @@ def main(args=None):
                         metavar = 'omissions.txt',
                         help='A file that contains (anywhere) EPI_ISL_###### IDs to exclude (can provide more than one file, '
                              'e.g. -e FILE1 -e FILE2 ...)')
+    optional_gisaid_json_2_metadata.add_argument('--location-cache',
+                        dest='location_cache',
+                        required=False,
+                        metavar = 'locations.json',
+                        help='File to cache resolved covv_location strings in between runs (read if it exists, then updated)')
 
     subparser_gisaid_json_2_metadata.set_defaults(func=datafunk.subcommands.gisaid_json_2_metadata.run)
 
@@ -573,6 +578,14 @@ def main(args=None):
         required=False,
         help="Column name for epi day column",
     )
+    subparser_add_epi_week.add_argument(
+        "--chunk-size",
+        dest="chunk_size",
+        default=100000,
+        type=int,
+        required=False,
+        help="Number of rows to read, convert and write at a time (default 100000)",
+    )
     subparser_add_epi_week.set_defaults(func=datafunk.subcommands.add_epi_week.run)
 
     # _______________________________ process_gisaid_data ____________________________________________#
@@ -593,7 +606,7 @@ def main(args=None):
                         required=True,
                         metavar = 'gisaid.json')
     required_process_gisaid_data.add_argument('--input-metadata',
-                        help='previous metadata (can be \'False\')',
+                        help='previous metadata, csv or .parquet/.feather (can be \'False\')',
                         required=True,
                         dest='input_metadata',
                         metavar='metadata.in.csv')
@@ -603,7 +616,7 @@ def main(args=None):
                         required=False,
                         metavar = 'output.fasta')
     optional_process_gisaid_data.add_argument('--output-metadata',
-                        help='metadata file to write.',
+                        help='metadata file to write (.parquet or .feather for a typed table).',
                         dest='output_metadata',
                         required=False,
                         metavar = 'metadata.out.csv')
@@ -633,9 +646,303 @@ def main(args=None):
                         dest='include_omitted_file',
                         required=False,
                         help='Write GISAID entries excluded in --exclude-file FILE to fasta (default is to exclude them)')
+    optional_process_gisaid_data.add_argument('--location-cache',
+                        dest='location_cache',
+                        required=False,
+                        metavar = 'locations.json',
+                        help='File to cache resolved covv_location strings in between runs (read if it exists, then updated)')
+    optional_process_gisaid_data.add_argument('--skip-stage',
+                        action='append',
+                        dest='skip_stage',
+                        required=False,
+                        metavar = 'STAGE',
+                        help='Name of a record processing stage to skip, e.g. get_travel_history (can provide many, e.g. --skip-stage STAGE1 --skip-stage STAGE2 ...)')
+    optional_process_gisaid_data.add_argument('--add-stage',
+                        action='append',
+                        dest='add_stage',
+                        required=False,
+                        metavar = 'module.path:function',
+                        help='A function to run on each new record after the built-in stages. It takes and returns one record dict (can provide many)')
+    optional_process_gisaid_data.add_argument('--stage-timings',
+                        action='store_true',
+                        dest='stage_timings',
+                        required=False,
+                        help='Write the total time spent in each record processing stage to stderr')
+    optional_process_gisaid_data.add_argument('--partition-by',
+                        dest='partition_by',
+                        required=False,
+                        metavar = 'FIELD',
+                        help='Also write one fasta and one metadata file per value of this metadata field (e.g. edin_admin_0 or edin_epi_week), with a manifest.tsv of record counts and file sizes')
+    optional_process_gisaid_data.add_argument('--partition-dir',
+                        dest='partition_dir',
+                        required=False,
+                        default='partitions',
+                        metavar = 'DIR',
+                        help='Directory to write --partition-by files to (default is "partitions")')
+    optional_process_gisaid_data.add_argument('--max-open-files',
+                        dest='max_open_files',
+                        required=False,
+                        default=64,
+                        type=int,
+                        metavar = 'INT',
+                        help='Maximum number of partition files to keep open at once (default is 64)')
+
+    optional_process_gisaid_data.add_argument('--change-feed',
+                        dest='change_feed',
+                        required=False,
+                        metavar = 'changes.tsv',
+                        help='Write a tsv of the accessions added, changed (with the changed fields) and removed since the input metadata')
+
+    optional_process_gisaid_data.add_argument('--checkpoint',
+                        dest='checkpoint',
+                        required=False,
+                        metavar = 'checkpoint.jsonl',
+                        help='Save processed records to this file as the run goes along, so that it can be resumed with --resume if it fails (removed when the run finishes)')
+    optional_process_gisaid_data.add_argument('--checkpoint-every',
+                        dest='checkpoint_every',
+                        required=False,
+                        default=10000,
+                        type=int,
+                        metavar = 'INT',
+                        help='Number of records to process between saves to --checkpoint (default is 10000)')
+    optional_process_gisaid_data.add_argument('--resume',
+                        action='store_true',
+                        dest='resume',
+                        required=False,
+                        help='Carry on from the records saved in --checkpoint by a run with the same inputs that didn\'t finish')
 
     subparser_process_gisaid_data.set_defaults(func=datafunk.subcommands.process_gisaid_data.run)
 
+    # _______________________________ ingest_gisaid ____________________________________________#
+    subparser_ingest_gisaid = subparsers.add_parser(
+        """ingest_gisaid""",
+        usage="""datafunk ingest_gisaid --input-json <export.json> [--input-metadata <in.csv>]
+                 [--output-fasta <out.fa>] [--output-metadata <out.csv>] [--output-sequences <seqs.fa>]
+                 [--output-json-metadata <out.csv>] [--exclude-file <omissions.txt>] [--exclude-uk] [--exclude-undated]""",
+        description="""Read a Gisaid json dump once and write any of the process_gisaid_data, process_gisaid_sequence_data and gisaid_json_2_metadata outputs""",
+        help="""Gisaid json -> any of the process_gisaid_data / process_gisaid_sequence_data / gisaid_json_2_metadata outputs, in one pass""")
+
+    subparser_ingest_gisaid._action_groups.pop()
+    required_ingest_gisaid = subparser_ingest_gisaid.add_argument_group('required arguments')
+    optional_ingest_gisaid = subparser_ingest_gisaid.add_argument_group('optional arguments')
+
+    required_ingest_gisaid.add_argument('--input-json',
+                        dest='json',
+                        help='Gisaid json data',
+                        required=True,
+                        metavar = 'gisaid.json')
+    optional_ingest_gisaid.add_argument('--input-metadata',
+                        help='previous process_gisaid_data metadata (default \'False\')',
+                        required=False,
+                        default='False',
+                        dest='input_metadata',
+                        metavar='metadata.in.csv')
+    optional_ingest_gisaid.add_argument('--output-fasta',
+                        help='process_gisaid_data fasta file to write',
+                        dest='output_fasta',
+                        required=False,
+                        metavar = 'output.fasta')
+    optional_ingest_gisaid.add_argument('--output-metadata',
+                        help='process_gisaid_data metadata file to write',
+                        dest='output_metadata',
+                        required=False,
+                        metavar = 'metadata.out.csv')
+    optional_ingest_gisaid.add_argument('--output-sequences',
+                        help='process_gisaid_sequence_data fasta file to write',
+                        dest='output_sequences',
+                        required=False,
+                        metavar = 'sequences.fasta')
+    optional_ingest_gisaid.add_argument('--output-json-metadata',
+                        help='gisaid_json_2_metadata metadata file to write',
+                        dest='output_json_metadata',
+                        required=False,
+                        metavar = 'NEW_metadata.csv')
+    optional_ingest_gisaid.add_argument('--json-metadata-csv',
+                        help='previous gisaid_json_2_metadata metadata (default \'False\')',
+                        dest='json_metadata_csv',
+                        required=False,
+                        default='False',
+                        metavar = 'OLD_metadata.csv')
+    optional_ingest_gisaid.add_argument('--lineages',
+                        help='csv file of lineages for --output-json-metadata',
+                        dest='lineages',
+                        required=False,
+                        metavar = 'lineages.csv')
+    optional_ingest_gisaid.add_argument('--exclude-file',
+                        action='append',
+                        required=False,
+                        dest='exclude',
+                        metavar = 'FILE',
+                        help='A file that contains (anywhere) EPI_ISL_###### IDs to exclude (can provide many files, e.g. -e FILE1 -e FILE2 ...)')
+    optional_ingest_gisaid.add_argument('--exclude-uk',
+                        action='store_true',
+                        dest='exclude_uk',
+                        required=False,
+                        help='Excludes GISAID entries from England, Ireland, Scotland or Wales from being written to fasta (default is to include them)')
+    optional_ingest_gisaid.add_argument('--exclude-undated',
+                        action='store_true',
+                        dest='exclude_undated',
+                        required=False,
+                        help='Excludes GISAID entries with an incomplete date from being written to fasta (default is to include them)')
+    optional_ingest_gisaid.add_argument('--include-subsampled',
+                        action='store_true',
+                        dest='include_subsampled',
+                        required=False,
+                        help='Write GISAID entries previously flagged as duplicated to the process_gisaid_data fasta (default is to exclude them)')
+    optional_ingest_gisaid.add_argument('--include-omitted-file',
+                        action='store_true',
+                        dest='include_omitted_file',
+                        required=False,
+                        help='Write GISAID entries excluded in --exclude-file FILE to the process_gisaid_data fasta (default is to exclude them)')
+    optional_ingest_gisaid.add_argument('--location-cache',
+                        dest='location_cache',
+                        required=False,
+                        metavar = 'locations.json',
+                        help='File to cache resolved covv_location strings in between runs (read if it exists, then updated)')
+    optional_ingest_gisaid.add_argument('--skip-stage',
+                        action='append',
+                        dest='skip_stage',
+                        required=False,
+                        metavar = 'STAGE',
+                        help='Name of a process_gisaid_data record processing stage to skip (can provide many)')
+    optional_ingest_gisaid.add_argument('--add-stage',
+                        action='append',
+                        dest='add_stage',
+                        required=False,
+                        metavar = 'module.path:function',
+                        help='A function for process_gisaid_data to run on each new record after the built-in stages. It takes and returns one record dict (can provide many)')
+    optional_ingest_gisaid.add_argument('--stage-timings',
+                        action='store_true',
+                        dest='stage_timings',
+                        required=False,
+                        help='Write the total time spent in each process_gisaid_data record processing stage to stderr')
+    optional_ingest_gisaid.add_argument('--partition-by',
+                        dest='partition_by',
+                        required=False,
+                        metavar = 'FIELD',
+                        help='Also write one process_gisaid_data fasta and metadata file per value of this metadata field')
+    optional_ingest_gisaid.add_argument('--partition-dir',
+                        dest='partition_dir',
+                        required=False,
+                        default='partitions',
+                        metavar = 'DIR',
+                        help='Directory to write --partition-by files to (default is "partitions")')
+    optional_ingest_gisaid.add_argument('--max-open-files',
+                        dest='max_open_files',
+                        required=False,
+                        default=64,
+                        type=int,
+                        metavar = 'INT',
+                        help='Maximum number of partition files to keep open at once (default is 64)')
+
+    optional_ingest_gisaid.add_argument('--change-feed',
+                        dest='change_feed',
+                        required=False,
+                        metavar = 'changes.tsv',
+                        help='Write a tsv of the accessions added, changed (with the changed fields) and removed since the input metadata')
+
+    optional_ingest_gisaid.add_argument('--checkpoint',
+                        dest='checkpoint',
+                        required=False,
+                        metavar = 'checkpoint.jsonl',
+                        help='Save processed process_gisaid_data records to this file as the run goes along, so that it can be resumed with --resume if it fails')
+    optional_ingest_gisaid.add_argument('--checkpoint-every',
+                        dest='checkpoint_every',
+                        required=False,
+                        default=10000,
+                        type=int,
+                        metavar = 'INT',
+                        help='Number of records to process between saves to --checkpoint (default is 10000)')
+    optional_ingest_gisaid.add_argument('--resume',
+                        action='store_true',
+                        dest='resume',
+                        required=False,
+                        help='Carry on from the records saved in --checkpoint by a run with the same inputs that didn\'t finish')
+
+    subparser_ingest_gisaid.set_defaults(func=datafunk.subcommands.ingest_gisaid.run)
+
+    # _______________________________ index_gisaid ____________________________________________#
+    subparser_index_gisaid = subparsers.add_parser(
+        """index_gisaid""",
+        usage="""datafunk index_gisaid --input-json <export.json(.gz)> [--index <export.json.idx>]""",
+        description="""Index a Gisaid json dump (plain or bgzip-compressed) by accession and virus name, for fetch_gisaid""",
+        help="""Index a Gisaid json dump by accession and virus name""")
+
+    subparser_index_gisaid._action_groups.pop()
+    required_index_gisaid = subparser_index_gisaid.add_argument_group('required arguments')
+    optional_index_gisaid = subparser_index_gisaid.add_argument_group('optional arguments')
+
+    required_index_gisaid.add_argument('--input-json',
+                        dest='json',
+                        help='Gisaid json data (can be bgzip-compressed)',
+                        required=True,
+                        metavar = 'gisaid.json')
+    optional_index_gisaid.add_argument('--index',
+                        dest='index',
+                        required=False,
+                        metavar = 'gisaid.json.idx',
+                        help='Index file to write (default is the json file name + .idx)')
+
+    subparser_index_gisaid.set_defaults(func=datafunk.subcommands.index_gisaid.run)
+
+    # _______________________________ fetch_gisaid ____________________________________________#
+    subparser_fetch_gisaid = subparsers.add_parser(
+        """fetch_gisaid""",
+        usage="""datafunk fetch_gisaid --input-json <export.json(.gz)> [-a EPI_ISL_###### ...] [--accession-file <ids.txt>]
+                 [-n <virus name> ...] [--virus-name-file <names.txt>] [--format json|fasta|metadata] [-o <output>]""",
+        description="""Read records out of an indexed Gisaid json dump by accession or virus name""",
+        help="""Read records out of an indexed Gisaid json dump by accession or virus name""")
+
+    subparser_fetch_gisaid._action_groups.pop()
+    required_fetch_gisaid = subparser_fetch_gisaid.add_argument_group('required arguments')
+    optional_fetch_gisaid = subparser_fetch_gisaid.add_argument_group('optional arguments')
+
+    required_fetch_gisaid.add_argument('--input-json',
+                        dest='json',
+                        help='Gisaid json data, indexed with datafunk index_gisaid',
+                        required=True,
+                        metavar = 'gisaid.json')
+    optional_fetch_gisaid.add_argument('--index',
+                        dest='index',
+                        required=False,
+                        metavar = 'gisaid.json.idx',
+                        help='Index file (default is the json file name + .idx)')
+    optional_fetch_gisaid.add_argument('-a', '--accession',
+                        action='append',
+                        dest='accessions',
+                        required=False,
+                        metavar = 'EPI_ISL_######',
+                        help='An accession to fetch (can provide many)')
+    optional_fetch_gisaid.add_argument('--accession-file',
+                        dest='accession_file',
+                        required=False,
+                        metavar = 'FILE',
+                        help='File with one accession to fetch per line')
+    optional_fetch_gisaid.add_argument('-n', '--virus-name',
+                        action='append',
+                        dest='virus_names',
+                        required=False,
+                        metavar = 'NAME',
+                        help='A covv_virus_name to fetch (can provide many)')
+    optional_fetch_gisaid.add_argument('--virus-name-file',
+                        dest='virus_name_file',
+                        required=False,
+                        metavar = 'FILE',
+                        help='File with one covv_virus_name to fetch per line')
+    optional_fetch_gisaid.add_argument('--format',
+                        dest='output_format',
+                        required=False,
+                        default='json',
+                        choices=['json', 'fasta', 'metadata'],
+                        help='Write the records as json lines, fasta, or csv metadata rows (default json)')
+    optional_fetch_gisaid.add_argument('-o', '--output',
+                        dest='output',
+                        required=False,
+                        metavar = 'FILE',
+                        help='File to write, print to stdout if unspecified')
+
+    subparser_fetch_gisaid.set_defaults(func=datafunk.subcommands.fetch_gisaid.run)
+
     # ___________________________________pad_alignment________________________________________#
 
     subparser_pad_alignment = subparsers.add_parser(
@@ -705,7 +1012,7 @@ def main(args=None):
 
     subparser_get_CDS = subparsers.add_parser(
         """get_CDS""",
-        usage="""datafunk get_CDS -i <input.fasta> -o <output.fasta> [--translate]""",
+        usage="""datafunk get_CDS -i <input.fasta> -o <output.fasta> [--translate] [--per-gene-prefix <prefix>] [--gff3 <annotation.gff3>]""",
         description="""Extracts CDS from alignments in Wuhan-Hu-1 coordinates""",
         help="""Extracts CDS from alignments in Wuhan-Hu-1 coordinates""")
 
@@ -728,6 +1035,23 @@ def main(args=None):
                         help='output amino acid sequence (default is nucleotides)',
                         required=False,
                         action='store_true')
+    optional_get_CDS.add_argument('--per-gene-prefix',
+                        help='Also write one fasta file per CDS, called <prefix><gene>.fasta (if -o is not specified, only these are written)',
+                        required=False,
+                        dest='gene_prefix',
+                        metavar='prefix')
+    optional_get_CDS.add_argument('--gff3',
+                        help='GFF3 file to read the CDS coordinates (in Wuhan-Hu-1 coordinates) from, instead of the built in ones',
+                        required=False,
+                        dest='gff3_file',
+                        metavar='annotation.gff3')
+    optional_get_CDS.add_argument('--batch-size',
+                        help='Number of sequences to take CDSs out of at a time (default 1000)',
+                        required=False,
+                        default=1000,
+                        type=int,
+                        dest='batch_size',
+                        metavar='N')
 
     subparser_get_CDS.set_defaults(func=datafunk.subcommands.get_CDS.run)
 
@@ -753,10 +1077,85 @@ def main(args=None):
                         required=True,
                         dest='metadata_in',
                         metavar='input.csv')
+    optional_distance_to_root.add_argument('-t', '--threads',
+                        help='Number of processes to compare sequences in (default 1)',
+                        required=False,
+                        default=1,
+                        type=int,
+                        dest='threads',
+                        metavar='N')
+    optional_distance_to_root.add_argument('--batch-size',
+                        help='Number of sequences to compare at a time (default 1000)',
+                        required=False,
+                        default=1000,
+                        type=int,
+                        dest='batch_size',
+                        metavar='N')
+    optional_distance_to_root.add_argument('--group-by',
+                        help='Metadata column(s) to compare each sample to the other samples with the same values of (default edin_epi_week)',
+                        required=False,
+                        nargs='+',
+                        dest='group_by',
+                        metavar='column')
+    optional_distance_to_root.add_argument('--cache',
+                        help='SQLite file of distances from earlier runs (made if it doesn\'t exist). Only sequences that aren\'t in it are compared, and their distances are added to it',
+                        required=False,
+                        dest='cache_file',
+                        metavar='distances.sqlite')
 
 
     subparser_distance_to_root.set_defaults(func=datafunk.subcommands.distance_to_root.run)
 
+    # ___________________________ snp_dists _____________________________________#
+
+    subparser_snp_dists = subparsers.add_parser(
+        """snp_dists""",
+        usage="""datafunk snp_dists -i <aligned.fasta> -o <distances.tsv|distances.npz> [--threshold <int>] [-t <threads>]""",
+        description="""pairwise SNP distances between all the sequences in an alignment""",
+        help="""pairwise SNP distances between all the sequences in an alignment""")
+
+    subparser_snp_dists._action_groups.pop()
+    required_snp_dists = subparser_snp_dists.add_argument_group('required arguments')
+    optional_snp_dists = subparser_snp_dists.add_argument_group('optional arguments')
+
+    required_snp_dists.add_argument('-i', '--input-fasta',
+                        help='Aligned fasta file to read',
+                        required=True,
+                        dest='fasta_in',
+                        metavar='input.fasta')
+    required_snp_dists.add_argument('-o', '--output',
+                        help='File to write. Long format tsv (one line per pair), or a compressed numpy matrix if it ends .npz',
+                        required=True,
+                        dest='output',
+                        metavar='distances.tsv')
+    optional_snp_dists.add_argument('--threshold',
+                        help='Only write pairs of sequences at most this many SNPs apart',
+                        required=False,
+                        type=int,
+                        dest='threshold',
+                        metavar='int')
+    optional_snp_dists.add_argument('--output-format',
+                        help='Format to write, tsv or npz (default from the output file name)',
+                        required=False,
+                        choices=['tsv', 'npz'],
+                        dest='output_format')
+    optional_snp_dists.add_argument('-t', '--threads',
+                        help='Number of processes to work out distances in (default 1)',
+                        required=False,
+                        default=1,
+                        type=int,
+                        dest='threads',
+                        metavar='N')
+    optional_snp_dists.add_argument('--block-size',
+                        help='Number of sequences in each block of the matrix worked out at a time (default 64)',
+                        required=False,
+                        default=64,
+                        type=int,
+                        dest='block_size',
+                        metavar='N')
+
+    subparser_snp_dists.set_defaults(func=datafunk.subcommands.snp_dists.run)
+
     # ___________________________ mask _____________________________________#
 
     subparser_mask = subparsers.add_parser(
@@ -793,7 +1192,7 @@ def main(args=None):
         "curate_lineages",
         description="Find new lineages, merge ones that need merging, split ones that need splitting",
         help="Find new lineages, merge ones that need merging, split ones that need splitting",
-        usage="datafunk curate_lineages -i <input_directory>",
+        usage="datafunk curate_lineages -i <input_directory> [--previous <assignments.csv>]",
     )
 
     subparser_curate_lineages.add_argument(
@@ -813,6 +1212,14 @@ def main(args=None):
         help="Name of output CSV",
     )
 
+    subparser_curate_lineages.add_argument(
+        "--previous",
+        dest="previous_file",
+        required=False,
+        type=str,
+        help="Output CSV of a previous run. Deltrans lineages with the same taxa as a lineage in it keep that lineage's name",
+    )
+
     subparser_curate_lineages.set_defaults(func=datafunk.subcommands.curate_lineages.run)
 
     # _________________________________ snp_finder ____________________________#
@@ -836,7 +1243,7 @@ def main(args=None):
         "del_finder",
         description="Query an alignment position for deletions",
         help="Query an alignment position for deletions",
-        usage="datafunk del_finder -i <input.fasta> --deletions-file <deletions.csv> --genotypes-table <results.csv>",
+        usage="datafunk del_finder -i <input.fasta> --deletions-file <deletions.csv> --genotypes-table <results.csv> | datafunk del_finder -i <input.fasta> --discover <deletions.csv>",
     )
     subparser_del_finder._action_groups.pop()
     required_del_finder = subparser_del_finder.add_argument_group('required arguments')
@@ -852,14 +1259,14 @@ def main(args=None):
                             required=False,
                             dest='fasta_out',
                             metavar='output.fasta')
-    required_del_finder.add_argument('--deletions-file',
-                        help='Input CSV file with deletions type. Format is: 1-based start position of deletion,length of deletion (dont include a header line), eg: 1605,3',
-                        required=True,
+    optional_del_finder.add_argument('--deletions-file',
+                        help='Input CSV file with deletions type. Format is: 1-based start position of deletion,length of deletion, eg: 1605,3 (a table written by --discover can be used too)',
+                        required=False,
                         dest='del_file',
                         metavar='deletions.csv')
-    required_del_finder.add_argument('--genotypes-table',
+    optional_del_finder.add_argument('--genotypes-table',
                         help='CSV file with deletion typing results to write. Returns the genotype for each deletion in --deletions-file for each sequence in --input-fasta: either "ref", "del" or "X" (for missing data)',
-                        required=True,
+                        required=False,
                         dest='genotypes_file',
                         metavar='results.csv')
     optional_del_finder.add_argument('--append-as-SNP',
@@ -867,6 +1274,32 @@ def main(args=None):
                         required=False,
                         dest='append_snp',
                         action='store_true')
+    optional_del_finder.add_argument('--discover',
+                        help='Instead of typing deletions, find every run of gaps in --input-fasta and write a CSV of start, length, count, frequency and example sequences for each, which can be used as a --deletions-file',
+                        required=False,
+                        dest='discover_file',
+                        metavar='deletions.csv')
+    optional_del_finder.add_argument('--min-count',
+                        help='With --discover, only write deletions found in at least this many sequences (default 1)',
+                        required=False,
+                        default=1,
+                        type=int,
+                        dest='min_count',
+                        metavar='N')
+    optional_del_finder.add_argument('--examples',
+                        help='With --discover, the number of example sequences to write for each deletion (default 3)',
+                        required=False,
+                        default=3,
+                        type=int,
+                        dest='examples',
+                        metavar='N')
+    optional_del_finder.add_argument('-t', '--threads',
+                        help='With --discover, the number of processes to search sequences in (default 1)',
+                        required=False,
+                        default=1,
+                        type=int,
+                        dest='threads',
+                        metavar='N')
 
     subparser_del_finder.set_defaults(func=datafunk.subcommands.del_finder.run)
 
@@ -1011,6 +1444,162 @@ def main(args=None):
 
     subparser_AA_finder.set_defaults(func=datafunk.subcommands.AA_finder.run)
 
+    # _________________________________ genotype ____________________________#
+
+    subparser_genotype = subparsers.add_parser(
+        "genotype",
+        description="Genotype an alignment at SNPs, deletions and amino acid sites in one pass",
+        help="Genotype an alignment at SNPs, deletions and amino acid sites in one pass",
+        usage="datafunk genotype -i <input.fasta> --variants-file <variants.csv> --genotypes-table <results.csv> [--format wide|long] [-t <threads>]",
+    )
+    subparser_genotype._action_groups.pop()
+    required_genotype = subparser_genotype.add_argument_group('required arguments')
+    optional_genotype = subparser_genotype.add_argument_group('optional arguments')
+
+    required_genotype.add_argument('-i', '--input-fasta',
+                        help='Alignment (to Wuhan-Hu-1) in Fasta format to type',
+                        required=True,
+                        dest='fasta_in',
+                        metavar='input.fasta')
+    required_genotype.add_argument('--variants-file',
+                        help='Input CSV file of variants to type, with a header. Columns are: type (snp, del or aa),name,location,length (for del),nuc1,label1,nuc2,label2 (for snp), eg: snp,D614G_nuc,23403,,A,D,G,G',
+                        required=True,
+                        dest='variants_file',
+                        metavar='variants.csv')
+    required_genotype.add_argument('--genotypes-table',
+                        help='CSV file with typing results to write. SNPs are typed as their label, deletions as "ref", "del" or "X", and amino acid sites as the amino acid or "X"',
+                        required=True,
+                        dest='genotypes_file',
+                        metavar='results.csv')
+    optional_genotype.add_argument('--format',
+                        help='Write one row per sequence (wide, the default) or one row per sequence per variant (long)',
+                        required=False,
+                        default='wide',
+                        choices=['wide', 'long'],
+                        dest='output_format')
+    optional_genotype.add_argument('-t', '--threads',
+                        help='Number of processes to type sequences in (default 1)',
+                        required=False,
+                        default=1,
+                        type=int,
+                        dest='threads',
+                        metavar='N')
+
+    subparser_genotype.set_defaults(func=datafunk.subcommands.genotype.run)
+
+    # _________________________________ aa_mutations ____________________________#
+
+    subparser_aa_mutations = subparsers.add_parser(
+        "aa_mutations",
+        description="Find the amino acid substitutions in every CDS of an alignment to Wuhan-Hu-1",
+        help="Find the amino acid substitutions in every CDS of an alignment to Wuhan-Hu-1",
+        usage="datafunk aa_mutations -i <input.fasta> -o <mutations.csv> [-t <threads>]",
+    )
+    subparser_aa_mutations._action_groups.pop()
+    required_aa_mutations = subparser_aa_mutations.add_argument_group('required arguments')
+    optional_aa_mutations = subparser_aa_mutations.add_argument_group('optional arguments')
+
+    required_aa_mutations.add_argument('-i', '--input-fasta',
+                        help='Alignment (to Wuhan-Hu-1) in Fasta format',
+                        required=True,
+                        dest='fasta_in',
+                        metavar='input.fasta')
+    required_aa_mutations.add_argument('-o', '--output',
+                        help='CSV file to write, with the substitutions in each sequence separated by ";", eg: S:D614G;N:R203K',
+                        required=True,
+                        dest='output',
+                        metavar='mutations.csv')
+    optional_aa_mutations.add_argument('-t', '--threads',
+                        help='Number of processes to translate sequences in (default 1)',
+                        required=False,
+                        default=1,
+                        type=int,
+                        dest='threads',
+                        metavar='N')
+    optional_aa_mutations.add_argument('--batch-size',
+                        help='Number of sequences to translate at a time (default 1000)',
+                        required=False,
+                        default=1000,
+                        type=int,
+                        dest='batch_size',
+                        metavar='N')
+
+    subparser_aa_mutations.set_defaults(func=datafunk.subcommands.aa_mutations.run)
+
+    # _________________________________ sparse_encode ____________________________#
+
+    subparser_sparse_encode = subparsers.add_parser(
+        "sparse_encode",
+        description="Write an alignment as its differences from the reference (substitutions, and intervals of N and gaps)",
+        help="Write an alignment as its differences from the reference",
+        usage="datafunk sparse_encode -i <input.fasta> -o <alignment.tsv.gz> [--reference <reference.fasta>] [-t <threads>]",
+    )
+    subparser_sparse_encode._action_groups.pop()
+    required_sparse_encode = subparser_sparse_encode.add_argument_group('required arguments')
+    optional_sparse_encode = subparser_sparse_encode.add_argument_group('optional arguments')
+
+    required_sparse_encode.add_argument('-i', '--input-fasta',
+                        help='Alignment (to the reference) in Fasta format',
+                        required=True,
+                        dest='fasta_in',
+                        metavar='input.fasta')
+    required_sparse_encode.add_argument('-o', '--output',
+                        help='Sparse alignment to write (gzipped if the name ends in .gz)',
+                        required=True,
+                        dest='sparse_out',
+                        metavar='alignment.tsv.gz')
+    optional_sparse_encode.add_argument('--reference',
+                        help='Reference to write the differences from, in Fasta format (default is Wuhan-Hu-1)',
+                        required=False,
+                        dest='reference_file',
+                        metavar='reference.fasta')
+    optional_sparse_encode.add_argument('-t', '--threads',
+                        help='Number of processes to encode sequences in (default 1)',
+                        required=False,
+                        default=1,
+                        type=int,
+                        dest='threads',
+                        metavar='N')
+    optional_sparse_encode.add_argument('--batch-size',
+                        help='Number of sequences to encode at a time (default 1000)',
+                        required=False,
+                        default=1000,
+                        type=int,
+                        dest='batch_size',
+                        metavar='N')
+
+    subparser_sparse_encode.set_defaults(func=datafunk.subcommands.sparse_encode.run)
+
+    # _________________________________ sparse_decode ____________________________#
+
+    subparser_sparse_decode = subparsers.add_parser(
+        "sparse_decode",
+        description="Write a sparse alignment (from sparse_encode) back out as an aligned fasta file",
+        help="Write a sparse alignment back out as an aligned fasta file",
+        usage="datafunk sparse_decode -i <alignment.tsv.gz> -o <output.fasta> [--reference <reference.fasta>]",
+    )
+    subparser_sparse_decode._action_groups.pop()
+    required_sparse_decode = subparser_sparse_decode.add_argument_group('required arguments')
+    optional_sparse_decode = subparser_sparse_decode.add_argument_group('optional arguments')
+
+    required_sparse_decode.add_argument('-i', '--input',
+                        help='Sparse alignment to read',
+                        required=True,
+                        dest='sparse_in',
+                        metavar='alignment.tsv.gz')
+    required_sparse_decode.add_argument('-o', '--output-fasta',
+                        help='Fasta file to write',
+                        required=True,
+                        dest='fasta_out',
+                        metavar='output.fasta')
+    optional_sparse_decode.add_argument('--reference',
+                        help='Reference the sparse alignment was made against, in Fasta format (default is Wuhan-Hu-1)',
+                        required=False,
+                        dest='reference_file',
+                        metavar='reference.fasta')
+
+    subparser_sparse_decode.set_defaults(func=datafunk.subcommands.sparse_decode.run)
+
     # _________________________________ bootstrap ____________________________#
 
     subparser_bootstrap = subparsers.add_parser(
@@ -0,0 +1,92 @@
+"""
+amino acid substitutions in every CDS of every sequence in an alignment
+(to Wuhan-Hu-1), compared to the translation of Wuhan-Hu-1.
+
+the CDSs are the ones in get_CDS (CDS_coordinates, with the ORF1ab frameshift),
+without their stop codons. Sequences are read in batches, and each batch is
+translated at once by looking its codons up in get_CDS's codon table. A
+substitution is written as gene:<reference amino acid><codon number><amino acid>,
+eg S:D614G. Codons that don't translate to one amino acid (with gaps, Ns and
+so on) aren't called
+"""
+
+import numpy as np
+
+from datafunk.batches import iterate_fasta_batches, map_batches
+from datafunk.del_finder import WuhanHu1
+from datafunk.get_CDS import CDS_coordinates, CDS_names, encode_codon_sequences, get_CDS_columns, translate_codes
+
+
+"""amino acids (and stops) that are called:
+"""
+called_AAs = 'ACDEFGHIKLMNPQRSTVWY*'
+
+_reference = str(WuhanHu1.seq).upper()
+_translation = None
+
+
+class translation():
+    """
+    the columns of all the codons in the CDSs (without their stop codons), the
+    reference's amino acid at each of them, and the start of the name of a
+    substitution at each of them (eg S:D614)
+    """
+
+    def __init__(self, coordinates = CDS_coordinates, names = CDS_names, reference = _reference):
+        self.columns = np.concatenate([get_CDS_columns(coords)[:-3] for coords in coordinates])
+        self.reference = translate_codes(encode_codon_sequences([reference], len(reference)), self.columns)[0]
+
+        reference_AAs = self.reference.tobytes().decode('ascii')
+        self.prefixes = []
+        for coords, name in zip(coordinates, names):
+            for i in range((len(get_CDS_columns(coords)) - 3) // 3):
+                self.prefixes.append(name + ':' + reference_AAs[len(self.prefixes)] + str(i + 1))
+
+        self.called = np.zeros(256, dtype = bool)
+        self.called[[ord(x) for x in called_AAs]] = True
+
+    def get_mutations(self, codes):
+        """
+        codes is a matrix of codon nucleotide codes, one row per sequence.
+        Returns a list of the substitutions in each sequence
+        """
+        AAs = translate_codes(codes, self.columns)
+        rows, codons = np.nonzero((AAs != self.reference) & self.called[AAs])
+
+        mutations = [[] for x in range(codes.shape[0])]
+        for row, codon, AA in zip(rows.tolist(), codons.tolist(), AAs[rows, codons].tobytes().decode('ascii')):
+            mutations[row].append(self.prefixes[codon] + AA)
+
+        return(mutations)
+
+
+def set_translation(t):
+    global _translation
+    _translation = t
+
+
+def get_batch_mutations(batch):
+    """
+    batch is a list of (ID, sequence). Returns a list of (ID, substitutions)
+    """
+    IDs = [x[0] for x in batch]
+    codes = encode_codon_sequences([x[1] for x in batch], len(_reference))
+    return(list(zip(IDs, _translation.get_mutations(codes))))
+
+
+def aa_mutations(fasta_in, output, threads = 1, batch_size = 1000):
+    """
+    For every record in fasta_in, write its amino acid substitutions (separated
+    by ;) to the csv file output
+    """
+    t = translation()
+
+    batches = iterate_fasta_batches(fasta_in, len(_reference), batch_size)
+
+    out = open(output, 'w')
+    out.write('sequence_name,aa_mutations\n')
+
+    for batch in map_batches(get_batch_mutations, batches, threads, initializer = set_translation, initargs = (t,)):
+        out.write(''.join([ID + ',' + ';'.join(mutations) + '\n' for ID, mutations in batch]))
+
+    out.close()
@@ -1,84 +1,72 @@
 import pandas as pd
-from epiweeks import Week,Year
-import datetime
-from datetime import datetime
-import re
-from itertools import chain
 
+from datafunk.epicalendar import date_column_to_epi_weeks_and_days
+from datafunk.columnar import is_columnar, iterate_metadata_table, columnar_table_writer, value_to_string
 
-def date_string_to_epi_week(date_string):
+
+def get_sep(metadata_file):
+    sep = ','
+    if metadata_file.endswith('tsv'):
+        sep = '\t'
+    return sep
+
+
+def iterate_dataframe_chunks(metadata_file, chunk_size):
     """
-    parse a date string in YYYY-MM-DD format and return
-    cumulative epi week which is cumulative total epidemiological
-    weeks since 2019-12-22. Week beginning 2019-12-22 is week 0
+    read the metadata chunk_size rows at a time. Every column is read
+    as a string so that the values are written back out unchanged
+    (and so the types can't differ between chunks)
     """
-    try:
-        date = datetime.strptime(date_string, '%Y-%m-%d').date()
-    except:
-        return ""
-    # this is epi-week:
-    week = Week.fromdate(date)
-    if week.year < 2019 or (week.year == 2019 and week.week < 52):
-        return ""
-    elif week.year == 2019:
-        return("0")
-    else:
-        cum_epi_week = week.week + len(list(chain(*[[x for x in Year(y).iterweeks()] for y in range(2020, week.year)])))
-        return str(cum_epi_week)
+    if is_columnar(metadata_file):
+        return iterate_metadata_table(metadata_file, chunk_size)
+    sep = get_sep(metadata_file)
+    return pd.read_csv(metadata_file, sep=sep, dtype=str, keep_default_na=False, chunksize=chunk_size)
 
 
-def date_string_to_epi_day(date_string):
+def add_epi_week_column(in_metadata, out_metadata, date_column,
+                        epi_week_column_name="edin_epi_week",
+                        epi_day_column_name=None,
+                        chunk_size=100000):
     """
-    parse a date string in YYYY-MM-DD format and return
-    cumulative epi day which is cumulative total days since 2019-12-22
+    add (or overwrite) epi week and optionally epi day columns, streaming
+    the table through chunk_size rows at a time so that memory use doesn't
+    depend on the size of the table
     """
-    try:
-        date = datetime.strptime(date_string, '%Y-%m-%d').date()
-    except:
-        return ""
-    # this is epi-week week:
-    week = Week.fromdate(date)
-    # this is day 1 of epi-week 0:
-    day_one = datetime.strptime("2019-12-22", '%Y-%m-%d').date()
-    if week.year < 2019 or (week.year == 2019 and week.week < 52):
-        return ""
-    else:
-        cum_epi_day = (date - day_one).days + 1
-        return str(cum_epi_day)
 
+    if is_columnar(out_metadata):
+        writer = columnar_table_writer(out_metadata)
+        for metadata in iterate_dataframe_chunks(in_metadata, chunk_size):
+            metadata = add_epi_week_to_chunk(metadata, date_column, epi_week_column_name, epi_day_column_name)
+            # the epi columns are integers in a typed table, the other columns keep their types
+            metadata[epi_week_column_name] = pd.array([int(x) if x != '' else None for x in metadata[epi_week_column_name]], dtype='Int32')
+            if epi_day_column_name:
+                metadata[epi_day_column_name] = pd.array([int(x) if x != '' else None for x in metadata[epi_day_column_name]], dtype='Int32')
+            writer.write(metadata)
+        writer.close()
+        return
 
-def load_dataframe(metadata_file):
-    sep = ','
-    if metadata_file.endswith('tsv'):
-        sep = '\t'
-    df = pd.read_csv(metadata_file, sep=sep)
-    return df
-
+    first = True
+    with open(out_metadata, 'w', newline='') as out:
+        for metadata in iterate_dataframe_chunks(in_metadata, chunk_size):
+            metadata = add_epi_week_to_chunk(metadata, date_column, epi_week_column_name, epi_day_column_name)
+            metadata.to_csv(out, index=False, header=first)
+            first = False
 
-def add_epi_week_column(in_metadata, out_metadata, date_column,
-                        epi_week_column_name="edin_epi_week",
-                        epi_day_column_name=None):
 
-    metadata = load_dataframe(in_metadata)
+def add_epi_week_to_chunk(metadata, date_column, epi_week_column_name, epi_day_column_name):
+    """
+    epi week (and day) columns as strings. A typed (columnar) date
+    column is turned back into YYYY-MM-DD strings first
+    """
+    dates = metadata[date_column]
+    if dates.dtype != object:
+        dates = pd.Series([value_to_string(x) for x in dates.astype(object)], index=metadata.index, dtype=object)
 
-    epi_week_column = []
-    epi_day_column = []
-    for i,row in metadata.iterrows():
-        date_string = row[date_column]
-        epi_week = date_string_to_epi_week(date_string)
-        epi_day = date_string_to_epi_day(date_string)
-        epi_week_column.append(epi_week)
-        epi_day_column.append(epi_day)
+    epi_week_column, epi_day_column = date_column_to_epi_weeks_and_days(dates)
 
-    if epi_week_column_name in metadata.columns:
-        metadata[epi_week_column_name].update(pd.Series(epi_week_column))
-    else:
-        metadata[epi_week_column_name] = epi_week_column
+    metadata[epi_week_column_name] = epi_week_column
 
     if epi_day_column_name:
-        if epi_day_column_name in metadata.columns:
-            metadata[epi_day_column_name].update(pd.Series(epi_day_column))
-        else:
-            metadata[epi_day_column_name] = epi_day_column
+        metadata[epi_day_column_name] = epi_day_column
 
-    metadata.to_csv(out_metadata, index=False)
+    return metadata
@@ -4,12 +4,14 @@ import re
 from Bio import SeqIO
 import sys
 
+from datafunk.columnar import load_metadata_dataframe, save_metadata_dataframe
+
 def load_dataframe(metadata_file):
     sep = ','
     if metadata_file.endswith('tsv'):
         sep = '\t'
     na_values = ["None", ""]
-    df = pd.read_csv(metadata_file, sep=sep, na_values=na_values)
+    df = load_metadata_dataframe(metadata_file, sep=sep, na_values=na_values)
     return df
 
 def parse_virus_name(header):
@@ -121,7 +123,7 @@ def add_header_column(input_fasta, input_metadata, output_fasta, output_metadata
     if len(found_headers) != len(metadata[column_name].unique().tolist()):
         log_handle.write("Warning: there were %i entries in input fasta, but only %i unique headers have been added to "
                          "metadata" %(len(found_headers),len(metadata[column_name].unique().tolist())))
-    metadata.to_csv(output_metadata, index=False)
+    save_metadata_dataframe(metadata, output_metadata)
 
     if log_handle:
         log_handle.close()
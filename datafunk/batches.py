@@ -0,0 +1,71 @@
+"""
+reading an alignment a batch of sequences at a time, and working on the
+batches in a multiprocessing pool.
+
+a pool reads its tasks in a thread of its own, and hangs if that thread exits,
+so a sequence of the wrong length raises unequal_lengths instead of exiting.
+map_batches passes it on to the main thread, and exits there
+"""
+
+from Bio.SeqIO.FastaIO import SimpleFastaParser
+from multiprocessing import Pool
+import sys
+
+
+class unequal_lengths(Exception):
+    pass
+
+
+def iterate_fasta_batches(fasta_in, length, batch_size = 1000, keep = None):
+    """
+    lists of batch_size (ID, sequence) at a time from fasta_in, where every
+    sequence must be length long. If there is a keep function, only the
+    sequences whose ID it returns True for
+    """
+    batch = []
+    with open(fasta_in, 'r') as f:
+        for title, seq in SimpleFastaParser(f):
+            ID = title.split(None, 1)[0] if title else ''
+            if keep and not keep(ID):
+                continue
+            if len(seq) != length:
+                raise unequal_lengths(ID)
+            batch.append((ID, seq))
+            if len(batch) == batch_size:
+                yield(batch)
+                batch = []
+    if len(batch) > 0:
+        yield(batch)
+
+
+def map_batches(function, batches, threads = 1, initializer = None, initargs = (),
+                length_error = 'reference and query sequences are not the same length!'):
+    """
+    function of each batch, in order, worked out in threads processes (each
+    set up with initializer(*initargs) first). Exits with length_error if a
+    batch has a sequence of the wrong length in it
+    """
+    if threads > 1:
+        pool = Pool(threads, initializer = initializer, initargs = initargs)
+        results = pool.imap(function, batches)
+    else:
+        pool = None
+        if initializer:
+            initializer(*initargs)
+        results = map(function, batches)
+
+    try:
+        for result in results:
+            yield(result)
+    except unequal_lengths:
+        if pool:
+            pool.terminate()
+        sys.exit(length_error)
+    except BaseException:
+        if pool:
+            pool.terminate()
+        raise
+
+    if pool:
+        pool.close()
+        pool.join()
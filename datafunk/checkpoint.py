@@ -0,0 +1,150 @@
+"""
+checkpointing of processed records, so that a long run that fails part way
+through can be resumed without processing everything again, and writing of
+output files so that they only appear once they are complete.
+
+a checkpoint file is json lines: the first line describes the inputs of the
+run (so a checkpoint can't be resumed with different inputs), and every line
+after that is one processed record. Records are appended a chunk at a time,
+and each chunk is flushed to disk before the run carries on. A last line that
+was only partly written when the run died is ignored on resume
+"""
+
+import os
+import sys
+import json
+import hashlib
+from contextlib import contextmanager
+
+from datafunk.edin_flags import edin_flag_to_string, get_flags
+
+
+def temporary_path(path):
+    """
+    where to write path before it's complete. In the same directory (so that
+    os.replace is atomic) and with the same extension (which says what
+    format to write, eg. for .parquet)
+    """
+    directory, name = os.path.split(path)
+    return(os.path.join(directory, '.tmp.' + name))
+
+
+@contextmanager
+def atomic_open(path, mode = 'w'):
+    """
+    open a temporary file for writing, which replaces path
+    only when it has been written and closed without an error
+    """
+    tmp = temporary_path(path)
+    f = open(tmp, mode)
+    try:
+        yield(f)
+    except:
+        f.close()
+        os.remove(tmp)
+        raise
+    f.close()
+    os.replace(tmp, path)
+
+
+def file_fingerprint(file, block_size = 65536):
+    """
+    [size, modification time, hash of the first and last block_size bytes]
+    of a file, which change if it's replaced (even by a file of the same size)
+    without reading all of it
+    """
+    stat = os.stat(file)
+    h = hashlib.sha1()
+    with open(file, 'rb') as f:
+        h.update(f.read(block_size))
+        f.seek(max(0, stat.st_size - block_size))
+        h.update(f.read(block_size))
+    return([stat.st_size, stat.st_mtime_ns, h.hexdigest()])
+
+
+def input_description(files, options):
+    """
+    a description of a run's inputs: the path and fingerprint of each
+    input file, and the options that change how records are processed
+    """
+    described = []
+    for file in files:
+        if file and os.path.exists(file):
+            described.append([os.path.abspath(file)] + file_fingerprint(file))
+        else:
+            described.append([file, None])
+    return({'inputs': described, 'options': options})
+
+
+class record_checkpoint():
+    """
+    processed records saved as a run goes along. With resume, records saved
+    by an earlier run with the same inputs are loaded into self.records
+    (keyed by covv_accession_id), otherwise the checkpoint starts empty
+    """
+
+    def __init__(self, file, description, resume = False):
+        self.file = file
+        self.description = json.loads(json.dumps(description))
+        self.records = {}
+
+        if resume and os.path.exists(file):
+            self.load()
+            self.handle = open(file, 'a')
+        else:
+            if resume:
+                sys.stderr.write('No checkpoint ' + file + ' to resume from, starting from the beginning\n')
+            self.handle = open(file, 'w')
+            self.handle.write(json.dumps(self.description) + '\n')
+            self.sync()
+
+    def load(self):
+        with open(self.file, 'r') as f:
+            lines = f.readlines()
+
+        if not lines or json.loads(lines[0]) != self.description:
+            sys.exit('Checkpoint ' + self.file + ' was made from different inputs or options, can\'t resume from it')
+
+        complete_lines = lines[1:]
+        if complete_lines and not complete_lines[-1].endswith('\n'):
+            complete_lines = complete_lines[:-1]
+
+        for line in complete_lines:
+            record = json.loads(line)
+            record['edin_flag'] = get_flags(record['edin_flag'])
+            self.records[record['covv_accession_id']] = record
+
+        # drop any partly written line, so that new records start on a line of their own
+        with open(self.file, 'w') as f:
+            f.write(lines[0])
+            f.writelines(complete_lines)
+
+    def add(self, records):
+        """
+        save a chunk of processed records
+        """
+        for record in records:
+            d = dict(record)
+            d['edin_flag'] = edin_flag_to_string(d['edin_flag'])
+            self.handle.write(json.dumps(d) + '\n')
+        self.sync()
+
+    def sync(self):
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+
+    def __contains__(self, ID):
+        return(ID in self.records)
+
+    def __len__(self):
+        return(len(self.records))
+
+    def close(self):
+        self.handle.close()
+
+    def remove(self):
+        """
+        the run finished, so the checkpoint isn't needed any more
+        """
+        self.close()
+        os.remove(self.file)
@@ -2,9 +2,11 @@ import pandas as pd
 import pycountry as pc
 import re
 
+from datafunk.columnar import is_columnar, load_metadata_dataframe, save_metadata_dataframe
+
 def clean_name(input_file, input_trait, output_file = "cleaned_file.csv"):
     log_file = open(output_file+".log","w")
-    metadata = pd.read_csv(input_file)
+    metadata = load_metadata_dataframe(input_file)
     metadata.columns = metadata.columns.str.lower()
     trait = input_trait.lower()
 
@@ -18,4 +20,7 @@ def clean_name(input_file, input_trait, output_file = "cleaned_file.csv"):
             log_file.write("Fail to parse country: " + str(country) + " for label ID: " + str(metadata.iloc[[index]]) + "\n")
         metadata.loc[index,trait] = search_result[0].name
 
-    metadata.to_csv(output_file)    
\ No newline at end of file
+    if is_columnar(output_file):
+        save_metadata_dataframe(metadata, output_file)
+    else:
+        metadata.to_csv(output_file)    
\ No newline at end of file
@@ -0,0 +1,306 @@
+"""
+columnar (Parquet / Feather) metadata tables with real column types.
+
+a metadata file is treated as columnar if its name ends in .parquet / .pq
+(Parquet) or .feather / .arrow (Feather). Anything else is csv (or tsv).
+
+when writing, columns that are known to be integers, dates or a small set of
+repeated values (countries etc.) are given those types - but only if every
+value in the column can be converted without losing anything, otherwise the
+column stays as strings.
+
+when reading, only the requested columns are read, and filters such as
+[('edin_admin_0', '==', 'UK'), ('edin_epi_week', '>=', 40)] are pushed down
+to the reader so that row groups which can't match are skipped.
+
+needs pyarrow (pip install datafunk[parquet]), which is only imported
+when a columnar file is used
+"""
+
+import sys
+
+import pandas as pd
+
+from datafunk.edin_flags import metadata_values
+
+
+parquet_extensions = ('.parquet', '.pq')
+feather_extensions = ('.feather', '.arrow')
+
+integer_columns = ['edin_epi_week', 'edin_epi_day', 'epi_week', 'sequence_length']
+
+date_columns = ['edin_date_stamp', 'covv_subm_date', 'covv_collection_date',
+                'sample_date', 'collection_date']
+
+categorical_columns = ['edin_admin_0', 'edin_admin_1', 'edin_admin_2',
+                       'covv_host', 'covv_lineage', 'covv_clade',
+                       'country', 'adm1', 'lineage', 'uk_lineage']
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+        import pyarrow.feather
+    except ImportError:
+        sys.exit('Reading or writing Parquet/Feather metadata needs pyarrow: pip install pyarrow')
+    return(pyarrow)
+
+
+def get_format(file):
+    """
+    'parquet', 'feather' or None (for csv / tsv)
+    """
+    lower = file.lower()
+    if lower.endswith(parquet_extensions):
+        return('parquet')
+    if lower.endswith(feather_extensions):
+        return('feather')
+    return(None)
+
+
+def is_columnar(file):
+    return(get_format(file) is not None)
+
+
+def typed_metadata_dataframe(df):
+    """
+    give the columns of a dataframe of strings their real types, where
+    that can be done without changing any value
+    """
+    df = df.copy()
+    for column in df.columns:
+        values = df[column]
+        if values.dtype != object and not pd.api.types.is_string_dtype(values):
+            continue
+
+        strings = values.fillna('').astype(str)
+        not_empty = strings != ''
+
+        if column in integer_columns:
+            if strings[not_empty].str.fullmatch(r'-?\d+').all():
+                df[column] = pd.array([int(x) if x != '' else None for x in strings], dtype = 'Int32')
+
+        elif column in date_columns:
+            dates = pd.to_datetime(strings, format = '%Y-%m-%d', errors = 'coerce')
+            full_dates = strings[not_empty].str.fullmatch(r'\d{4}-\d{2}-\d{2}').all()
+            if full_dates and not dates[not_empty].isna().any():
+                df[column] = [x.date() if not pd.isna(x) else None for x in dates]
+
+        elif column in categorical_columns:
+            df[column] = strings.astype('category')
+
+    return(df)
+
+
+def string_metadata_dataframe(df):
+    """
+    the reverse of typed_metadata_dataframe: every column as strings,
+    with '' for missing values (as if it had been read from a csv)
+    """
+    df = df.copy()
+    for column in df.columns:
+        df[column] = [value_to_string(x) for x in df[column].astype(object)]
+    return(df)
+
+
+def value_to_string(value):
+    if pd.isna(value):
+        return('')
+    return(str(value))
+
+
+def write_metadata_table(df, file):
+    """
+    write a dataframe to a Parquet or Feather file, typing its columns
+    """
+    import_pyarrow()
+    import pyarrow
+    import pyarrow.parquet
+    import pyarrow.feather
+
+    table = pyarrow.Table.from_pandas(typed_metadata_dataframe(df), preserve_index = False)
+
+    if get_format(file) == 'parquet':
+        pyarrow.parquet.write_table(table, file)
+    else:
+        pyarrow.feather.write_feather(table, file)
+
+
+def write_metadata_records(file, records_iterable, fields_list):
+    """
+    write record dicts (with string values) to a Parquet or Feather file
+    """
+    df = pd.DataFrame([metadata_values(record, fields_list) for record in records_iterable],
+                      columns = fields_list, dtype = object)
+    write_metadata_table(df, file)
+
+
+def apply_filters(df, filters):
+    """
+    the same filters as read_metadata_table, applied to a dataframe in memory
+    """
+    if not filters:
+        return(df)
+
+    keep = pd.Series(True, index = df.index)
+    for column, op, value in filters:
+        values = df[column]
+        if op in ['=', '==']:
+            keep &= values == value
+        elif op == '!=':
+            keep &= values != value
+        elif op == '<':
+            keep &= values < value
+        elif op == '<=':
+            keep &= values <= value
+        elif op == '>':
+            keep &= values > value
+        elif op == '>=':
+            keep &= values >= value
+        elif op == 'in':
+            keep &= values.isin(value)
+        elif op == 'not in':
+            keep &= ~values.isin(value)
+        else:
+            sys.exit('Unknown filter operation ' + op)
+        keep = keep.fillna(False).astype(bool)
+
+    return(df[keep].reset_index(drop = True))
+
+
+def get_dataset(file):
+    import_pyarrow()
+    import pyarrow.dataset
+
+    if get_format(file) == 'parquet':
+        return(pyarrow.dataset.dataset(file, format = 'parquet'))
+    else:
+        return(pyarrow.dataset.dataset(file, format = 'feather'))
+
+
+def get_filter_expression(filters):
+    import_pyarrow()
+    import pyarrow.parquet
+
+    if not filters:
+        return(None)
+    return(pyarrow.parquet.filters_to_expression(filters))
+
+
+def read_metadata_table(file, columns = None, filters = None, as_strings = False, sep = None):
+    """
+    read a metadata table into a dataframe.
+
+    columns: only read these columns
+    filters: list of (column, op, value) tuples, all of which must be true
+             for a row to be kept (op is one of == != < <= > >= in, not in)
+    as_strings: return every column as strings, as the csv-reading code expects
+
+    columnar files read only the columns that are asked for and skip data
+    that can't pass the filters. csv/tsv files are read in full (as strings),
+    typed to be filtered, and returned as strings
+    """
+    if is_columnar(file):
+        table = get_dataset(file).to_table(columns = columns, filter = get_filter_expression(filters))
+        df = table.to_pandas(integer_object_nulls = True)
+    else:
+        if sep is None:
+            sep = '\t' if file.endswith('tsv') else ','
+        df = pd.read_csv(file, sep = sep, dtype = str, keep_default_na = False)
+        if filters:
+            df = string_metadata_dataframe(apply_filters(typed_metadata_dataframe(df), filters))
+        if columns is not None:
+            df = df[columns]
+
+    if as_strings:
+        df = string_metadata_dataframe(df)
+
+    return(df)
+
+
+def load_metadata_dataframe(file, **read_csv_options):
+    """
+    read a whole metadata table: columnar files with their types,
+    anything else with pd.read_csv(file, **read_csv_options)
+    """
+    if is_columnar(file):
+        return(read_metadata_table(file))
+    return(pd.read_csv(file, **read_csv_options))
+
+
+def save_metadata_dataframe(df, file):
+    """
+    write a whole metadata table: columnar files with types, anything
+    else as csv (as df.to_csv(file, index=False))
+    """
+    if is_columnar(file):
+        write_metadata_table(df, file)
+    else:
+        df.to_csv(file, index = False)
+
+
+def iterate_metadata_table(file, chunk_size, columns = None):
+    """
+    yield dataframes of up to chunk_size rows from a columnar file,
+    with the column types it was written with
+    """
+    for batch in get_dataset(file).to_batches(columns = columns, batch_size = chunk_size):
+        yield batch.to_pandas(integer_object_nulls = True)
+
+
+def metadata_header(file):
+    """
+    the column names of a metadata table
+    """
+    if is_columnar(file):
+        return(get_dataset(file).schema.names)
+    sep = '\t' if file.endswith('tsv') else ','
+    with open(file, 'r') as f:
+        return(next(f).strip().split(sep))
+
+
+def iterate_metadata_records(file, chunk_size = 100000):
+    """
+    yield each row of a columnar file as a dict of strings,
+    the same as a row read from the csv version of the table
+    """
+    for df in iterate_metadata_table(file, chunk_size):
+        for record in string_metadata_dataframe(df).to_dict('records'):
+            yield(record)
+
+
+class columnar_table_writer():
+    """
+    write a Parquet or Feather file one dataframe at a time. Every
+    chunk must have the same columns (and types) as the first one
+    """
+
+    def __init__(self, file):
+        import_pyarrow()
+        self.file = file
+        self.format = get_format(file)
+        self.schema = None
+        self.writer = None
+
+    def write(self, df):
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.ipc
+
+        table = pyarrow.Table.from_pandas(df, preserve_index = False)
+        if self.schema is None:
+            self.schema = table.schema
+            if self.format == 'parquet':
+                self.writer = pyarrow.parquet.ParquetWriter(self.file, self.schema)
+            else:
+                self.writer = pyarrow.ipc.new_file(self.file, self.schema)
+        else:
+            table = table.cast(self.schema)
+
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
@@ -67,12 +67,41 @@ def make_taxon_objects(traits_file):
 
     return taxon_list, acc_list, acc_name_counts, lin_acc_counts, acc_to_tax
 
+def get_claimants(acc_name_counts):
+    """
+    index of old lineage -> [(count, acc), ...] for the deltrans lineages that
+    have it as their most common old lineage, biggest count first
+    """
+    claimants = defaultdict(list)
+
+    for acc, poss_lins in acc_name_counts.items():
+        top_lin, count = poss_lins.most_common(1)[0]
+        claimants[top_lin].append((count, acc))
+
+    for lin in claimants:
+        claimants[lin].sort(key=itemgetter(0), reverse=True)
+
+    return claimants
+
+def most_deserving_other(claimants, lin, acc):
+    """
+    the biggest count of lin among the other deltrans lineages that have it
+    as their most common old lineage (None if there aren't any)
+    """
+    for count, other_acc in claimants[lin][:2]:
+        if other_acc != acc:
+            return count
+
+    return None
+
 def rename_lineages(acc_name_counts, lin_acc_counts):
 
     acc_final_name_dict = defaultdict(list) #this will all go into one, just for testing
 
     new_names = []
 
+    claimants = get_claimants(acc_name_counts)
+
     for acc, poss_lins in acc_name_counts.items():
 
         relevant_lin = next(iter(poss_lins.items()))[0]
@@ -85,48 +114,21 @@ def rename_lineages(acc_name_counts, lin_acc_counts):
         elif len(poss_lins) == 1 and relevant_lin == "":
             acc_final_name_dict[acc].append(relevant_lin)
         else:
-            new_name = None
-
-            for i in range(1, len(poss_lins)+1):
-                more_deserving = False
-                if new_name == None:
-                    other_deserving = {}
+            #if all the names are taken by more deserving deltrans lineages, it's a new lineage
+            new_name = ""
 
-                    query_lin = poss_lins.most_common(i)[i-1][0]
-                    count = poss_lins.most_common(i)[i-1][1]
+            #each old lineage in turn, most common first, until one isn't
+            #the most common old lineage of a bigger part of another deltrans lineage
+            for query_lin, count in poss_lins.most_common():
 
-                    if query_lin == "": #so skip any empty strings here
-                        continue
-
-                    else:
+                if query_lin == "": #so skip any empty strings here
+                    continue
 
-                        for inner_acc, inner_poss_lins in acc_name_counts.items():
+                other_count = most_deserving_other(claimants, query_lin, acc)
 
-                            test_against_other = inner_poss_lins.most_common(1)[0][0]
-
-                            if query_lin == test_against_other and acc != inner_acc:
-
-                                other_deserving[inner_acc] = inner_poss_lins.most_common(1)[0][1]
-
-                        if len(other_deserving) == 0:
-                            new_name = query_lin
-
-                        else:
-                            for other_acc, other_count in other_deserving.items():
-                                if other_count > count:
-                                    more_deserving = True
-                                    count = other_count
-
-
-                        if more_deserving:
-                            continue
-
-                        else:
-                            new_name = query_lin
-
-
-            if new_name == None: #if we loop to the end of the thing and all the names are taken
-                new_name = ""
+                if other_count == None or other_count <= count:
+                    new_name = query_lin
+                    break
 
             acc_final_name_dict[acc].append(new_name)
 
@@ -146,14 +148,16 @@ def deal_with_issues(acc_final_name_dict, new_names, lin_acc_counts, acc_name_co
 
     problem_lin={}
     for lin in problem_lins:
-        # print(lin)
         problem_lin[lin] = []
-        for a,l in acc_final_name_dict.items():
-            if lin == l[0]:
-                problem_lin[lin].append((a, lin_acc_counts[lin][a]))
+
+    for a,l in acc_final_name_dict.items():
+        if l[0] in problem_lin:
+            problem_lin[l[0]].append((a, lin_acc_counts[l[0]][a]))
 
     # print(problem_lin)
 
+    taken_names = set(new_names)
+
     for uk_lineage, list_of_tuples in problem_lin.items():
         print(uk_lineage)
         winner = max(list_of_tuples, key=itemgetter(1))[0]
@@ -168,7 +172,7 @@ def deal_with_issues(acc_final_name_dict, new_names, lin_acc_counts, acc_name_co
                 for other_option in acc_name_counts[contender]:
                     print(contender)
                     print("other option=" + other_option)
-                    if other_option != "" and other_option not in new_names:
+                    if other_option != "" and other_option not in taken_names:
                         # NB: if the second
                         # highest option is already designated to a deltrans lineage,
                         # there is no further test for which deltrans_lineage should be given
@@ -186,6 +190,18 @@ def deal_with_issues(acc_final_name_dict, new_names, lin_acc_counts, acc_name_co
 
     return acc_final_name_dict
 
+def free_names(used_names):
+    """
+    numbers for new lineage names, in order: the gaps in the numbers
+    already used first, then the numbers after them
+    """
+    used = set(used_names)
+    i = 1
+    while True:
+        if i not in used:
+            yield i
+        i += 1
+
 def name_new_lineages(acc_final_name_dict):
 
     used_names = []
@@ -196,28 +212,13 @@ def name_new_lineages(acc_final_name_dict):
     sorted_names = (sorted(used_names))
     test_counter = Counter(sorted_names)
 
-    full_list = []
-    usable_names = []
-
-    for i in range(1,len(used_names)+1):
-        full_list.append(i)
-
-    for i in full_list:
-        if i not in used_names:
-            usable_names.append(i)
+    usable_names = free_names(used_names)
 
     acc_final = {}
 
     for acc, lin in acc_final_name_dict.items():
         if lin[0] == "":
-            if len(usable_names) > 0:
-                new_name_prep = usable_names[0]
-                usable_names.remove(new_name_prep)
-            else:
-                new_name_prep = len(full_list) + 1
-                full_list.append(new_name_prep)
-
-            new_name = "UK" + str(new_name_prep)
+            new_name = "UK" + str(next(usable_names))
             acc_final[acc] = new_name
         else:
             acc_final[acc] = lin[0]
@@ -265,13 +266,84 @@ def write_to_file(acc_to_tax, acc_final, outfile):
     fw.close()
 
 
-def curate_lineages(traits_file, outfile):
+def load_previous_assignments(previous_file):
+    """
+    membership of each uk lineage in a previous output of curate_lineages, as
+    frozenset of taxa -> uk_lineage
+    """
+    lin_to_taxa = defaultdict(set)
+
+    with open(previous_file) as f:
+        next(f)
+        for l in f:
+            toks = l.strip("\n").split(",")
+            if len(toks) < 2 or toks[1] == "":
+                continue
+            lin_to_taxa[toks[1]].add(toks[0])
+
+    return {frozenset(taxa): lin for lin, taxa in lin_to_taxa.items()}
+
+def find_unchanged_lineages(acc_to_tax, previous_membership):
+    """
+    deltrans lineages with exactly the same taxa as a lineage in the previous
+    assignments, as acc -> the uk_lineage they had before
+    """
+    unchanged = {}
+
+    for acc, tax_list in acc_to_tax.items():
+        taxa = frozenset(tax.id for tax in tax_list)
+        if taxa in previous_membership:
+            unchanged[acc] = previous_membership[taxa]
+
+    return unchanged
+
+def remove_unchanged_lineages(acc_name_counts, lin_acc_counts, unchanged):
+    """
+    the counts for just the deltrans lineages that have changed, without the
+    names kept by unchanged lineages (which can't be given to anything else).
+    A changed lineage whose only old lineages were kept by unchanged ones
+    is a new lineage
+    """
+    kept_names = set(unchanged.values())
+
+    changed_acc_name_counts = {}
+    for acc, poss_lins in acc_name_counts.items():
+        if acc in unchanged:
+            continue
+        counts = Counter({lin: count for lin, count in poss_lins.items() if lin not in kept_names})
+        if len(counts) == 0:
+            counts = Counter({"": sum(poss_lins.values())})
+        changed_acc_name_counts[acc] = counts
+
+    changed_lin_acc_counts = {}
+    for lin, acc_counts in lin_acc_counts.items():
+        if lin in kept_names:
+            continue
+        changed_lin_acc_counts[lin] = Counter({acc: count for acc, count in acc_counts.items() if acc not in unchanged})
+
+    return changed_acc_name_counts, changed_lin_acc_counts
+
+def curate_lineages(traits_file, outfile, previous_file = None):
 
     taxon_list, acc_list, acc_name_counts, lin_acc_counts, acc_to_tax = make_taxon_objects(traits_file)
 
-    acc_final_name_dict, new_names = rename_lineages(acc_name_counts, lin_acc_counts)
+    unchanged = {}
+    if previous_file:
+        unchanged = find_unchanged_lineages(acc_to_tax, load_previous_assignments(previous_file))
+        sys.stderr.write(str(len(unchanged)) + " of " + str(len(acc_to_tax)) + " deltrans lineages are unchanged since " + previous_file + "\n")
+
+    changed_acc_name_counts, changed_lin_acc_counts = remove_unchanged_lineages(acc_name_counts, lin_acc_counts, unchanged)
+
+    changed_final_name_dict, new_names = rename_lineages(changed_acc_name_counts, changed_lin_acc_counts)
 
-    acc_final_name_dict = deal_with_issues(acc_final_name_dict, new_names, lin_acc_counts, acc_name_counts)
+    changed_final_name_dict = deal_with_issues(changed_final_name_dict, new_names, changed_lin_acc_counts, changed_acc_name_counts)
+
+    acc_final_name_dict = {}
+    for acc in acc_name_counts:
+        if acc in unchanged:
+            acc_final_name_dict[acc] = [unchanged[acc]]
+        else:
+            acc_final_name_dict[acc] = changed_final_name_dict[acc]
 
     acc_final, test_counter = name_new_lineages(acc_final_name_dict)
 
@@ -1,6 +1,9 @@
 from Bio import SeqIO
+import numpy as np
 import os, sys
 
+from datafunk.batches import iterate_fasta_batches, map_batches
+
 """
 The reference sequence, for genotyping:
 """
@@ -16,21 +19,48 @@ def parse_del_file(file):
 
     l is a list of length-2 tuples with the format (position, length)
 
-    it has the same number of entries as lines in file
+    it has the same number of entries as lines in file. Any columns after
+    the first two, and a header line (like in the table written by
+    find_deletions), are ignored
     """
 
     ls = []
 
     with open(file, 'r') as f:
+        First = True
         for line in f:
             l = line.rstrip().split(',')
-            pos, length = l
+            pos, length = l[0], l[1]
+
+            if First and not pos.strip().isdigit():
+                First = False
+                continue
+            First = False
 
             ls = ls + [(int(pos), int(length))]
 
     return(ls)
 
 
+def get_deletion_genotype(seq, pos, length, reference = None):
+    """
+    genotype of an (upper case) aligned sequence for the deletion of length
+    bases at pos (1-based): 'del', 'ref' or 'X', and the nucleotide to
+    append for it as a SNP
+    """
+    if reference is None:
+        reference = str(WuhanHu1.seq).upper()
+
+    REF_allele = reference[pos - 1: pos - 1 + length]
+
+    if seq[pos - 1: pos - 1 + length] == '-' * length:
+        return('C', 'del')
+    elif seq[pos - 1: pos - 1 + length] == REF_allele:
+        return('A', 'ref')
+    else:
+        return('N', 'X')
+
+
 def del_finder(fasta_in, fasta_out, del_file, genotypes_file, append_snp = False):
     """
     For every record in the query fasta file, for every deletion defined in del_file,
@@ -47,6 +77,8 @@ def del_finder(fasta_in, fasta_out, del_file, genotypes_file, append_snp = False
 
     g_out.write("sequence_name," + ",".join(["del_" + str(x[0]) + "_" + str(x[1]) for x in dels]) + '\n')
 
+    reference = str(WuhanHu1.seq).upper()
+
     input = SeqIO.parse(fasta_in, 'fasta')
 
     for record in input:
@@ -62,17 +94,7 @@ def del_finder(fasta_in, fasta_out, del_file, genotypes_file, append_snp = False
             pos = entry[0]
             length = entry[1]
 
-            REF_allele = str(WuhanHu1.seq).upper()[pos - 1: pos - 1 + length]
-
-            if seq[pos - 1: pos - 1 + length] == '-' * length:
-                nuc = 'C'
-                genotype = 'del'
-            elif seq[pos - 1: pos - 1 + length] == REF_allele:
-                nuc = 'A'
-                genotype = 'ref'
-            else:
-                nuc = 'N'
-                genotype = 'X'
+            nuc, genotype = get_deletion_genotype(seq, pos, length, reference)
 
             if append_snp:
                 seq = seq + nuc
@@ -89,3 +111,79 @@ def del_finder(fasta_in, fasta_out, del_file, genotypes_file, append_snp = False
         f_out.close()
 
     g_out.close()
+
+
+def get_gap_runs(seqs, length):
+    """
+    every run of gaps in a list of aligned sequences (all of this length), as arrays of
+    (row, 1-based start, length). Runs at the start or end of a sequence aren't
+    deletions (it's missing sequence), so they are left out
+    """
+    matrix = np.frombuffer(''.join(seqs).encode('ascii', 'replace'), dtype = np.uint8).reshape(len(seqs), length)
+    gaps = (matrix == ord('-')).astype(np.int8)
+
+    # the edges of each run, with a column of no gaps at either end so every run has both
+    padded = np.zeros((len(seqs), length + 2), dtype = np.int8)
+    padded[:, 1:-1] = gaps
+    edges = np.diff(padded, axis = 1)
+
+    # (np.nonzero goes along each row in turn, so the starts and ends pair up)
+    rows, starts = np.nonzero(edges == 1)
+    ends = np.nonzero(edges == -1)[1]
+
+    internal = (starts > 0) & (ends < length)
+
+    return(rows[internal], starts[internal] + 1, ends[internal] - starts[internal])
+
+
+def find_batch_deletions(batch):
+    """
+    batch is (list of (ID, sequence), number of examples to keep). Returns the number of
+    sequences and {(start, length): [count, example IDs]} for the deletions in it
+    """
+    batch, examples = batch
+    IDs = [x[0] for x in batch]
+    seqs = [x[1] for x in batch]
+    rows, starts, lengths = get_gap_runs(seqs, len(WuhanHu1.seq))
+
+    found = {}
+    for row, start, length in zip(rows.tolist(), starts.tolist(), lengths.tolist()):
+        key = (start, length)
+        if key not in found:
+            found[key] = [0, []]
+        found[key][0] += 1
+        if len(found[key][1]) < examples:
+            found[key][1].append(IDs[row])
+
+    return(len(IDs), found)
+
+
+def find_deletions(fasta_in, table_out, min_count = 1, examples = 3, threads = 1, batch_size = 1000):
+    """
+    For every record in the query fasta file, find every run of gaps against
+    Wuhan-Hu-1, and write how many records have each (start, length) (and what
+    fraction of the records that is), with some example records, most common first. The table can be used as the deletions
+    file for del_finder
+    """
+    batches = ((batch, examples) for batch in iterate_fasta_batches(fasta_in, len(WuhanHu1.seq), batch_size))
+
+    deletions = {}
+    total = 0
+    for n, found in map_batches(find_batch_deletions, batches, threads):
+        total += n
+        for key, (count, IDs) in found.items():
+            if key not in deletions:
+                deletions[key] = [0, []]
+            deletions[key][0] += count
+            deletions[key][1].extend(IDs[:examples - len(deletions[key][1])])
+
+    t_out = open(table_out, 'w')
+    t_out.write("start,length,count,frequency,examples\n")
+
+    for key in sorted(deletions, key = lambda x: (-deletions[x][0], x)):
+        count, IDs = deletions[key]
+        if count < min_count:
+            continue
+        t_out.write(str(key[0]) + "," + str(key[1]) + "," + str(count) + "," + str(round(count / total, 6)) + "," + ";".join(IDs) + "\n")
+
+    t_out.close()
@@ -0,0 +1,84 @@
+"""
+persistent cache of distances to a reference sequence, for distance_to_root.
+
+most of the sequences in an alignment are the same from one day to the next,
+so each distance is kept in an sqlite database keyed by a hash of the sequence
+and the ID of the reference it was measured against (the reference's name and
+a hash of its sequence, so that changing the reference doesn't reuse old
+distances). Only sequences that aren't in the cache need comparing again
+"""
+
+import hashlib
+import sqlite3
+import threading
+
+
+def sequence_hash(seq):
+    return(hashlib.sha1(str(seq).encode('utf-8')).hexdigest())
+
+
+def reference_id(record):
+    """
+    the ID of a reference SeqRecord
+    """
+    return(record.id + ':' + sequence_hash(record.seq))
+
+
+class distance_cache():
+    """
+    distances by sequence hash, for one reference. New distances are
+    written to the database a chunk at a time, and when it is closed.
+
+    it can be used from more than one thread (a multiprocessing pool reads
+    its tasks in a thread of its own), one at a time
+    """
+
+    def __init__(self, file, reference, chunk_size = 10000):
+        self.file = file
+        self.reference = reference
+        self.chunk_size = chunk_size
+        self.new = []
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(file, check_same_thread = False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS distances '
+                                '(sequence_hash TEXT NOT NULL, reference TEXT NOT NULL, distance REAL NOT NULL, '
+                                'PRIMARY KEY (sequence_hash, reference))')
+        self.connection.commit()
+
+    def get(self, hash):
+        """
+        the cached distance for a sequence hash, or None
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT distance FROM distances WHERE sequence_hash = ? AND reference = ?',
+                                          (hash, self.reference)).fetchone()
+        if row is None:
+            self.misses += 1
+            return(None)
+        self.hits += 1
+        return(row[0])
+
+    def add(self, hash, distance):
+        self.new.append((hash, self.reference, float(distance)))
+        if len(self.new) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.new) > 0:
+            with self.lock:
+                self.connection.executemany('INSERT OR REPLACE INTO distances VALUES (?, ?, ?)', self.new)
+                self.connection.commit()
+            self.new = []
+
+    def __len__(self):
+        with self.lock:
+            return(self.connection.execute('SELECT COUNT(*) FROM distances WHERE reference = ?',
+                                           (self.reference,)).fetchone()[0])
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.connection.close()
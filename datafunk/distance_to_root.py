@@ -1,28 +1,63 @@
 from Bio import SeqIO
 import numpy as np
+from array import array
 import sys, os
 
+from datafunk.columnar import is_columnar, get_dataset, read_metadata_table
+from datafunk.distance_cache import distance_cache, sequence_hash, reference_id
+from datafunk.batches import iterate_fasta_batches, map_batches
+
 
 WH04_align = SeqIO.read(os.path.dirname(os.path.realpath(__file__)) + '/resources/WH04_aligned.fa', 'fasta')
 
+"""lookup table from a byte of sequence to a nucleotide code: 1-4 for
+ACGT (in either case), 0 for anything that can't be compared
+"""
+nucleotide_codes = np.zeros(256, dtype = np.uint8)
+for i, base in enumerate('ACGT'):
+    nucleotide_codes[ord(base)] = i + 1
+    nucleotide_codes[ord(base.lower())] = i + 1
+
 
 def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
 
+def encode_sequence(seq):
+    """
+    a sequence as an array of nucleotide codes
+    """
+    return(nucleotide_codes[np.frombuffer(str(seq).encode('ascii', 'replace'), dtype = np.uint8)])
+
+
+def encode_sequences(seqs, length):
+    """
+    sequences (all of this length) as a matrix of nucleotide codes, one row per sequence
+    """
+    matrix = np.frombuffer(''.join(seqs).encode('ascii', 'replace'), dtype = np.uint8).reshape(len(seqs), length)
+    return(nucleotide_codes[matrix])
+
+
+WH04_codes = encode_sequence(WH04_align.seq)
+
+
+def get_pairwise_differences(reference, sequences):
+    """
+    reference is an encoded sequence and sequences is a matrix of encoded sequences.
+    Returns arrays of the number of sites where both are ACGT (comparisons),
+    and of those, the number that differ (differences), for each row
+    """
+    valid = (sequences != 0) & (reference != 0)
+    comparisons = np.count_nonzero(valid, axis = 1)
+    differences = np.count_nonzero(valid & (sequences != reference), axis = 1)
+    return(comparisons, differences)
+
+
 def get_pairwise_difference(seq1, seq2):
     if len(seq1) != len(seq2):
         sys.exit('unequal sequence lengths')
-    total=0
-    diff=0
-    for i in range(len(seq1)):
-        a = seq1[i].upper()
-        b = seq2[i].upper()
-        if a in ['A', 'C', 'G', 'T'] and b in ['A', 'C', 'G', 'T']:
-            total +=1
-            if a != b:
-                diff+=1
-    return(total, diff, len(seq1))
+    comparisons, differences = get_pairwise_differences(encode_sequence(seq1), encode_sequence(seq2)[np.newaxis, :])
+    return(int(comparisons[0]), int(differences[0]), len(seq1))
 
 
 def distance_per_genome(distance_info):
@@ -41,7 +76,90 @@ def distance_per_genome(distance_info):
     return(distance_per_genome)
 
 
-def read_metadata(file, sep = ','):
+def distances_per_genome(comparisons, differences, genome_length):
+    """
+    distance_per_genome for arrays of comparisons and differences
+    """
+    distances = np.zeros(len(differences))
+    nonzero = differences != 0
+    distances[nonzero] = differences[nonzero] / comparisons[nonzero] * genome_length
+    return(distances)
+
+
+def get_batch_distances(batch):
+    """
+    batch is (ids, sequences, hashes, distances), the sequences all the same length
+    as WH04. A distance that is already known (from the cache) isn't None, and its
+    sequence is None. Returns (ids, hashes, distances, which distances are new)
+    """
+    ids, seqs, hashes, distances = batch
+    new = [x is None for x in distances]
+
+    todo = [i for i in range(len(ids)) if new[i]]
+    if len(todo) > 0:
+        comparisons, differences = get_pairwise_differences(WH04_codes, encode_sequences([seqs[i] for i in todo], len(WH04_codes)))
+        for i, distance in zip(todo, distances_per_genome(comparisons, differences, len(WH04_codes))):
+            distances[i] = distance
+
+    return(ids, hashes, distances, new)
+
+
+def iterate_batches(fasta_file, metadata, metadata_file, batch_size, cache = None):
+    """
+    batches of batch_size sequences at a time from fasta_file that are in
+    metadata (for get_batch_distances). Warns about the ones that aren't.
+    With a cache, sequences whose distance is in it aren't passed on
+    """
+    def in_metadata(id):
+        if id not in metadata:
+            eprint(id + ' not found in ' + metadata_file)
+            return(False)
+        return(True)
+
+    for batch in iterate_fasta_batches(fasta_file, len(WH04_codes), batch_size, keep = in_metadata):
+        ids = [x[0] for x in batch]
+        seqs = [x[1] for x in batch]
+        hashes = [None] * len(batch)
+        distances = [None] * len(batch)
+
+        if cache is not None:
+            for i, seq in enumerate(seqs):
+                hashes[i] = sequence_hash(seq)
+                distances[i] = cache.get(hashes[i])
+                if distances[i] is not None:
+                    seqs[i] = None
+
+        yield((ids, seqs, hashes, distances))
+
+
+def get_distances(fasta_file, metadata, metadata_file, threads = 1, batch_size = 1000, cache = None):
+    """
+    yield (id, distance to WH04) for every sequence in fasta_file that is in metadata.
+    Batches of sequences are compared in threads processes. With a distance_cache,
+    only sequences that aren't in it are compared, and their distances are added to it
+    """
+    batches = iterate_batches(fasta_file, metadata, metadata_file, batch_size, cache)
+
+    for ids, hashes, distances, new in map_batches(get_batch_distances, batches, threads,
+                                                   length_error = 'unequal sequence lengths'):
+        for id, hash, distance, is_new in zip(ids, hashes, distances, new):
+            if cache is not None and is_new:
+                cache.add(hash, distance)
+            # (an int 0 like distance_per_genome, so it's written the same way)
+            yield((id, float(distance) if distance != 0 else 0))
+
+
+required_columns = ['edin_omitted', 'subsample_omit', 'sequence_name', 'edin_epi_week']
+
+"""what a grouping column is called in the output, if not its own name
+"""
+group_labels = {'edin_epi_week': 'epi_week'}
+
+
+def read_metadata(file, sep = ',', group_by = []):
+    if is_columnar(file):
+        return(read_columnar_metadata(file, group_by))
+
     metadata = {}
     with open(file, 'r') as f:
         First = True
@@ -49,7 +167,7 @@ def read_metadata(file, sep = ','):
             l = line.rstrip().split(sep)
             if First:
                 header = l
-                if not all(x in l for x in ['edin_omitted', 'subsample_omit', 'sequence_name', 'edin_epi_week']):
+                if not all(x in l for x in required_columns + group_by):
                     sys.exit('required columns not found in metadata')
                 First = False
                 continue
@@ -68,94 +186,171 @@ def read_metadata(file, sep = ','):
     return(metadata)
 
 
-def get_epi_week_distance_stats(metadata):
-    epi_weeks = {}
-    for key in metadata:
-        entry = metadata[key]
-        try:
-            epi_week = str(int(float(entry['edin_epi_week'])))
-            distance = entry['distance']
-        except:
-            continue
-
-        if epi_week not in epi_weeks:
-            epi_weeks[epi_week] = {'distance': [distance]}
-        else:
-            epi_weeks[epi_week]['distance'] = epi_weeks[epi_week]['distance'] + [distance]
-
-    for key in epi_weeks:
-        mean = np.mean(epi_weeks[key]['distance'])
-        std = np.std(epi_weeks[key]['distance'])
-
-        epi_weeks[key]['mean'] = mean
-        epi_weeks[key]['std'] = std
+def read_columnar_metadata(file, group_by = []):
+    """
+    as read_metadata, but only reads the columns that are needed
+    from a Parquet/Feather metadata table
+    """
+    columns = required_columns + [x for x in group_by if x not in required_columns]
+    if not all(x in get_dataset(file).schema.names for x in columns):
+        sys.exit('required columns not found in metadata')
 
-    return(epi_weeks)
+    df = read_metadata_table(file, columns = columns, as_strings = True)
 
+    metadata = {}
+    for d in df.to_dict('records'):
+        if d['edin_omitted'] == 'True':
+            continue
+        if d['subsample_omit'] == 'True':
+            continue
+        seq_name = d['sequence_name']
+        if seq_name in metadata:
+            eprint('duplicate entry in ' + file + ', ignoring ' + seq_name)
+            del metadata[seq_name]
+            continue
+        metadata[seq_name] = d
 
-def distance_to_root(fasta_file, metadata_file):
-    metadata = read_metadata(metadata_file)
-    fasta = SeqIO.parse(fasta_file, 'fasta')
+    return(metadata)
 
-    for record in fasta:
-        id = record.id
-        if id not in metadata:
-            eprint(id + ' not found in ' + metadata_file)
-            continue
 
-        metadata_line = metadata[id]
+class running_stats():
+    """
+    mean and (population) standard deviation of some distances, updated
+    one distance at a time with Welford's algorithm
+    """
 
-        seq = record.seq
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
 
-        distance_info = get_pairwise_difference(WH04_align.seq, seq)
-        distance = distance_per_genome(distance_info)
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
 
-        metadata[id]['distance'] = distance
+    def get_mean(self):
+        return(np.float64(self.mean))
 
+    def get_std(self):
+        return(np.sqrt(np.float64(self.m2 / self.n)))
 
-    stats = get_epi_week_distance_stats(metadata)
 
-    fasta = SeqIO.parse(fasta_file, 'fasta')
-    out = open('distances.tsv', 'w')
-    out.write('sequence_name\tepi_week\tepi_week_mean_distance\tepi_week_stdev_distance\tsample_distance\tdistance_stdevs\n')
-    for record in fasta:
-        id = record.id
-        if id not in metadata:
+def get_group(entry, group_by):
+    """
+    the group a sample is in: a tuple of its values of the group_by columns, or
+    None if it doesn't have one of them (epi weeks have to be numbers)
+    """
+    group = []
+    for column in group_by:
+        value = entry[column]
+        if column == 'edin_epi_week':
+            try:
+                value = str(int(float(value)))
+            except:
+                return(None)
+        elif value == '':
+            return(None)
+        group.append(value)
+    return(tuple(group))
+
+
+def get_group_distance_stats(metadata, group_by):
+    """
+    running_stats of the distances in metadata for each group
+    """
+    stats = {}
+    for key in metadata:
+        entry = metadata[key]
+        if 'distance' not in entry:
             continue
-
-        metadata_line = metadata[id]
-        try:
-            epi_week = str(int(float(metadata_line['edin_epi_week'])))
-            dist = metadata[id]['distance']
-        except:
+        group = get_group(entry, group_by)
+        if group is None:
             continue
+        if group not in stats:
+            stats[group] = running_stats()
+        stats[group].add(entry['distance'])
 
-        epi_week_mean_dist = stats[epi_week]['mean']
-        epi_week_std_dist = stats[epi_week]['std']
+    return(stats)
 
-        distance_std_units = (dist - epi_week_mean_dist) / epi_week_std_dist
 
-        out.write(record.id + '\t' + epi_week + '\t' + str(round(epi_week_mean_dist, 4)) + '\t' + str(round(epi_week_std_dist, 4)) + '\t' + str(round(dist, 4)) + '\t' + str(round(distance_std_units, 4)) + '\n')
+def get_epi_week_distance_stats(metadata):
+    stats = get_group_distance_stats(metadata, ['edin_epi_week'])
+    return({group[0]: {'mean': x.get_mean(), 'std': x.get_std()} for group, x in stats.items()})
 
-    out.close()
 
-    pass
+def format_distance(distance):
+    # (no differences is written as 0, not 0.0)
+    if distance == 0:
+        return('0')
+    return(str(round(distance, 4)))
 
 
+def write_distances(output, ids, distances, groups, stats, group_by):
+    labels = [group_labels.get(x, x) for x in group_by]
+    prefix = '_'.join(labels)
 
+    out = open(output, 'w')
+    out.write('\t'.join(['sequence_name'] + labels + [prefix + '_mean_distance', prefix + '_stdev_distance', 'sample_distance', 'distance_stdevs']) + '\n')
 
+    for id, dist, group in zip(ids, distances, groups):
+        if group is None:
+            continue
 
+        group_mean_dist = stats[group].get_mean()
+        group_std_dist = stats[group].get_std()
 
+        distance_std_units = (dist - group_mean_dist) / group_std_dist
 
+        out.write('\t'.join([id] + list(group) + [str(round(group_mean_dist, 4)), str(round(group_std_dist, 4)), format_distance(dist), str(round(distance_std_units, 4))]) + '\n')
 
+    out.close()
 
 
+def distance_to_root(fasta_file, metadata_file, threads = 1, batch_size = 1000, group_by = None, cache_file = None):
+    """
+    distance to WH04 of every sample in fasta_file and metadata_file, and how many
+    standard deviations it is from the mean distance of its group (the samples
+    with the same values of the group_by columns, by default the same epi week).
+    The stats of each group are kept up to date as the distances are worked out,
+    and the distances are kept in an array, so the fasta file is only read once.
+    With a cache_file, distances of sequences seen in an earlier run are read
+    from it instead of being worked out again
+    """
+    if not group_by:
+        group_by = ['edin_epi_week']
 
+    metadata = read_metadata(metadata_file, group_by = group_by)
 
+    cache = None
+    if cache_file:
+        cache = distance_cache(cache_file, reference_id(WH04_align))
 
+    ids = []
+    distances = array('d')
+    groups = []
+    stats = {}
 
+    for id, distance in get_distances(fasta_file, metadata, metadata_file, threads, batch_size, cache):
+        if 'distance' in metadata[id]:
+            eprint('duplicate entry in ' + fasta_file + ', ignoring ' + id)
+            continue
+        metadata[id]['distance'] = distance
 
+        group = get_group(metadata[id], group_by)
+        ids.append(id)
+        distances.append(distance)
+        groups.append(group)
 
+        if group is None:
+            continue
+        if group not in stats:
+            stats[group] = running_stats()
+        stats[group].add(distance)
 
+    if cache is not None:
+        eprint(str(cache.hits) + ' distances read from ' + cache_file + ', ' + str(cache.misses) + ' worked out')
+        cache.close()
 
-    #
+    write_distances('distances.tsv', ids, np.frombuffer(distances), groups, stats, group_by)
@@ -0,0 +1,155 @@
+"""
+edin_flag as an integer bitmask.
+
+each flag name in the registry has its own bit. While records are being
+processed their edin_flag is an edin_flag_mask (an int), so testing a flag is a
+single &, rather than searching a string. It is turned back into the
+colon-joined text (eg. 'check_country:uk_sequence') when the record is written.
+
+the mask also keeps the text it was read from, and a flag that is set is
+appended to that text (as it was before there were masks), so a record's
+edin_flag is written out the way it was read in, plus the flags set since, in
+the order they were set. Names that aren't in the registry (eg. in an old
+metadata file, or set by an added stage) are registered when they are first seen
+"""
+
+import pandas as pd
+
+
+"""built-in flags, in the order they're set when a record is processed:
+"""
+default_flag_names = ['check_country', 'check_date', 'omitted_date',
+                      'omitted_file', 'uk_sequence', 'subsample_omit']
+
+_flag_names = []
+_flag_bits = {}
+
+
+def register_flag(name):
+    """
+    add a flag name to the registry (if it isn't there already)
+    and return its bit
+    """
+    if name not in _flag_bits:
+        _flag_bits[name] = 1 << len(_flag_names)
+        _flag_names.append(name)
+    return(_flag_bits[name])
+
+
+for name in default_flag_names:
+    register_flag(name)
+
+
+def flag_bit(name):
+    return(register_flag(name))
+
+
+class edin_flag_mask(int):
+    """
+    a bitmask of flags which also keeps their text, so that it is written out
+    the same as it was read in (in the same order, even with repeats), with
+    any flags set since appended to it
+    """
+
+    def __new__(cls, flags = 0, text = None):
+        mask = int.__new__(cls, flags)
+        mask.text = text
+        return(mask)
+
+    def add(self, name):
+        """
+        this mask with the flag called name set as well
+        """
+        bit = register_flag(name)
+        if self & bit:
+            return(self)
+        return(edin_flag_mask(self | bit, name if self.text == '' else str(self) + ':' + name))
+
+    def __str__(self):
+        if self.text is None:
+            return(flags_to_string(int(self)))
+        return(self.text)
+
+
+def flags_from_string(text):
+    """
+    'check_country:uk_sequence' -> bitmask
+    """
+    flags = 0
+    for name in text.split(':'):
+        if name != '':
+            flags |= register_flag(name)
+    return(flags)
+
+
+def flags_to_string(flags):
+    """
+    bitmask -> 'check_country:uk_sequence' (in the order
+    the flags are in the registry)
+    """
+    names = []
+    i = 0
+    while flags:
+        if flags & 1:
+            names.append(_flag_names[i])
+        flags >>= 1
+        i += 1
+    return(':'.join(names))
+
+
+def get_flags(value):
+    """
+    a record's edin_flag as an edin_flag_mask, whether it is one already,
+    a plain int, or still text (as read from a csv, or set by an added stage)
+    """
+    if isinstance(value, edin_flag_mask):
+        return(value)
+    if isinstance(value, int):
+        return(edin_flag_mask(value))
+    return(edin_flag_mask(flags_from_string(value), value))
+
+
+def add_edin_flag(record, name):
+    """
+    set the flag called name on a record
+    """
+    record['edin_flag'] = get_flags(record['edin_flag']).add(name)
+    return(record)
+
+
+def has_edin_flag(record, name):
+    return(get_flags(record['edin_flag']) & register_flag(name) != 0)
+
+
+def edin_flag_to_string(value):
+    if isinstance(value, edin_flag_mask):
+        return(str(value))
+    if isinstance(value, int):
+        return(flags_to_string(value))
+    return(value)
+
+
+def metadata_values(record, fields_list):
+    """
+    the values of fields_list in a record as strings for writing,
+    with edin_flag turned back into text
+    """
+    return([edin_flag_to_string(record[x]) if x == 'edin_flag' else record[x] for x in fields_list])
+
+
+def flags_column_to_masks(values):
+    """
+    a column of edin_flag text (eg. from a metadata table) as an
+    integer column of bitmasks. Each distinct string is only parsed once
+    """
+    values = pd.Series(values, dtype = object).fillna('')
+    codes, uniques = pd.factorize(values)
+    masks = [flags_from_string(x) for x in uniques]
+    return(pd.Series([masks[x] for x in codes], index = values.index, dtype = 'int64'))
+
+
+def flags_column_has(values, name):
+    """
+    boolean column: which rows of a column of edin_flag text have the flag called name
+    """
+    return((flags_column_to_masks(values) & register_flag(name)) != 0)
@@ -0,0 +1,120 @@
+"""
+epidemiological calendar shared by the modules that add epi week / epi day
+to metadata.
+
+epi week is the cumulative total of (CDC, Sunday-starting) epidemiological
+weeks since 2019-12-22, which is week 0. epi day is the cumulative total of
+days since 2019-12-22, which is day 1.
+
+a table of date string -> (epi_week, epi_day) is built once for the supported
+range of dates so that each record is a dictionary lookup rather than a
+strptime + epiweeks calculation. Dates outside the table are still converted,
+just more slowly.
+"""
+
+import datetime
+from datetime import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+
+"""this is day 1 of epi-week 0:
+"""
+day_one = datetime.date(2019, 12, 22)
+
+"""last date in the lookup table:
+"""
+last_day = datetime.date(2030, 12, 31)
+
+_calendar = None
+
+
+def build_calendar(start = day_one, end = last_day):
+    """
+    make a dict of 'YYYY-MM-DD' date strings -> (epi_week, epi_day)
+    for every date from start to end inclusive.
+
+    epi_week and epi_day are strings, as written to the metadata
+    """
+    calendar = {}
+    date = start
+    one_day = datetime.timedelta(days = 1)
+    while date <= end:
+        days = (date - day_one).days
+        calendar[str(date)] = (str(days // 7), str(days + 1))
+        date += one_day
+
+    return(calendar)
+
+
+def get_calendar():
+    """
+    the lookup table, built the first time it's needed
+    """
+    global _calendar
+    if _calendar is None:
+        _calendar = build_calendar()
+    return(_calendar)
+
+
+def date_string_to_epi_week_and_day(date_string):
+    """
+    parse a date string in YYYY-MM-DD format and return a tuple of
+    (cumulative epi week, cumulative epi day) as strings.
+
+    returns ("", "") if the string can't be parsed or the date is before 2019-12-22
+    """
+    calendar = get_calendar()
+    if date_string in calendar:
+        return(calendar[date_string])
+
+    try:
+        date = dt.strptime(date_string, '%Y-%m-%d').date()
+    except:
+        return(("", ""))
+
+    days = (date - day_one).days
+    if days < 0:
+        return(("", ""))
+
+    return((str(days // 7), str(days + 1)))
+
+
+def date_string_to_epi_week(date_string):
+    """
+    parse a date string in YYYY-MM-DD format and return
+    cumulative epi week which is cumulative total epidemiological
+    weeks since 2019-12-22. Week beginning 2019-12-22 is week 0
+    """
+    return(date_string_to_epi_week_and_day(date_string)[0])
+
+
+def date_string_to_epi_day(date_string):
+    """
+    parse a date string in YYYY-MM-DD format and return
+    cumulative epi day which is cumulative total days since 2019-12-22
+    """
+    return(date_string_to_epi_week_and_day(date_string)[1])
+
+
+def date_column_to_epi_weeks_and_days(dates):
+    """
+    convert a whole column (pandas Series, or anything pd.Series() will take)
+    of YYYY-MM-DD date strings at once.
+
+    returns two Series of strings (epi_week, epi_day) with the same index
+    as dates, with "" wherever the date couldn't be converted
+    """
+    dates = pd.Series(dates)
+    parsed = pd.to_datetime(dates, format = '%Y-%m-%d', errors = 'coerce')
+    days = (parsed - pd.Timestamp(day_one)).dt.days.to_numpy(dtype = 'float64')
+
+    valid = ~np.isnan(days) & (days >= 0)
+    days = np.where(valid, days, 0).astype('int64')
+
+    epi_weeks = np.where(valid, (days // 7).astype(str), "")
+    epi_days = np.where(valid, (days + 1).astype(str), "")
+
+    return(pd.Series(epi_weeks, index = dates.index, dtype = object),
+           pd.Series(epi_days, index = dates.index, dtype = object))
@@ -0,0 +1,118 @@
+"""
+read records out of a GISAID json dump by covv_accession_id or covv_virus_name,
+using the index made by index_gisaid, and write them as json, fasta or
+metadata rows.
+
+fasta and metadata records are made the same way process_gisaid_data makes
+them for new records (but nothing is omitted)
+"""
+
+import sys
+import json
+
+from datafunk.index_gisaid import gisaid_index, eprint
+from datafunk import process_gisaid_data as pgd
+
+
+output_formats = ['json', 'fasta', 'metadata']
+
+
+def read_id_file(file):
+    """
+    one ID per line (blank lines and lines starting with # are ignored)
+    """
+    IDs = []
+    with open(file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            IDs.append(line)
+    return(IDs)
+
+
+def get_requested_accessions(index, accessions, virus_names):
+    """
+    the accessions asked for (directly, or by virus name), in the order they
+    were asked for, without duplicates. Warns about any that aren't in the index
+    """
+    requested = []
+    seen = set()
+
+    for accession in accessions:
+        if accession not in index:
+            eprint(accession + ' is not in ' + index.input_json)
+            continue
+        if accession not in seen:
+            seen.add(accession)
+            requested.append(accession)
+
+    for virus_name in virus_names:
+        matches = index.get_accessions(virus_name)
+        if not matches:
+            eprint(virus_name + ' is not in ' + index.input_json)
+        for accession in matches:
+            if accession not in seen:
+                seen.add(accession)
+                requested.append(accession)
+
+    return(requested)
+
+
+def get_processed_record(json_dict, stages):
+    d = pgd.get_json_record(json_dict)
+    return(pgd.run_stages(d, stages))
+
+
+def fetch_gisaid(input_json,
+                 output = None,
+                 accessions = None,
+                 accession_file = None,
+                 virus_names = None,
+                 virus_name_file = None,
+                 output_format = 'json',
+                 index_file = None):
+
+    if output_format not in output_formats:
+        sys.exit('Unknown output format ' + output_format + ', choose from ' + ', '.join(output_formats))
+
+    accessions = list(accessions) if accessions else []
+    virus_names = list(virus_names) if virus_names else []
+    if accession_file:
+        accessions.extend(read_id_file(accession_file))
+    if virus_name_file:
+        virus_names.extend(read_id_file(virus_name_file))
+
+    index = gisaid_index(input_json, index_file)
+    requested = get_requested_accessions(index, accessions, virus_names)
+
+    if output:
+        out = open(output, 'w')
+    else:
+        out = sys.stdout
+
+    if output_format != 'json':
+        stages = pgd.get_new_record_stages(False, {})
+        fields_list = pgd._fields_edin + pgd.fields + pgd._fields_gisaid
+
+    if output_format == 'metadata':
+        out.write(','.join(fields_list) + '\n')
+
+    index.open()
+    for accession in requested:
+        line = index.get_line(accession)
+
+        if output_format == 'json':
+            out.write(line.decode('utf-8').rstrip('\n') + '\n')
+            continue
+
+        d = get_processed_record(json.loads(line), stages)
+
+        if output_format == 'fasta':
+            out.write('>' + d['edin_header'] + '\n' + d['sequence'] + '\n')
+        else:
+            out.write(pgd.get_one_metadata_line(d, fields_list))
+    index.close()
+
+    if output:
+        out.close()
@@ -0,0 +1,151 @@
+"""
+genotype an alignment (to Wuhan-Hu-1) at a mix of SNPs, deletions and amino
+acid sites (all in Wuhan-Hu-1 coordinates) in one pass over the alignment,
+with the same genotypes that snp_finder, del_finder and AA_finder give:
+
+ - snp: the label of the nucleotide at location (label1 / label2), or "X"
+ - del: "del", "ref" or "X" for the deletion of length bases from location
+ - aa: the amino acid coded for by the codon starting at location, or "X"
+
+the variants file is a csv with a header, one variant per line. Columns that
+a type of variant doesn't use can be left empty:
+
+type,name,location,length,nuc1,label1,nuc2,label2
+snp,D614G_nuc,23403,,A,D,G,G
+del,,1605,3,,,,
+aa,D614G,23402,,,,,
+
+(a deletion without a name is called del_<location>_<length>, like in del_finder)
+
+the output is either wide (one row per sequence, one column per variant) or
+long (one row per sequence per variant)
+"""
+
+import csv
+import sys
+
+from datafunk.batches import iterate_fasta_batches, map_batches
+from datafunk.snp_finder import get_snp_label
+from datafunk.del_finder import WuhanHu1, get_deletion_genotype
+from datafunk.AA_finder import get_AA_genotype
+
+
+variant_types = ['snp', 'del', 'aa']
+output_formats = ['wide', 'long']
+
+_variants = None
+_reference = str(WuhanHu1.seq).upper()
+
+
+class variant():
+
+    def __init__(self, type, name, location, length = None, label_dict = None):
+        self.type = type
+        self.name = name
+        self.location = location
+        self.length = length
+        self.label_dict = label_dict
+
+    def get_genotype(self, seq):
+        """
+        seq is an aligned sequence, in upper case
+        """
+        if self.type == 'snp':
+            return(get_snp_label(seq[self.location - 1], self.label_dict))
+        if self.type == 'del':
+            return(get_deletion_genotype(seq, self.location, self.length, _reference)[1])
+        return(get_AA_genotype(seq, self.location))
+
+
+def parse_variants_file(file):
+    variants = []
+
+    with open(file, 'r', newline = '') as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames is None or not all(x in reader.fieldnames for x in ['type', 'name', 'location']):
+            sys.exit('Error: ' + file + ' needs type, name and location columns')
+
+        for row in reader:
+            type = row['type'].strip().lower()
+            name = row['name'].strip()
+
+            if type not in variant_types:
+                sys.exit('Error: unknown variant type ' + row['type'] + ' in ' + file + ', choose from ' + ', '.join(variant_types))
+
+            try:
+                location = int(row['location'])
+                length = int(row['length']) if type == 'del' else None
+            except (ValueError, TypeError, KeyError):
+                sys.exit('Error: bad location or length for variant ' + name + ' in ' + file)
+
+            if location < 1 or location > len(_reference):
+                sys.exit('Error: location of variant ' + name + ' in ' + file + ' is outside the reference')
+
+            if type == 'del' and name == '':
+                name = 'del_' + str(location) + '_' + str(length)
+
+            if name == '':
+                sys.exit('Error: variant at ' + str(location) + ' in ' + file + ' needs a name')
+
+            if type == 'snp':
+                try:
+                    label_dict = {row['nuc1']: row['label1'],
+                                  row['nuc2']: row['label2']}
+                except KeyError:
+                    sys.exit('Error: snp ' + name + ' in ' + file + ' needs nuc1, label1, nuc2 and label2')
+                variants.append(variant(type, name, location, label_dict = label_dict))
+
+            elif type == 'del':
+                variants.append(variant(type, name, location, length = length))
+
+            else:
+                variants.append(variant(type, name, location))
+
+    return(variants)
+
+
+def set_variants(variants):
+    global _variants
+    _variants = variants
+
+
+def genotype_batch(batch):
+    """
+    batch is a list of (ID, sequence). Returns a list of (ID, genotypes)
+    """
+    genotyped = []
+    for ID, seq in batch:
+        seq = seq.upper()
+        genotyped.append((ID, [x.get_genotype(seq) for x in _variants]))
+    return(genotyped)
+
+
+def genotype(fasta_in, variants_file, genotypes_file, output_format = 'wide', threads = 1, batch_size = 1000):
+    """
+    For every record in fasta_in, genotype every variant in variants_file,
+    and write the genotypes to genotypes_file
+    """
+    if output_format not in output_formats:
+        sys.exit('Unknown output format ' + output_format + ', choose from ' + ', '.join(output_formats))
+
+    variants = parse_variants_file(variants_file)
+
+    batches = iterate_fasta_batches(fasta_in, len(_reference), batch_size)
+    results = map_batches(genotype_batch, batches, threads, initializer = set_variants, initargs = (variants,))
+
+    g_out = open(genotypes_file, 'w')
+
+    if output_format == 'wide':
+        g_out.write("sequence_name," + ",".join([x.name for x in variants]) + '\n')
+    else:
+        g_out.write("sequence_name,variant,type,genotype\n")
+
+    for genotyped in results:
+        for ID, genotypes in genotyped:
+            if output_format == 'wide':
+                g_out.write(ID + "," + ",".join(genotypes) + "\n")
+            else:
+                for x, result in zip(variants, genotypes):
+                    g_out.write(ID + "," + x.name + "," + x.type + "," + result + "\n")
+
+    g_out.close()
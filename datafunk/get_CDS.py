@@ -1,52 +1,59 @@
-from Bio import SeqIO
 from Bio.Seq import Seq
+from Bio.Data.CodonTable import TranslationError
+from Bio.SeqIO.FastaIO import SimpleFastaParser
 # from Bio.Alphabet import generic_dna
+import numpy as np
 
 # import os
 import sys
 
 
-# def parse_gtf(file, attribute_key_value_separator = '='):
-#     sep = attribute_key_value_separator
-#     d = []
-#     with open(file, 'r') as f:
-#         for line in f:
-#             if line[0] == '#':
-#                 continue
-#             l = line.rstrip()
-#             if len(l) == 0:
-#                 continue
-#             l = l.split('\t')
-#
-#             fields = ['seqname', 'source', 'feature', 'start', 'end', 'score', 'strand', 'frame', 'attribute']
-#             values = l[0:8] + [{x[0]:x[1] for x in [(y.split(sep)[0],y.split(sep)[1]) for y in l[8].split(';')]}]
-#
-#             d.append({x: y for x,y in zip(fields, values)})
-#
-#     return(d)
+def parse_gff3(file):
+    """
+    the CDSs in a GFF3 file, as (coordinates, names) in the same form as
+    CDS_coordinates and CDS_names. The lines of a CDS with the same ID (eg
+    either side of a frameshift) are joined, in the order they are in the file.
+    A CDS is named by its gene, Name or ID attribute (the first one it has
+    that no CDS before it is called, eg when ORF1a and ORF1ab are both in
+    the ORF1ab gene), so that every CDS has a name of its own
+    """
+    parts = {}
+    candidates = {}
 
+    with open(file, 'r') as f:
+        for line in f:
+            if line.startswith('##FASTA'):
+                break
+            if line[0] == '#':
+                continue
+            l = line.rstrip('\n').split('\t')
+            if len(l) < 9 or l[2] != 'CDS':
+                continue
 
-# def get_one_feature(seq, start, end):
-#     """
-#     start and end are 1-based inclusive cordinates from a gtf file
-#     """
-#     return(seq[start-1:end])
+            if l[6] == '-':
+                sys.exit('Error: CDSs on the minus strand in ' + file + ' are not supported')
 
+            attributes = dict([x.split('=', 1) for x in l[8].split(';') if '=' in x])
+            ID = attributes.get('ID', str(len(parts)))
 
-# def get_all_CDSs(sequence, gtf_list):
-#     AA_list = []
-#     for entry in gtf_list:
-#         if entry['feature'] == 'CDS':
-#             start = int(entry['start'])
-#             end = int(entry['end'])
-#             s = get_one_feature(seq = sequence, start = start, end = end)
-#             AA = get_AA(seq = s)
-#             AA_list.append(AA)
-#
-#     return(AA_list)
+            if ID not in parts:
+                parts[ID] = []
+                candidates[ID] = [attributes[x] for x in ['gene', 'Name'] if x in attributes] + [ID]
+            parts[ID].append((int(l[3]), int(l[4])))
 
+    if len(parts) == 0:
+        sys.exit('Error: no CDSs in ' + file)
 
+    names = []
+    for ID in parts:
+        free = [x for x in candidates[ID] if x not in names]
+        if len(free) == 0:
+            sys.exit('Error: more than one CDS in ' + file + ' is called ' + candidates[ID][0])
+        names.append(free[0])
 
+    coordinates = [tuple(x) if len(x) > 1 else x[0] for x in parts.values()]
+
+    return(coordinates, names)
 
 
 CDS_coordinates = [((266, 13468), (13468, 21555)),
@@ -60,48 +67,174 @@ CDS_coordinates = [((266, 13468), (13468, 21555)),
                     (28274,	29533),
                     (29558,	29674)]
 
+CDS_names = ['ORF1ab', 'S', 'ORF3a', 'E', 'M', 'ORF6', 'ORF7a', 'ORF8', 'N', 'ORF10']
+
+
+"""codes for the nucleotides a codon can be made of, to translate codons with
+a lookup table. Anything else (in either case) has the code len(codon_nucleotides)
+"""
+codon_nucleotides = 'ACGTRYSWKMBDHVN-'
+
+codon_nucleotide_codes = np.full(256, len(codon_nucleotides), dtype = np.uint8)
+for i, base in enumerate(codon_nucleotides):
+    codon_nucleotide_codes[ord(base)] = i
+    codon_nucleotide_codes[ord(base.lower())] = i
+
+codon_nucleotide_bytes = codon_nucleotide_codes.tobytes()
+
+
+def build_codon_table():
+    """
+    the amino acid (as a byte) for every codon of nucleotide codes, indexed by
+    code1 * n * n + code2 * n + code3 (where n is the number of codes). These are
+    what Biopython's translate() gives, or X for codons it can't translate
+    """
+    letters = list(codon_nucleotides) + ['?']
+    table = np.zeros(len(letters) ** 3, dtype = np.uint8)
+    i = 0
+    for first in letters:
+        for second in letters:
+            for third in letters:
+                try:
+                    AA = str(Seq(first + second + third).translate())
+                except TranslationError:
+                    AA = 'X'
+                table[i] = ord(AA)
+                i += 1
+    return(table)
+
+
+_codon_table = None
+
+def get_codon_table():
+    global _codon_table
+    if _codon_table is None:
+        _codon_table = build_codon_table()
+    return(_codon_table)
+
+
+def get_CDS_columns(coords):
+    """
+    the 0-based alignment columns of a CDS (one pair of 1-based inclusive
+    coordinates, or a tuple of pairs for a CDS with a frameshift)
+    """
+    if isinstance(coords[0], tuple):
+        return(np.concatenate([np.arange(start - 1, end) for start, end in coords]))
+    return(np.arange(coords[0] - 1, coords[1]))
+
+
+def encode_codon_sequences(seqs, length):
+    """
+    sequences (all of this length) as a matrix of codon nucleotide codes, one row per sequence
+    """
+    encoded = ''.join(seqs).encode('ascii', 'replace').translate(codon_nucleotide_bytes)
+    return(np.frombuffer(encoded, dtype = np.uint8).reshape(len(seqs), length))
+
+
+def translate_codes(codes, columns):
+    """
+    codes is a matrix of codon nucleotide codes, one row per sequence, and columns
+    are the columns of the codons to translate (a multiple of three of them). Returns
+    a matrix of amino acids as bytes, one row per sequence
+    """
+    n = len(codon_nucleotides) + 1
+    codons = codes[:, columns].reshape(codes.shape[0], -1, 3)
+    return(get_codon_table()[(codons[:, :, 0].astype(np.uint16) * n + codons[:, :, 1]) * n + codons[:, :, 2]])
+
+
+def iterate_batches(fasta_in, length, batch_size = 1000):
+    """
+    yield lists of (ID, sequence), all the same length as each other (a new
+    batch is started when the length changes). Sequences shorter than length
+    can't have their CDSs taken out
+    """
+    batch = []
+    with open(fasta_in, 'r') as f:
+        for title, seq in SimpleFastaParser(f):
+            ID = title.split(None, 1)[0] if title else ''
+            if len(seq) < length:
+                sys.exit('Error: ' + ID + ' is too short to have all the CDSs in it')
+            if len(batch) == batch_size or (len(batch) > 0 and len(seq) != len(batch[0][1])):
+                yield(batch)
+                batch = []
+            batch.append((ID, seq))
+    if len(batch) > 0:
+        yield(batch)
+
+
+def get_CDS_slices(coords):
+    """
+    the 0-based slices of the alignment a CDS is made of, without its stop codon
+    """
+    if isinstance(coords[0], tuple):
+        slices = [(start - 1, end) for start, end in coords]
+    else:
+        slices = [(coords[0] - 1, coords[1])]
+    slices[-1] = (slices[-1][0], slices[-1][1] - 3)
+    return(slices)
+
+
+def get_batch_CDSs(batch, coordinates, translate = False):
+    """
+    batch is a list of (ID, sequence) of the same length. Returns a list of
+    the sequences of each CDS (nucleotides, or amino acids if translate),
+    one per sequence in the batch
+    """
+    if translate:
+        codes = encode_codon_sequences([x[1] for x in batch], len(batch[0][1]))
+        CDSs = []
+        for coords in coordinates:
+            AAs = translate_codes(codes, get_CDS_columns(coords)[:-3])
+            CDSs.append([x.tobytes().decode('ascii') for x in AAs])
+        return(CDSs)
+
+    CDSs = []
+    for coords in coordinates:
+        slices = get_CDS_slices(coords)
+        CDSs.append([''.join([seq[start:end] for start, end in slices]) for ID, seq in batch])
+    return(CDSs)
+
+
+def get_CDS(fasta_in, fasta_out, translate = False, gene_prefix = None, gff3_file = None, batch_size = 1000):
+    """
+    write the CDSs (without their stop codons) of every record in fasta_in,
+    either all of them one after the other in one record to fasta_out (stdout
+    if fasta_out and gene_prefix are both None), and/or one file per CDS,
+    called gene_prefix + name + '.fasta'. The CDSs are CDS_coordinates, or the
+    ones in gff3_file
+    """
+    if gff3_file:
+        coordinates, names = parse_gff3(gff3_file)
+    else:
+        coordinates, names = CDS_coordinates, CDS_names
 
-def get_CDS(fasta_in, fasta_out, translate = False):
-    # gtf = os.path.dirname(os.path.realpath(__file__)) + '/resources/mn908947.3.gff3'
-    # gtf_info = parse_gtf(gtf)
+    length = max([get_CDS_columns(coords).max() for coords in coordinates]) + 1
 
+    if translate and any([len(get_CDS_columns(coords)) % 3 != 0 for coords in coordinates]):
+        sys.exit('Error: CDS lengths must be multiples of three to translate them')
 
     if fasta_out:
         out = open(fasta_out, 'w')
+    elif gene_prefix:
+        out = None
     else:
         out = sys.stdout
 
-    # # test stuff with reference
-    # ref_aa_file = SeqIO.parse('mn908947.3.aa', 'fasta')
-    # ref_aa = []
-    # for record in ref_aa_file:
-    #     ref_aa.append(str(record.seq))
-    # out.write('>reference\n')
-    # out.write(''.join(ref_aa) + '\n')
-
-
-    fasta = SeqIO.parse(fasta_in, 'fasta')
-
-    for record in fasta:
-        seqs = []
-        for coords in CDS_coordinates:
-            if isinstance(coords[0], tuple):
-                seq = record.seq[coords[0][0] - 1:coords[0][1]] + record.seq[coords[1][0] - 1:coords[1][1]]
-            elif isinstance(coords[0], int):
-                seq = record.seq[coords[0] - 1:coords[1]]
-            seqs.append(seq)
+    gene_outs = []
+    if gene_prefix:
+        gene_outs = [open(gene_prefix + name + '.fasta', 'w') for name in names]
 
-        nostops = [seq[:-3] for seq in seqs]
+    for batch in iterate_batches(fasta_in, length, batch_size):
+        CDSs = get_batch_CDSs(batch, coordinates, translate)
 
-        if translate:
-            out.write(">" + record.id + '\n')
-            out.write(''.join([str(seq.translate()) for seq in nostops]) + '\n')
+        if out:
+            out.write(''.join(['>' + ID + '\n' + ''.join([x[i] for x in CDSs]) + '\n' for i, (ID, seq) in enumerate(batch)]))
 
-        else:
-            out.write(">" + record.id + '\n')
-            out.write(''.join([str(seq) for seq in nostops]) + '\n')
+        for gene_out, CDS in zip(gene_outs, CDSs):
+            gene_out.write(''.join(['>' + ID + '\n' + CDS[i] + '\n' for i, (ID, seq) in enumerate(batch)]))
 
     if fasta_out:
         out.close()
 
-    pass
+    for gene_out in gene_outs:
+        gene_out.close()
@@ -0,0 +1,150 @@
+"""
+normalisation of GISAID json dump records that is shared by
+gisaid_json_2_metadata, process_gisaid_sequence_data, process_gisaid_data
+and ingest_gisaid.
+
+the three older commands each grew their own slightly different copy of these
+functions. The differences are kept as options, and each module's own
+function calls the shared one with the options that give its old behaviour
+"""
+
+import re
+import sys
+from unidecode import unidecode
+
+from datafunk.location_cache import default_location_cache
+from datafunk.edin_flags import add_edin_flag
+from datafunk.omissions import regex_prefix
+
+
+EPI_ISL_regex = re.compile(r'EPI_ISL_\d{6}')
+
+
+def fix_gisaid_json_dict(gisaid_json_dict, to_ascii = True):
+    """
+    Remove commas from fields inside json dict
+
+    And (if to_ascii) remove non-ascii characters
+    """
+    newDict = {}
+    if to_ascii:
+        for x,y in gisaid_json_dict.items():
+            newDict[x] = unidecode(str(y).replace(',', ''))
+    else:
+        for x,y in gisaid_json_dict.items():
+            newDict[x] = str(y).replace(',', '')
+
+    return(newDict)
+
+
+def fix_seq_in_gisaid_json_dict(gisaid_json_dict):
+    """
+    strip whitespace and newline characters from the
+    ['sequence'] field of a gisaid json object
+    """
+
+    def fix_seq(seq):
+        newseq = re.sub(r"\s+", '', seq).replace('\n','')
+        return(newseq)
+
+    newDict = {}
+    for x,y in gisaid_json_dict.items():
+        if x == 'sequence':
+            newDict['sequence'] = fix_seq(y)
+        else:
+            newDict[x] = y
+
+    return(newDict)
+
+
+def get_admin_levels_from_json_dict(gisaid_json_dict, warnings = True, cache = None, underscores = False):
+    """
+    get location strings from the gisaid location field
+    use pycountry (via a cache of already-resolved locations) /
+
+    if underscores, spaces in the admin levels are replaced with '_'
+    """
+    if cache is None:
+        cache = default_location_cache
+
+    country, subdivision, subsubdivision, check_country = cache.get(gisaid_json_dict['covv_location'])
+
+    if warnings and check_country:
+        sys.stderr.write('Check country flagged for ' + gisaid_json_dict['covv_accession_id'] + \
+                         '  ("' + country + '")\n')
+
+        gisaid_json_dict = add_edin_flag(gisaid_json_dict, 'check_country')
+
+    if underscores:
+        country = country.replace(' ', '_')
+        subdivision = subdivision.replace(' ', '_')
+        subsubdivision = subsubdivision.replace(' ', '_')
+
+    gisaid_json_dict['edin_admin_0'] = country
+    gisaid_json_dict['edin_admin_1'] = subdivision
+    gisaid_json_dict['edin_admin_2'] = subsubdivision
+
+    return(gisaid_json_dict)
+
+
+def fix_header(header, strip = True, fix_wuhan = True):
+    """
+    parse fasta header and remove problems
+
+    strip: remove leading whitespace first
+    fix_wuhan: the reference sequence Wuhan-Hu-1 becomes China/Wuhan-Hu-1
+    """
+    if strip:
+        header = header.lstrip()
+
+    fixed_header = header.replace(' ', '_')\
+        .replace("hCoV-19/","")\
+        .replace("hCov-19/","")\
+        .replace("PENDING", "")\
+        .replace("UPLOADED", "")\
+        .replace("None", "")
+
+    if fix_wuhan:
+        fixed_header = re.sub('^Wuhan-Hu-1','China/Wuhan-Hu-1',fixed_header)
+
+    return(fixed_header)
+
+
+def parse_omissions_file(file, keep_unmatched_lines = False):
+    """
+    Parse a file of records to omit.
+
+    Relies on there being a regex match to "EPI_ISL_\\d{6}" in a line.
+
+    Only returns the first match to the regex
+
+    Lines starting with "regex:" are regular expressions to match
+    against record headers, and are returned as they are.
+
+    if keep_unmatched_lines, (non-empty) lines without an ID are returned
+    as they are too, to be matched anywhere in the record headers
+    """
+
+    IDs = []
+    file_is_fasta = file.split('.')[-1][0:2].lower() == 'fa'
+
+    with open(file, 'r') as f:
+        for line in f:
+            if file_is_fasta:
+                if line[0] != '>':
+                    continue
+            elif line.startswith("#"):
+                continue
+            elif len(line.strip()) == 0:
+                continue
+            elif line.startswith(regex_prefix):
+                IDs.append(line.rstrip())
+                continue
+
+            match = re.search(EPI_ISL_regex, line)
+            if match:
+                IDs.append(match.group())
+            elif keep_unmatched_lines:
+                IDs.append(line.rstrip())
+
+    return(IDs)
@@ -5,9 +5,15 @@ from datetime import datetime
 import warnings
 import re
 import pycountry
+from itertools import chain
 
 from datafunk.travel_history import *
 from datafunk.travel_history import cities_dict, countries_list, subdivisions_dict, others
+from datafunk.location_cache import default_location_cache
+from datafunk import gisaid_common
+from datafunk.columnar import is_columnar, write_metadata_records
+from datafunk.edin_flags import add_edin_flag, metadata_values
+from datafunk.omissions import make_omissions_matcher
 
 """
 Don't edit these two lists please:
@@ -33,95 +39,27 @@ def parse_omissions_file(file):
     Parse a file of records to omit.
     Relies on there being a regex match to "EPI_ISL_\d{6}" in a line.
     Only returns the first match to the regex
-    """
-    # TO DO: allow regexes to e.g. 'bat', 'pangolin' in the omissions file
-
-    IDs = []
-    regex = re.compile('EPI_ISL_\d{6}')
-    file_is_fasta = file.split('.')[-1][0:2].lower() == 'fa'
-
-    with open(file, 'r') as f:
-        for line in f:
-            if file_is_fasta:
-                if line[0] != '>':
-                    continue
-            elif line.startswith("#"):
-                continue
-            match = re.search(regex, line)
-            if match:
-                ID = match.group()
-                IDs.append(ID)
 
-    return(IDs)
+    Lines starting with "regex:" are regular expressions to match
+    against record headers, and are returned as they are
+    """
+    return(gisaid_common.parse_omissions_file(file))
 
 
 def fix_gisaid_json_dict(gisaid_json_dict):
     """
     Remove commas from fields inside json dict
     """
-
-    newDict = {}
-    for x,y in gisaid_json_dict.items():
-        newDict[x] = str(y).replace(',', '')
-
-    return(newDict)
+    return(gisaid_common.fix_gisaid_json_dict(gisaid_json_dict, to_ascii = False))
 
 
-def get_admin_levels_from_json_dict(gisaid_json_dict, warnings = True):
+def get_admin_levels_from_json_dict(gisaid_json_dict, warnings = True, cache = None):
     """
     get location strings from the gisaid location field
-    use pycountry /
+    use pycountry (via a cache of already-resolved locations) /
     """
-    location_strings = [x.strip() for x in gisaid_json_dict['covv_location'].split("/")]
-
-    while len(location_strings) < 4:
-        location_strings.append("")
-
-    continent = location_strings[0]
-    country = location_strings[1]
-    subdivision = location_strings[2]
-    subsubdivision = location_strings[3]
-
-    if any([x == country for x in ['England', 'Northern Ireland', 'Scotland', 'Wales']]):
-        country = 'United Kingdom'
-        subdivision = location_strings[1]
-        subsubdivision = location_strings[2]
-
-    if any([x == country for x in ['Alaska']]):
-        country = 'USA'
-        subdivision = location_strings[1]
-        subsubdivision = location_strings[2]
-
-    # some check here that there's a match to a real country
-    # using pycountries?
-    # First, these countries are known exceptions:
-    if warnings:
-        if all([country != x for x in ['Iran', 'South Korea', 'Russia', 'Korea', 'Democratic Republic of the Congo']]):
-            try:
-                pycountry.countries.lookup(country)
-            except LookupError:
-                warnings.warn('Check country flagged for ' + gisaid_json_dict['covv_accession_id'] + \
-                              '  ("' + country + '")')
-
-                if len(gisaid_json_dict['edin_flag']) == 0:
-                    gisaid_json_dict['edin_flag'] = 'check_country'
-                elif len(gisaid_json_dict['edin_flag']) > 0:
-                    gisaid_json_dict['edin_flag'] = gisaid_json_dict['edin_flag'] + ':check_country'
-
-    if country == 'United Kingdom':
-        country = 'UK'
-
-    if country == 'Korea':
-        country = 'South Korea'
-
-    if country == 'Democratic Republic of the Congo':
-        country = 'DRC'
-
-    gisaid_json_dict['edin_admin_0'] = country
-    gisaid_json_dict['edin_admin_1'] = subdivision
-    gisaid_json_dict['edin_admin_2'] = subsubdivision
-
-    return(gisaid_json_dict)
+    return(gisaid_common.get_admin_levels_from_json_dict(gisaid_json_dict, warnings = warnings,
+                                                         cache = cache, underscores = False))
 
 
 # def get_field_list(dict_of_dicts):
@@ -199,6 +137,16 @@ def get_csv_order_and_record_dict(csv_file, fields_list_required, fields_list_op
     return(record_order, old_records)
 
 
+def get_json_record(json_dict, fields_list_required, fields_list_optional):
+    """
+    one (already parsed) record from a GISAID json dump, cleaned
+    up and with all the fields in the lists
+    """
+    d = fix_gisaid_json_dict(json_dict)
+    d = expand_dict(dict = d, fields_list_required = fields_list_required, fields_list_optional = fields_list_optional)
+    return(d)
+
+
 def get_json_order_and_record_dict(json_file, fields_list_required, fields_list_optional):
     """
     Read all info in a GISAID json dump into memory.
@@ -212,8 +160,7 @@ def get_json_order_and_record_dict(json_file, fields_list_required, fields_list_
     with open(json_file, 'r') as f:
         for jsonObj in f:
 
-            d = fix_gisaid_json_dict(json.loads(jsonObj))
-            d = expand_dict(dict = d, fields_list_required = fields_list_required, fields_list_optional = fields_list_optional)
+            d = get_json_record(json.loads(jsonObj), fields_list_required, fields_list_optional)
 
             ID = d['covv_accession_id']
             record_order.append(ID)
@@ -251,10 +198,7 @@ def check_gisaid_date(dict):
     regex = re.compile('\d{4}-\d{2}-\d{2}')
     match = re.search(regex, date)
     if not match:
-        if len(dict['edin_flag']) == 0:
-            dict['edin_flag'] = 'check_date'
-        elif len(dict['edin_flag']) > 0:
-            dict['edin_flag'] = dict['edin_flag'] + ':check_date'
+        dict = add_edin_flag(dict, 'check_date')
 
     return(dict)
 
@@ -275,13 +219,30 @@ def update_edin_lineage_field(dict, lineage_dict):
     return(dict)
 
 
+def get_header(dict):
+    """
+    the record's header (as process_gisaid_data makes it), to match
+    omissions file entries against. Needs the admin levels
+    """
+    header = dict['covv_virus_name'] + '|' + \
+             dict['covv_accession_id'] + '||' + \
+             dict['edin_admin_0'] + '|' + \
+             dict['edin_admin_1'] + '|' + \
+             dict['edin_admin_2'] + '|' + \
+             dict['covv_collection_date']
+    return(gisaid_common.fix_header(header))
+
+
 def update_edin_omitted_field(dict, omit_set):
     """
     update omission field to True if record
     is in omissions file
+
+    omit_set is an omissions_matcher, so the header is checked
+    against every entry in the omissions file(s) in one scan
     """
     if omit_set:
-        if dict['covv_accession_id'] in omit_set:
+        if dict['covv_accession_id'] in omit_set or omit_set.search(get_header(dict)):
             dict['edin_omitted'] = 'True'
     return(dict)
 
@@ -302,7 +263,7 @@ def get_one_line(dict, fields_list, sep = ','):
 
     l is a 'sep'-separated string formatted for printing
     """
-    l = sep.join([dict[x] for x in fields_list]) + '\n'
+    l = sep.join(metadata_values(dict, fields_list)) + '\n'
     return(l)
 
 
@@ -314,8 +275,16 @@ def write_output(output, \
                   fields_list):
 
     """
-    write a csv-format outfile to file
+    write a csv-format outfile to file (or a Parquet/Feather
+    file with typed columns if output ends in .parquet/.feather)
     """
+    if is_columnar(output):
+        write_metadata_records(output,
+                               chain((old_records_dict[x] for x in old_records_list),
+                                     (new_records_dict[x] for x in new_records_list)),
+                               fields_list)
+        return
+
     if output == 'stdout':
         out = sys.stdout
     else:
@@ -338,21 +307,37 @@ def write_output(output, \
     pass
 
 
-def gisaid_json_2_metadata(json, output, args_csv, args_omit_file_list, args_lineages):
+def gisaid_json_2_metadata(json, output, args_csv, args_omit_file_list, args_lineages, location_cache_file = None):
 
     # logfile = open(output + '.log', 'w')
-    if args_omit_file_list:
-        temp = []
-        for file in args_omit_file_list:
-            temp.extend(parse_omissions_file(file))
+    if location_cache_file:
+        default_location_cache.load(location_cache_file)
 
-        omitted_IDs = set(temp)
-    else:
-        omitted_IDs = False
+    old_records_list, old_records_dict = load_old_metadata(args_csv)
 
-    if args_lineages:
-        lineages = get_lineage_info(args_lineages)
+    all_records = get_json_order_and_record_dict(json, \
+                                                fields_list_required = _fields_gisaid + _fields_edin, \
+                                                fields_list_optional = fields)
+
+    gisaid_json_2_metadata_records(all_records = all_records,
+                                   old_records_list = old_records_list,
+                                   old_records_dict = old_records_dict,
+                                   output = output,
+                                   args_omit_file_list = args_omit_file_list,
+                                   args_lineages = args_lineages)
+
+    if location_cache_file:
+        default_location_cache.save(location_cache_file)
 
+    # logfile.close()
+    pass
+
+
+def load_old_metadata(args_csv):
+    """
+    read the last metadata table (if args_csv isn't 'False'), adding
+    its extra columns to fields
+    """
     if args_csv != 'False':
         # Check that all required fields were in the csv file
         csv_header = next(open(args_csv, 'r')).strip().split(',')
@@ -377,10 +362,20 @@ def gisaid_json_2_metadata(json, output, args_csv, args_omit_file_list, args_lin
         old_records_list = []
         old_records_dict = {}
 
+    return(old_records_list, old_records_dict)
 
-    all_records = get_json_order_and_record_dict(json, \
-                                                fields_list_required = _fields_gisaid + _fields_edin, \
-                                                fields_list_optional = fields)
+
+def gisaid_json_2_metadata_records(all_records, old_records_list, old_records_dict,
+                                   output, args_omit_file_list, args_lineages):
+    """
+    everything gisaid_json_2_metadata does after reading its input:
+    all_records is (record_order, all_records_dict) as returned
+    by get_json_order_and_record_dict
+    """
+    omitted_IDs = make_omissions_matcher(args_omit_file_list, parse_omissions_file)
+
+    if args_lineages:
+        lineages = get_lineage_info(args_lineages)
 
     all_records_list = all_records[0]
     all_records_dict = all_records[1]
@@ -388,15 +383,15 @@ def gisaid_json_2_metadata(json, output, args_csv, args_omit_file_list, args_lin
     new_records_list = [x for x in all_records_list if x not in set(old_records_list)]
     new_records_dict = {x: all_records_dict[x] for x in all_records_list if x not in set(old_records_list)}
 
-    # update omitted field
-    new_records_dict = {x: update_edin_omitted_field(all_records_dict[x], omitted_IDs) for x in new_records_dict.keys()}
-
     # update date stamp field
     new_records_dict = {x: update_edin_date_stamp_field(all_records_dict[x]) for x in new_records_dict.keys()}
 
     # update admin level
     new_records_dict = {x: get_admin_levels_from_json_dict(all_records_dict[x]) for x in new_records_dict.keys()}
 
+    # update omitted field (after the admin levels, which are in the header)
+    new_records_dict = {x: update_edin_omitted_field(all_records_dict[x], omitted_IDs) for x in new_records_dict.keys()}
+
     # check gisaid collection date
     new_records_dict = {x: check_gisaid_date(all_records_dict[x]) for x in new_records_dict.keys()}
 
@@ -413,6 +408,3 @@ def gisaid_json_2_metadata(json, output, args_csv, args_omit_file_list, args_lin
                   old_records_list = old_records_list,
                   old_records_dict = old_records_dict,
                   fields_list = _fields_edin + fields + _fields_gisaid)
-
-    # logfile.close()
-    pass
@@ -0,0 +1,196 @@
+"""
+an on-disk index of a GISAID json dump (one json record per line), so that
+records can be read by covv_accession_id or covv_virus_name without scanning
+the whole dump.
+
+the index is a tsv file (by default <dump>.idx) with one line per record:
+
+covv_accession_id	covv_virus_name	offset	length
+
+where offset is where the record's line starts and length is its length in
+bytes. For a bgzip-compressed dump, offset is the BGZF virtual offset of the
+start of the line (and length is still in uncompressed bytes), so records
+can be read straight out of the compressed file.
+
+the first line of the index is a comment with the size and modification time
+of the dump it was made from, and a hash of its first and last blocks, so that
+an index that no longer matches its dump isn't used. Each line read through the
+index is also checked to be the record it should be
+"""
+
+import os
+import re
+import sys
+import json
+from collections import defaultdict
+
+from Bio import bgzf
+
+from datafunk.checkpoint import file_fingerprint
+
+
+index_suffix = '.idx'
+
+"""bytes at each end of the dump that are hashed for its signature:
+"""
+signature_block_size = 65536
+
+accession_regex = re.compile(rb'"covv_accession_id"\s*:\s*"([^"]*)"')
+virus_name_regex = re.compile(rb'"covv_virus_name"\s*:\s*"([^"]*)"')
+
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def get_index_file(input_json, index_file = None):
+    if index_file:
+        return(index_file)
+    return(input_json + index_suffix)
+
+
+def dump_signature(input_json):
+    """
+    the first line of an index of input_json: its size, modification time,
+    and a hash of its first and last signature_block_size bytes
+    """
+    size, mtime, sha1 = file_fingerprint(input_json, signature_block_size)
+    return('#size=' + str(size) + '\tmtime=' + str(mtime) + '\tsha1=' + sha1)
+
+
+def is_bgzip(file):
+    """
+    bgzip files are gzip files with a 'BC' extra subfield in each block header
+    """
+    with open(file, 'rb') as f:
+        magic = f.read(18)
+    return(len(magic) == 18 and magic[0:4] == b'\x1f\x8b\x08\x04' and magic[12:14] == b'BC')
+
+
+def open_dump(input_json):
+    """
+    open the dump for reading bytes: a BgzfReader (whose tell() and seek()
+    use virtual offsets) if it's bgzip-compressed, otherwise a plain file
+    """
+    if is_bgzip(input_json):
+        return(bgzf.BgzfReader(input_json, 'rb'))
+    if input_json.endswith('.gz'):
+        sys.exit(input_json + ' is gzip but not bgzip compressed, so it can\'t be indexed. Recompress it with bgzip')
+    return(open(input_json, 'rb'))
+
+
+def get_ids_from_line(line):
+    """
+    accession and virus name of one line of the dump. The two fields are
+    pulled out with regexes, and the line is only parsed as json if
+    that doesn't work (or the values have escaped characters in them)
+    """
+    accession = accession_regex.search(line)
+    virus_name = virus_name_regex.search(line)
+
+    if accession and virus_name and b'\\' not in accession.group(1) and b'\\' not in virus_name.group(1):
+        return(accession.group(1).decode('utf-8'), virus_name.group(1).decode('utf-8'))
+
+    d = json.loads(line)
+    return(str(d['covv_accession_id']), str(d.get('covv_virus_name', '')))
+
+
+def iterate_dump_offsets(input_json):
+    """
+    yield (accession, virus name, offset, length) for every record in the dump
+    """
+    f = open_dump(input_json)
+    compressed = isinstance(f, bgzf.BgzfReader)
+
+    offset = 0
+    while True:
+        if compressed:
+            offset = f.tell()
+        line = f.readline()
+        if not line:
+            break
+        length = len(line)
+        if line.strip():
+            accession, virus_name = get_ids_from_line(line)
+            yield((accession, virus_name, offset, length))
+        if not compressed:
+            offset += length
+
+    f.close()
+
+
+def index_gisaid(input_json, index_file = None):
+    """
+    write the index of input_json to index_file (default input_json.idx)
+    """
+    index_file = get_index_file(input_json, index_file)
+    tmp_file = index_file + '.tmp'
+
+    with open(tmp_file, 'w') as out:
+        out.write(dump_signature(input_json) + '\n')
+        out.write('covv_accession_id\tcovv_virus_name\toffset\tlength\n')
+        for accession, virus_name, offset, length in iterate_dump_offsets(input_json):
+            out.write(accession + '\t' + virus_name.replace('\t', ' ') + '\t' + str(offset) + '\t' + str(length) + '\n')
+
+    os.replace(tmp_file, index_file)
+
+
+class gisaid_index():
+    """
+    an index loaded from disk: accession -> (offset, length), and
+    virus name -> list of accessions
+    """
+
+    def __init__(self, input_json, index_file = None):
+        self.input_json = input_json
+        self.index_file = get_index_file(input_json, index_file)
+        self.accessions = {}
+        self.virus_names = defaultdict(list)
+
+        if not os.path.exists(self.index_file):
+            sys.exit('No index ' + self.index_file + ' found for ' + input_json + ', run datafunk index_gisaid first')
+
+        with open(self.index_file, 'r') as f:
+            signature = f.readline().rstrip('\n')
+            if signature != dump_signature(input_json):
+                sys.exit(self.index_file + ' was made from a different version of ' + input_json + ', run datafunk index_gisaid again')
+            next(f)
+            for line in f:
+                accession, virus_name, offset, length = line.rstrip('\n').split('\t')
+                self.accessions[accession] = (int(offset), int(length))
+                self.virus_names[virus_name].append(accession)
+
+    def __contains__(self, accession):
+        return(accession in self.accessions)
+
+    def __len__(self):
+        return(len(self.accessions))
+
+    def get_accessions(self, virus_name):
+        return(self.virus_names.get(virus_name, []))
+
+    def open(self):
+        self.handle = open_dump(self.input_json)
+        return(self)
+
+    def close(self):
+        self.handle.close()
+
+    def get_line(self, accession):
+        """
+        the raw json line for one accession, read by seeking straight to it.
+        Exits if it isn't that accession's record (the dump has changed)
+        """
+        offset, length = self.accessions[accession]
+        self.handle.seek(offset)
+        line = self.handle.read(length)
+        try:
+            found = get_ids_from_line(line)[0]
+        except (ValueError, KeyError, TypeError):
+            found = None
+        if found != accession:
+            sys.exit('The record for ' + accession + ' isn\'t where ' + self.index_file + ' says it is in ' + self.input_json + ', run datafunk index_gisaid again')
+        return(line)
+
+    def get_record(self, accession):
+        return(json.loads(self.get_line(accession)))
@@ -0,0 +1,208 @@
+"""
+read a GISAID json dump once and write any combination of:
+
+ - the process_gisaid_data metadata table and fasta file
+ - the process_gisaid_sequence_data fasta file
+ - the gisaid_json_2_metadata metadata table
+
+each line of the dump is parsed once and handed to every output that was
+asked for. Each output cleans up its own copy of the record with the shared
+functions in gisaid_common (with the same options as its own command), so
+the files written are the same as running the commands one at a time
+"""
+
+import json
+import sys
+
+from datafunk.location_cache import default_location_cache
+from datafunk import process_gisaid_data as pgd
+from datafunk import process_gisaid_sequence_data as pgsd
+from datafunk import gisaid_json_2_metadata as gj2m
+
+
+class process_gisaid_data_output():
+    """
+    collects the records for process_gisaid_data, and
+    processes / writes them at the end of the dump
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self.old_records = pgd.load_old_metadata(options['input_metadata'])
+        self.fields_list_required = pgd._fields_gisaid + pgd._fields_edin
+        self.known_fields = set(self.fields_list_required + pgd.fields)
+        self.record_order = []
+        self.all_records = {}
+        self.extra_fields = []
+
+    def add(self, json_dict):
+        d = pgd.get_json_record(json_dict)
+        for x in d:
+            if x not in self.known_fields:
+                self.known_fields.add(x)
+                self.extra_fields.append(x)
+        ID = d['covv_accession_id']
+        self.record_order.append(ID)
+        self.all_records[ID] = d
+
+    def finish(self):
+        temp_old_records_list, temp_old_records_dict = self.old_records
+        pgd.process_gisaid_records(all_records = (self.record_order, self.all_records, self.extra_fields),
+                                   temp_old_records_list = temp_old_records_list,
+                                   temp_old_records_dict = temp_old_records_dict,
+                                   **{x: y for x,y in self.options.items() if x != 'input_metadata'})
+
+
+class sequence_output():
+    """
+    writes the process_gisaid_sequence_data fasta file as the dump is read
+    """
+
+    def __init__(self, output, omit_file_list = False, exclude_uk = False, exclude_undated = False):
+        self.omitted = pgsd.make_omissions_matcher(omit_file_list, pgsd.parse_omissions_file)
+        self.exclude_uk = exclude_uk
+        self.exclude_undated = exclude_undated
+        self.out = open(output, 'w')
+
+    def add(self, json_dict):
+        entry = pgsd.get_fasta_entry_from_json_dict(json_dict, self.omitted, self.exclude_uk, self.exclude_undated)
+        if entry:
+            self.out.write(entry)
+
+    def finish(self):
+        self.out.close()
+
+
+class gisaid_json_2_metadata_output():
+    """
+    collects the records for gisaid_json_2_metadata, and
+    processes / writes them at the end of the dump
+    """
+
+    def __init__(self, output, args_csv = 'False', args_omit_file_list = None, args_lineages = None):
+        self.output = output
+        self.args_omit_file_list = args_omit_file_list
+        self.args_lineages = args_lineages
+        self.old_records_list, self.old_records_dict = gj2m.load_old_metadata(args_csv)
+        self.record_order = []
+        self.all_records = {}
+
+    def add(self, json_dict):
+        d = gj2m.get_json_record(json_dict, gj2m._fields_gisaid + gj2m._fields_edin, gj2m.fields)
+        ID = d['covv_accession_id']
+        self.record_order.append(ID)
+        self.all_records[ID] = d
+
+    def finish(self):
+        gj2m.gisaid_json_2_metadata_records(all_records = (self.record_order, self.all_records),
+                                            old_records_list = self.old_records_list,
+                                            old_records_dict = self.old_records_dict,
+                                            output = self.output,
+                                            args_omit_file_list = self.args_omit_file_list,
+                                            args_lineages = self.args_lineages)
+
+
+def read_json_dump(input_json, outputs):
+    """
+    parse each line of the dump once, and give it to every output
+    """
+    with open(input_json, 'r') as f:
+        for jsonObj in f:
+            json_dict = json.loads(jsonObj)
+            for output in outputs:
+                output.add(json_dict)
+
+    for output in outputs:
+        output.finish()
+
+
+def ingest_gisaid(input_json,
+                  input_omit_file_list = None,
+                  input_metadata = 'False',
+                  output_fasta = None,
+                  output_metadata = None,
+                  output_sequences = None,
+                  output_json_metadata = None,
+                  json_metadata_csv = 'False',
+                  lineages = None,
+                  exclude_uk = False,
+                  exclude_undated = False,
+                  exclude_subsampled = True,
+                  exclude_omitted_file = True,
+                  location_cache_file = None,
+                  skip_stages = None,
+                  add_stages = None,
+                  stage_timings = False,
+                  partition_by = None,
+                  partition_dir = 'partitions',
+                  max_open_files = 64,
+                  change_feed = None,
+                  checkpoint_file = None,
+                  checkpoint_every = 10000,
+                  resume = False):
+    """
+    output_fasta / output_metadata: process_gisaid_data outputs (with
+        input_metadata as the previous metadata)
+    output_sequences: process_gisaid_sequence_data output
+    output_json_metadata: gisaid_json_2_metadata output (with json_metadata_csv
+        as its previous metadata, and lineages)
+    add_stages: 'module.path:function' stages that process_gisaid_data runs on
+        each new record after the built-in ones (registered for this run only)
+    """
+    if not any([output_fasta, output_metadata, output_sequences, output_json_metadata, partition_by, change_feed]):
+        sys.exit('No outputs were asked for')
+
+    if location_cache_file:
+        default_location_cache.load(location_cache_file)
+
+    outputs = []
+
+    if output_fasta or output_metadata or partition_by or change_feed:
+        for spec in add_stages or []:
+            pgd.register_stage(name = spec, function = pgd.load_stage(spec))
+
+        checkpoint = pgd.get_checkpoint(checkpoint_file, resume, input_json, input_metadata, input_omit_file_list,
+                                        {'exclude_uk': exclude_uk,
+                                         'exclude_undated': exclude_undated,
+                                         'exclude_subsampled': exclude_subsampled,
+                                         'exclude_omitted_file': exclude_omitted_file,
+                                         'skip_stages': skip_stages,
+                                         'add_stages': pgd.describe_user_stages()})
+        outputs.append(process_gisaid_data_output({'input_metadata': input_metadata,
+                                                   'input_omit_file_list': input_omit_file_list,
+                                                   'output_fasta': output_fasta,
+                                                   'output_metadata': output_metadata,
+                                                   'exclude_uk': exclude_uk,
+                                                   'exclude_undated': exclude_undated,
+                                                   'exclude_subsampled': exclude_subsampled,
+                                                   'exclude_omitted_file': exclude_omitted_file,
+                                                   'skip_stages': skip_stages,
+                                                   'stage_timings': stage_timings,
+                                                   'partition_by': partition_by,
+                                                   'partition_dir': partition_dir,
+                                                   'max_open_files': max_open_files,
+                                                   'write_fasta': bool(output_fasta),
+                                                   'change_feed': change_feed,
+                                                   'checkpoint': checkpoint,
+                                                   'checkpoint_every': checkpoint_every}))
+
+    if output_sequences:
+        outputs.append(sequence_output(output_sequences,
+                                       omit_file_list = input_omit_file_list,
+                                       exclude_uk = exclude_uk,
+                                       exclude_undated = exclude_undated))
+
+    if output_json_metadata:
+        outputs.append(gisaid_json_2_metadata_output(output_json_metadata,
+                                                     args_csv = json_metadata_csv,
+                                                     args_omit_file_list = input_omit_file_list,
+                                                     args_lineages = lineages))
+
+    try:
+        read_json_dump(input_json, outputs)
+    finally:
+        for spec in add_stages or []:
+            pgd.unregister_stage(spec)
+
+    if location_cache_file:
+        default_location_cache.save(location_cache_file)
@@ -0,0 +1,129 @@
+"""
+cache of resolved gisaid location strings.
+
+pycountry.countries.lookup() is a linear (fuzzy) search, and millions of
+gisaid records share only a few thousand distinct covv_location strings,
+so resolve each distinct string once and keep the result in an LRU cache
+that can be written to / read from disk between runs
+"""
+
+import json
+import os
+import sys
+from collections import OrderedDict
+
+import pycountry
+
+
+# these countries don't resolve in pycountry but are known to be fine:
+_known_country_exceptions = ['Iran', 'South Korea', 'Russia', 'Korea', 'Democratic Republic of the Congo']
+
+
+def resolve_location(location):
+    """
+    split a gisaid covv_location string into its admin levels and check
+    the country against pycountry
+
+    returns a tuple (country, subdivision, subsubdivision, check_country)
+    where check_country is True if the country could not be resolved
+    """
+    location_strings = [x.strip() for x in location.split("/")]
+
+    while len(location_strings) < 4:
+        location_strings.append("")
+
+    country = location_strings[1]
+    subdivision = location_strings[2]
+    subsubdivision = location_strings[3]
+
+    if country in ['England', 'Northern Ireland', 'Scotland', 'Wales']:
+        country = 'United Kingdom'
+        subdivision = location_strings[1]
+        subsubdivision = location_strings[2]
+
+    if country in ['Alaska']:
+        country = 'USA'
+        subdivision = location_strings[1]
+        subsubdivision = location_strings[2]
+
+    check_country = False
+    if country not in _known_country_exceptions:
+        try:
+            pycountry.countries.lookup(country)
+        except LookupError:
+            check_country = True
+
+    if country == 'United Kingdom':
+        country = 'UK'
+
+    if country == 'Korea':
+        country = 'South Korea'
+
+    if country == 'Democratic Republic of the Congo':
+        country = 'DRC'
+
+    return((country, subdivision, subsubdivision, check_country))
+
+
+class location_cache():
+    """
+    LRU cache of covv_location -> resolve_location(covv_location)
+    """
+
+    def __init__(self, maxsize = 100000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, location):
+        if location in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(location)
+            return(self.entries[location])
+
+        self.misses += 1
+        resolved = resolve_location(location)
+        self.entries[location] = resolved
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last = False)
+
+        return(resolved)
+
+    def load(self, file):
+        """
+        read a cache written by save(). A missing file is not an error -
+        it is just an empty cache (eg. the first run)
+        """
+        if not os.path.exists(file):
+            return
+
+        with open(file, 'r') as f:
+            try:
+                entries = json.load(f)
+            except ValueError:
+                sys.stderr.write('Could not parse location cache ' + file + ', ignoring it\n')
+                return
+
+        for location, country, subdivision, subsubdivision, check_country in entries:
+            self.entries[location] = (country, subdivision, subsubdivision, check_country)
+
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last = False)
+
+    def save(self, file):
+        """
+        write the cache (least recently used first) to file
+        """
+        entries = [[location] + list(resolved) for location, resolved in self.entries.items()]
+
+        tmp = file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp, file)
+
+
+"""
+a cache shared by all the gisaid parsing modules in one process:
+"""
+default_location_cache = location_cache()
@@ -0,0 +1,150 @@
+"""
+matching records against omissions files.
+
+an omissions file has one entry per line. Entries are accession IDs (or other
+literal strings) which are omitted if they are the record's accession, or if
+they appear anywhere in the record's header, or regular expressions, written as:
+
+regex:<python regular expression>
+
+which are omitted if they match anywhere in the header.
+
+all the literal entries are compiled into one Aho-Corasick automaton and all the
+regex entries into one combined regular expression, so each header is scanned once
+however many entries there are (rather than once per entry)
+"""
+
+import re
+from collections import deque
+
+
+regex_prefix = 'regex:'
+
+"""virus names matching these are never human samples:
+"""
+default_virus_name_omissions = ['/bat/', '/pangolin/']
+
+
+class aho_corasick():
+    """
+    automaton for finding whether any of a set of literal strings
+    occurs in a piece of text, in a single pass over the text
+    """
+
+    def __init__(self, patterns = ()):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [False]
+        for pattern in patterns:
+            self.add(pattern)
+        self.build()
+
+    def add(self, pattern):
+        state = 0
+        for c in pattern:
+            if c not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(False)
+                self.goto[state][c] = len(self.goto) - 1
+            state = self.goto[state][c]
+        self.output[state] = True
+
+    def build(self):
+        """
+        breadth-first pass to make the failure links. A state is an output
+        state if it, or any state on its failure chain, ends a pattern
+        """
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for c, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and c not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(c, 0)
+                if self.fail[next_state] == next_state:
+                    self.fail[next_state] = 0
+                self.output[next_state] = self.output[next_state] or self.output[self.fail[next_state]]
+
+    def search(self, text):
+        """
+        True if any pattern occurs in text
+        """
+        if self.output[0]:
+            return(True)
+
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        for c in text:
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            if output[state]:
+                return(True)
+
+        return(False)
+
+
+class omissions_matcher():
+    """
+    behaves like the set of omitted IDs (supports "in" and truth testing)
+    with search() to test a header against every entry at once
+    """
+
+    def __init__(self, entries = ()):
+        self.ids = set()
+        regexes = []
+
+        for entry in entries:
+            if entry.startswith(regex_prefix):
+                regexes.append(entry[len(regex_prefix):])
+            else:
+                self.ids.add(entry)
+
+        self.literals = aho_corasick(self.ids)
+
+        if regexes:
+            self.regex = re.compile('|'.join(['(?:' + x + ')' for x in regexes]))
+        else:
+            self.regex = None
+
+    def __contains__(self, ID):
+        return(ID in self.ids)
+
+    def __bool__(self):
+        return(len(self.ids) > 0 or self.regex is not None)
+
+    def __len__(self):
+        return(len(self.ids))
+
+    def search(self, text):
+        """
+        True if any literal entry occurs in, or any regex entry matches, text
+        """
+        if self.literals.search(text):
+            return(True)
+        if self.regex is not None and self.regex.search(text):
+            return(True)
+        return(False)
+
+
+default_virus_name_matcher = omissions_matcher(default_virus_name_omissions)
+
+
+def make_omissions_matcher(omit_file_list, parser):
+    """
+    parse all the omissions files with parser and compile their entries.
+    Returns False if there are no files (as the modules did before)
+    """
+    if not omit_file_list:
+        return(False)
+
+    entries = []
+    for file in omit_file_list:
+        entries.extend(parser(file))
+
+    return(omissions_matcher(entries))
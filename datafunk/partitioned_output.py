@@ -0,0 +1,210 @@
+"""
+write records into one metadata file and one fasta file per value of a
+metadata field (eg. edin_admin_0 or edin_epi_week), in a single pass over
+the records.
+
+there can be many more partitions than the operating system allows open files,
+so only max_open_files handles are kept open at once: the least recently
+used one is closed when another is needed, and reopened for appending if
+more records for it turn up later.
+
+the files are written under temporary names, and only replace the real ones
+(with the manifest last) once every record has been written, so a run that
+dies part way through doesn't leave truncated partitions beside an old manifest
+"""
+
+import os
+import re
+import sys
+import hashlib
+from collections import OrderedDict, defaultdict
+
+from datafunk.edin_flags import metadata_values
+from datafunk.checkpoint import atomic_open, temporary_path
+
+
+def partition_file_name(value):
+    """
+    turn a metadata value into something safe to use as a file name
+    """
+    value = re.sub(r'[^A-Za-z0-9_.-]', '_', value.strip())
+    if value == '' or value.startswith('.'):
+        value = 'unknown' + value
+    return(value)
+
+
+class partition_names():
+    """
+    the file name for each distinct value. Values that come out as the same
+    name (eg. 'A B' and 'A_B', or names that only differ in case, on a case
+    insensitive file system) are told apart by a hash of the value: the first
+    one seen keeps the plain name
+    """
+
+    def __init__(self):
+        self.names = {}
+        self.taken = set()
+
+    def get(self, value):
+        if value not in self.names:
+            name = partition_file_name(value)
+            if name.lower() in self.taken:
+                name = name + '_' + hashlib.sha1(value.encode('utf-8')).hexdigest()[:8]
+            self.names[value] = name
+            self.taken.add(name.lower())
+        return(self.names[value])
+
+
+def natural_sort_key(name):
+    """
+    sort numbers in names by their value, so that epi week 8 comes before 53
+    """
+    return([(0, int(x), '') if x.isdigit() else (1, 0, x) for x in re.split(r'(\d+)', name) if x != ''])
+
+
+class partitioned_writer():
+    """
+    pool of open file handles, keyed by file path. Each path is written
+    to its temporary_path until commit()
+    """
+
+    def __init__(self, max_open_files = 64):
+        if max_open_files < 1:
+            sys.exit('max_open_files must be at least 1')
+        self.max_open_files = max_open_files
+        self.handles = OrderedDict()
+        self.opened = set()
+
+    def get_handle(self, path):
+        if path in self.handles:
+            self.handles.move_to_end(path)
+            return(self.handles[path])
+
+        if len(self.handles) >= self.max_open_files:
+            oldest_path, oldest_handle = self.handles.popitem(last = False)
+            oldest_handle.close()
+
+        # the first time a file is opened in this run it's truncated, after that appended to
+        if path in self.opened:
+            handle = open(temporary_path(path), 'a')
+        else:
+            handle = open(temporary_path(path), 'w')
+            self.opened.add(path)
+
+        self.handles[path] = handle
+        return(handle)
+
+    def is_new(self, path):
+        return(path not in self.opened)
+
+    def write(self, path, string, header = None):
+        """
+        write string to path, writing header first if this is a new file
+        """
+        if header is not None and self.is_new(path):
+            self.get_handle(path).write(header)
+        self.get_handle(path).write(string)
+
+    def close(self):
+        for handle in self.handles.values():
+            handle.close()
+        self.handles = OrderedDict()
+
+    def commit(self):
+        """
+        close everything and move the finished files into place
+        """
+        self.close()
+        for path in self.opened:
+            os.replace(temporary_path(path), path)
+
+    def discard(self):
+        """
+        close everything and remove the temporary files
+        """
+        self.close()
+        for path in self.opened:
+            if os.path.exists(temporary_path(path)):
+                os.remove(temporary_path(path))
+
+
+def write_partitioned_output(partition_by,
+                             partition_dir,
+                             records,
+                             fields_list,
+                             max_open_files = 64,
+                             sep = ','):
+    """
+    records is an iterable of record dicts (each must have the fields in
+    fields_list, and 'edin_header', 'edin_omitted' and 'sequence').
+
+    every record goes into <partition_dir>/<value>.csv, records that aren't
+    omitted go into <partition_dir>/<value>.fasta, where value is
+    record[partition_by] as it is written to the metadata (made safe for a
+    file name by partition_names).
+
+    a manifest.tsv with the number of records and bytes in each file is
+    written to partition_dir at the end, once the partitions are in place
+    """
+    if partition_by not in fields_list:
+        sys.exit('Can\'t partition by ' + partition_by + ', it isn\'t a metadata field')
+
+    if not os.path.exists(partition_dir):
+        os.makedirs(partition_dir)
+
+    writer = partitioned_writer(max_open_files = max_open_files)
+    metadata_header = sep.join(fields_list) + '\n'
+
+    metadata_counts = defaultdict(int)
+    fasta_counts = defaultdict(int)
+    names = partition_names()
+
+    try:
+        for record in records:
+            # (the value as it's written, eg. edin_flag as text rather than a bitmask)
+            partition = names.get(metadata_values(record, [partition_by])[0])
+
+            metadata_path = os.path.join(partition_dir, partition + '.csv')
+            writer.write(metadata_path, sep.join(metadata_values(record, fields_list)) + '\n', header = metadata_header)
+            metadata_counts[partition] += 1
+
+            if record['edin_omitted'] == 'True':
+                continue
+
+            fasta_path = os.path.join(partition_dir, partition + '.fasta')
+            writer.write(fasta_path, '>' + record['edin_header'] + '\n' + record['sequence'] + '\n')
+            fasta_counts[partition] += 1
+    except:
+        writer.discard()
+        raise
+
+    # (so that a manifest is never beside partitions it doesn't describe)
+    manifest = os.path.join(partition_dir, 'manifest.tsv')
+    if os.path.exists(manifest):
+        os.remove(manifest)
+
+    writer.commit()
+
+    write_manifest(partition_dir, metadata_counts, fasta_counts)
+
+
+def write_manifest(partition_dir, metadata_counts, fasta_counts):
+    """
+    one line per partition (in natural_sort_key order) with the record
+    count and size (in bytes) of its metadata and fasta files
+    """
+    with atomic_open(os.path.join(partition_dir, 'manifest.tsv')) as out:
+        out.write('partition\tmetadata_file\tmetadata_records\tmetadata_bytes\tfasta_file\tfasta_records\tfasta_bytes\n')
+        for partition in sorted(metadata_counts, key = natural_sort_key):
+            metadata_file = partition + '.csv'
+            metadata_bytes = os.path.getsize(os.path.join(partition_dir, metadata_file))
+
+            if partition in fasta_counts:
+                fasta_file = partition + '.fasta'
+                fasta_bytes = os.path.getsize(os.path.join(partition_dir, fasta_file))
+            else:
+                fasta_file = ''
+                fasta_bytes = 0
+
+            out.write('\t'.join([partition, metadata_file, str(metadata_counts[partition]), str(metadata_bytes),
+                                 fasta_file, str(fasta_counts[partition]), str(fasta_bytes)]) + '\n')
@@ -5,18 +5,30 @@ write metadata and output sequences at the same time
 from Bio import SeqIO
 import datetime
 from datetime import datetime
-from epiweeks import Week, Year
 import sys
+import os
 import json
 import argparse
 import warnings
 import re
+import time
+import importlib
 import pycountry
+from functools import partial
 from itertools import chain
+from collections import Counter, defaultdict
 from unidecode import unidecode
 
 from datafunk.travel_history import *
 from datafunk.travel_history import cities_dict, countries_list, subdivisions_dict, others
+from datafunk.location_cache import default_location_cache
+from datafunk import gisaid_common
+from datafunk.columnar import is_columnar, write_metadata_records, metadata_header, iterate_metadata_records
+from datafunk.edin_flags import add_edin_flag, has_edin_flag, get_flags, metadata_values
+from datafunk.partitioned_output import write_partitioned_output
+from datafunk.checkpoint import atomic_open, temporary_path, input_description, record_checkpoint
+from datafunk.omissions import make_omissions_matcher, default_virus_name_matcher
+from datafunk.epicalendar import date_string_to_epi_week_and_day
 
 """Don't edit these two lists please:
 """
@@ -48,69 +60,16 @@ def fix_gisaid_json_dict(gisaid_json_dict):
 
     And remove non-ascii characters
     """
+    return(gisaid_common.fix_gisaid_json_dict(gisaid_json_dict, to_ascii = True))
 
-    newDict = {}
-    for x,y in gisaid_json_dict.items():
-        newDict[x] = unidecode(str(y).replace(',', ''))
 
-    return(newDict)
-
-
-def get_admin_levels_from_json_dict(gisaid_json_dict, warnings = True):
+def get_admin_levels_from_json_dict(gisaid_json_dict, warnings = True, cache = None):
     """
     get location strings from the gisaid location field
-    use pycountry /
+    use pycountry (via a cache of already-resolved locations) /
     """
-    location_strings = [x.strip() for x in gisaid_json_dict['covv_location'].split("/")]
-
-    while len(location_strings) < 4:
-        location_strings.append("")
-
-    continent = location_strings[0]
-    country = location_strings[1]
-    subdivision = location_strings[2]
-    subsubdivision = location_strings[3]
-
-    if any([x == country for x in ['England', 'Northern Ireland', 'Scotland', 'Wales']]):
-        country = 'United Kingdom'
-        subdivision = location_strings[1]
-        subsubdivision = location_strings[2]
-
-    if any([x == country for x in ['Alaska']]):
-        country = 'USA'
-        subdivision = location_strings[1]
-        subsubdivision = location_strings[2]
-
-    # some check here that there's a match to a real country
-    # using pycountries?
-    # First, these countries are known exceptions:
-    if warnings:
-        if all([country != x for x in ['Iran', 'South Korea', 'Russia', 'Korea', 'Democratic Republic of the Congo']]):
-            try:
-                pycountry.countries.lookup(country)
-            except LookupError:
-                eprint('Check country flagged for ' + gisaid_json_dict['covv_accession_id'] + \
-                              '  ("' + country + '")')
-
-                if len(gisaid_json_dict['edin_flag']) == 0:
-                    gisaid_json_dict['edin_flag'] = 'check_country'
-                elif len(gisaid_json_dict['edin_flag']) > 0:
-                    gisaid_json_dict['edin_flag'] = gisaid_json_dict['edin_flag'] + ':check_country'
-
-    if country == 'United Kingdom':
-        country = 'UK'
-
-    if country == 'Korea':
-        country = 'South Korea'
-
-    if country == 'Democratic Republic of the Congo':
-        country = 'DRC'
-
-    gisaid_json_dict['edin_admin_0'] = country.replace(' ', '_')
-    gisaid_json_dict['edin_admin_1'] = subdivision.replace(' ', '_')
-    gisaid_json_dict['edin_admin_2'] = subsubdivision.replace(' ', '_')
-
-    return(gisaid_json_dict)
+    return(gisaid_common.get_admin_levels_from_json_dict(gisaid_json_dict, warnings = warnings,
+                                                         cache = cache, underscores = True))
 
 
 def expand_dict(dict, fields_list_required, fields_list_optional):
@@ -133,10 +92,7 @@ def expand_dict(dict, fields_list_required, fields_list_optional):
 def add_edin_flag_if_dict_key_true(dictionary, key):
     if key in dictionary:
         if dictionary[key] == "True" or dictionary[key] == "true" or dictionary[key] == True:
-            if len(dictionary['edin_flag']) == 0:
-                dictionary['edin_flag'] = key
-            elif len(dictionary['edin_flag']) > 0 and key not in dictionary['edin_flag']:
-                dictionary['edin_flag'] = dictionary['edin_flag'] + ':' + key
+            dictionary = add_edin_flag(dictionary, key)
         del dictionary[key]
     return dictionary
 
@@ -149,6 +105,9 @@ def get_csv_order_and_record_dict(csv_file, fields_list_required, fields_list_op
     top-level keys and a dict of key: value pairs
     as the top-level values
     """
+    if is_columnar(csv_file):
+        return(get_columnar_order_and_record_dict(csv_file, fields_list_required, fields_list_optional))
+
     first = True
     old_records = {}
     record_order = []
@@ -169,12 +128,42 @@ def get_csv_order_and_record_dict(csv_file, fields_list_required, fields_list_op
 
             ID = d['covv_accession_id']
             record_order.append(ID)
+            d['edin_flag'] = get_flags(d['edin_flag'])
             d = add_edin_flag_if_dict_key_true(d, "subsample_omit")
             old_records[ID] = d
 
     return(record_order, old_records, extra_fields)
 
 
+def get_columnar_order_and_record_dict(metadata_file, fields_list_required, fields_list_optional):
+    """
+    get_csv_order_and_record_dict for a Parquet/Feather metadata table
+    """
+    keys = metadata_header(metadata_file)
+    extra_fields = list(set(keys) - set(fields_list_required + fields_list_optional))
+
+    old_records = {}
+    record_order = []
+    for d in iterate_metadata_records(metadata_file):
+        ID = d['covv_accession_id']
+        record_order.append(ID)
+        d['edin_flag'] = get_flags(d['edin_flag'])
+        d = add_edin_flag_if_dict_key_true(d, "subsample_omit")
+        old_records[ID] = d
+
+    return(record_order, old_records, extra_fields)
+
+
+def get_json_record(json_dict):
+    """
+    one (already parsed) record from a GISAID json dump, with its
+    fields and sequence cleaned up
+    """
+    d = fix_gisaid_json_dict(json_dict)
+    d = fix_seq_in_gisaid_json_dict(d)
+    return(d)
+
+
 def get_json_order_and_record_dict(json_file, fields_list_required, fields_list_optional):
     """
     Read all info in a GISAID json dump into memory.
@@ -189,8 +178,7 @@ def get_json_order_and_record_dict(json_file, fields_list_required, fields_list_
     with open(json_file, 'r') as f:
         for jsonObj in f:
 
-            d = fix_gisaid_json_dict(json.loads(jsonObj))
-            d = fix_seq_in_gisaid_json_dict(d)
+            d = get_json_record(json.loads(jsonObj))
 
             extra_fields = extra_fields + list(set(list(d.keys())) - set(fields_list_required + fields_list_optional + extra_fields))
 
@@ -211,19 +199,13 @@ def check_gisaid_date(dict):
     if not match:
         # dict['edin_omitted'] = 'True'
 
-        if len(dict['edin_flag']) == 0:
-            dict['edin_flag'] = 'omitted_date'
-        elif len(dict['edin_flag']) > 0:
-            dict['edin_flag'] = dict['edin_flag'] + ':omitted_date'
+        dict = add_edin_flag(dict, 'omitted_date')
 
     else:
         today = datetime.today().date()
         gisaid_date_as_python_date = datetime.strptime(date, '%Y-%m-%d').date()
         if gisaid_date_as_python_date > today or gisaid_date_as_python_date < datetime.strptime('2019-11-30','%Y-%m-%d').date():
-            if len(dict['edin_flag']) == 0:
-                dict['edin_flag'] = 'omitted_date'
-            elif len(dict['edin_flag']) > 0:
-                dict['edin_flag'] = dict['edin_flag'] + ':omitted_date'
+            dict = add_edin_flag(dict, 'omitted_date')
 
     return(dict)
 
@@ -232,36 +214,27 @@ def check_edin_omitted_file(dict, omit_set):
     """
     update omission field to True if record
     is in omissions file
+
+    omit_set is an omissions_matcher, so the header is checked
+    against every entry in the omissions file(s) in one scan
     """
     if omit_set:
         if dict['covv_accession_id'] in omit_set:
             # dict['edin_omitted'] = 'True'
 
-            if len(dict['edin_flag']) == 0:
-                dict['edin_flag'] = 'omitted_file'
-            elif len(dict['edin_flag']) > 0:
-                dict['edin_flag'] = dict['edin_flag'] + ':omitted_file'
+            dict = add_edin_flag(dict, 'omitted_file')
 
-        elif any([x in dict['covv_virus_name'] for x in ['/bat/', '/pangolin/']]):
+        elif default_virus_name_matcher.search(dict['covv_virus_name']):
 
-            if len(dict['edin_flag']) == 0:
-                dict['edin_flag'] = 'omitted_file'
-            elif len(dict['edin_flag']) > 0:
-                dict['edin_flag'] = dict['edin_flag'] + ':omitted_file'
+            dict = add_edin_flag(dict, 'omitted_file')
 
         elif dict['covv_host'].lower() != 'human':
 
-            if len(dict['edin_flag']) == 0:
-                dict['edin_flag'] = 'omitted_file'
-            elif len(dict['edin_flag']) > 0:
-                dict['edin_flag'] = dict['edin_flag'] + ':omitted_file'
+            dict = add_edin_flag(dict, 'omitted_file')
 
-        elif any([x in dict['edin_header'] for x in omit_set]):
+        elif omit_set.search(dict['edin_header']):
 
-            if len(dict['edin_flag']) == 0:
-                dict['edin_flag'] = 'omitted_file'
-            elif len(dict['edin_flag']) > 0:
-                dict['edin_flag'] = dict['edin_flag'] + ':omitted_file'
+            dict = add_edin_flag(dict, 'omitted_file')
 
 
 
@@ -276,10 +249,7 @@ def update_UK_sequence(gisaid_json_dict):
     for country in ['England/', 'Scotland/', 'Wales/', 'Northern_Ireland/']:
         if country.lower() in header.lower():
 
-            if len(gisaid_json_dict['edin_flag']) == 0:
-                gisaid_json_dict['edin_flag'] = 'uk_sequence'
-            elif len(gisaid_json_dict['edin_flag']) > 0:
-                gisaid_json_dict['edin_flag'] = gisaid_json_dict['edin_flag'] + ':uk_sequence'
+            gisaid_json_dict = add_edin_flag(gisaid_json_dict, 'uk_sequence')
 
             gisaid_json_dict['is_uk'] = 'True'
 
@@ -295,62 +265,18 @@ def update_edin_date_stamp_field(gisaid_json_dict):
     return(gisaid_json_dict)
 
 
-def date_string_to_epi_week(date_string):
-    """
-    parse a date string in YYYY-MM-DD format and return
-    cumulative epi week which is cumulative total epidemiological
-    weeks since 2019-12-22. Week beginning 2019-12-22 is week 0
-    """
-    try:
-        date = datetime.strptime(date_string, '%Y-%m-%d').date()
-    except:
-        return ""
-    # this is epi-week:
-    week = Week.fromdate(date)
-    if week.year < 2019 or (week.year == 2019 and week.week < 52):
-        return ""
-    elif week.year == 2019:
-        return("0")
-    else:
-        cum_epi_week = week.week + len(list(chain(*[[x for x in Year(y).iterweeks()] for y in range(2020, week.year)])))
-        return str(cum_epi_week)
-
-
-def date_string_to_epi_day(date_string):
-    """
-    parse a date string in YYYY-MM-DD format and return
-    cumulative epi day which is cumulative total days since 2019-12-22
-    """
-    try:
-        date = datetime.strptime(date_string, '%Y-%m-%d').date()
-    except:
-        return ""
-    # this is epi-week week:
-    week = Week.fromdate(date)
-    # this is day 1 of epi-week 0:
-    day_one = datetime.strptime("2019-12-22", '%Y-%m-%d').date()
-    if week.year < 2019 or (week.year == 2019 and week.week < 52):
-        return ""
-    else:
-        cum_epi_day = (date - day_one).days + 1
-        return str(cum_epi_day)
-
-
 def update_edin_epi_date_fields(gisaid_json_dict):
     """
     record epi week and epi day by parsing sample
-    collection date
-
-    NB this will break in 2021!
+    collection date (using the shared epi calendar)
     """
-    if 'omitted_date' in gisaid_json_dict['edin_flag']:
+    if has_edin_flag(gisaid_json_dict, 'omitted_date'):
         return(gisaid_json_dict)
 
     collection_date = gisaid_json_dict['covv_collection_date']
 
-    # returns None if nothing found
-    epi_week = date_string_to_epi_week(collection_date)
-    epi_day = date_string_to_epi_day(collection_date)
+    # returns "" if nothing found
+    epi_week, epi_day = date_string_to_epi_week_and_day(collection_date)
 
     if epi_week:
         gisaid_json_dict['edin_epi_week'] = epi_week
@@ -368,7 +294,7 @@ def get_one_metadata_line(dict, fields_list, sep = ','):
 
     l is a 'sep'-separated string formatted for printing
     """
-    l = sep.join([dict[x] for x in fields_list]) + '\n'
+    l = sep.join(metadata_values(dict, fields_list)) + '\n'
     return(l)
 
 
@@ -377,36 +303,14 @@ def fix_seq_in_gisaid_json_dict(gisaid_json_dict):
     strip whitespace and newline characters from the
     ['sequence'] field of a gisaid json object
     """
-
-    def fix_seq(seq):
-        newseq = re.sub(r"\s+", '', seq).replace('\n','')
-        return(newseq)
-
-    newDict = {}
-    for x,y in gisaid_json_dict.items():
-        if x == 'sequence':
-            newDict['sequence'] = fix_seq(y)
-        else:
-            newDict[x] = y
-
-    return(newDict)
+    return(gisaid_common.fix_seq_in_gisaid_json_dict(gisaid_json_dict))
 
 
 def fix_header(header):
     """
     parse fasta header and remove problems
     """
-    fixed_header = header.lstrip()\
-        .replace(' ', '_')\
-        .replace("hCoV-19/","")\
-        .replace("hCov-19/","")\
-        .replace("PENDING", "")\
-        .replace("UPLOADED", "")\
-        .replace("None", "")
-
-    fixed_header = re.sub('^Wuhan-Hu-1','China/Wuhan-Hu-1',fixed_header)
-
-    return(fixed_header)
+    return(gisaid_common.fix_header(header, strip = True, fix_wuhan = True))
 
 
 def add_header_to_json_dict(gisaid_json_dict):
@@ -431,34 +335,13 @@ def parse_omissions_file(file):
     """
     Parse a file of records to omit.
 
-    Relies on there being a regex match to "EPI_ISL_\d{6}" in a line.
+    Relies on there being a regex match to "EPI_ISL_\d{6}" in a line,
+    lines without one are kept as they are (and matched against headers).
 
-    Only returns the first match to the regex
+    Lines starting with "regex:" are regular expressions to match
+    against record headers, and are returned as they are
     """
-    # TO DO: allow regexes to e.g. 'bat', 'pangolin' in the omissions file
-
-    IDs = []
-    regex = re.compile('EPI_ISL_\d{6}')
-    file_is_fasta = file.split('.')[-1][0:2] == 'fa'
-
-    with open(file, 'r') as f:
-        for line in f:
-            if file_is_fasta:
-                if line[0] != '>':
-                    continue
-            elif line.startswith("#"):
-                continue
-            elif len(line.strip()) == 0:
-                continue
-
-            match = re.search(regex, line)
-            if match:
-                ID = match.group()
-                IDs.append(ID)
-            else:
-                IDs.append(line.rstrip())
-
-    return(IDs)
+    return(gisaid_common.parse_omissions_file(file, keep_unmatched_lines = True))
 
 
 def write_metadata_output(output,
@@ -469,23 +352,31 @@ def write_metadata_output(output,
                   fields_list):
 
     """
-    write a csv-format outfile to file
+    write a csv-format outfile to file (or a Parquet/Feather
+    file with typed columns if output ends in .parquet/.feather)
     """
-    out = open(output, 'w')
+    if is_columnar(output):
+        write_metadata_records(temporary_path(output),
+                               chain((old_records_dict[x] for x in old_records_list),
+                                     (new_records_dict[x] for x in new_records_list)),
+                               fields_list)
+        os.replace(temporary_path(output), output)
+        return
 
-    out.write(','.join(fields_list) + '\n')
+    with atomic_open(output) as out:
 
-    for record in old_records_list:
-        do = old_records_dict[record]
-        lo = get_one_metadata_line(dict=do, fields_list=fields_list)
-        out.write(lo)
+        out.write(','.join(fields_list) + '\n')
 
-    for record in new_records_list:
-        dn = new_records_dict[record]
-        ln = get_one_metadata_line(dict=dn, fields_list=fields_list)
-        out.write(ln)
+        for record in old_records_list:
+            do = old_records_dict[record]
+            lo = get_one_metadata_line(dict=do, fields_list=fields_list)
+            out.write(lo)
+
+        for record in new_records_list:
+            dn = new_records_dict[record]
+            ln = get_one_metadata_line(dict=dn, fields_list=fields_list)
+            out.write(ln)
 
-    out.close()
     pass
 
 
@@ -498,9 +389,17 @@ def write_fasta_output(output,
     write the sequences to a fasta file
     """
     if output:
-        out = open(output, 'w')
+        with atomic_open(output) as out:
+            write_fasta_records(out, new_records_list, new_records_dict, old_records_list, old_records_dict)
     else:
-        out = sys.stdout
+        write_fasta_records(sys.stdout, new_records_list, new_records_dict, old_records_list, old_records_dict)
+
+
+def write_fasta_records(out,
+                        new_records_list,
+                        new_records_dict,
+                        old_records_list,
+                        old_records_dict):
 
     for record in old_records_list:
         if old_records_dict[record]['edin_omitted'] == 'True':
@@ -523,12 +422,57 @@ def write_fasta_output(output,
             out.write('>' + header + '\n')
             out.write(seq + '\n')
 
-
-    if output:
-        out.close()
     pass
 
 
+def get_changed_fields(metadata_gisaid_dict, json_gisaid_dict):
+    """
+    the gisaid fields that are different in the new dump
+    and the last iteration of the metadata
+    """
+    return([x for x in _fields_gisaid if metadata_gisaid_dict[x] != json_gisaid_dict[x]])
+
+
+def write_change_feed(output, new_records_list, changed, removed):
+    """
+    write a tsv of what changed since the last run, one line per record:
+
+    covv_accession_id	change	changed_fields
+
+    change is added (not in the last metadata), changed (in it, but
+    with different gisaid fields - which are listed, colon-separated -
+    or in it more than once, with no fields listed) or removed (in the
+    last metadata but not in this dump). Added and changed records are
+    in dump order, then removed records in the order of the last metadata
+    """
+    with atomic_open(output) as out:
+        out.write('covv_accession_id\tchange\tchanged_fields\n')
+        for record in new_records_list:
+            if record in changed:
+                out.write(record + '\tchanged\t' + ':'.join(changed[record]) + '\n')
+            else:
+                out.write(record + '\tadded\t\n')
+        for record in removed:
+            out.write(record + '\tremoved\t\n')
+
+
+def read_change_feed(file):
+    """
+    {'added': [IDs], 'changed': {ID: [fields]}, 'removed': [IDs]}
+    from a change feed written by process_gisaid_data
+    """
+    changes = {'added': [], 'changed': {}, 'removed': []}
+    with open(file, 'r') as f:
+        next(f)
+        for line in f:
+            ID, change, changed_fields = line.rstrip('\n').split('\t')
+            if change == 'changed':
+                changes['changed'][ID] = [x for x in changed_fields.split(':') if x != '']
+            else:
+                changes[change].append(ID)
+    return(changes)
+
+
 def compare_records(metadata_gisaid_dict, json_gisaid_dict):
     """
     check for equality between gisaid fields in the new dump
@@ -568,28 +512,216 @@ def update_edin_omit_field(json_gisaid_dict,
                            exclude_subsampled = True, exclude_omitted_file = True):
 
     if exclude_uk:
-        if 'uk_sequence' in json_gisaid_dict['edin_flag']:
+        if has_edin_flag(json_gisaid_dict, 'uk_sequence'):
             json_gisaid_dict['edin_omitted'] = 'True'
             return(json_gisaid_dict)
 
     if exclude_undated:
-        if 'omitted_date' in json_gisaid_dict['edin_flag']:
+        if has_edin_flag(json_gisaid_dict, 'omitted_date'):
             json_gisaid_dict['edin_omitted'] = 'True'
             return(json_gisaid_dict)
 
     if exclude_subsampled:
-        if 'subsample_omit' in json_gisaid_dict['edin_flag']:
+        if has_edin_flag(json_gisaid_dict, 'subsample_omit'):
             json_gisaid_dict['edin_omitted'] = 'True'
             return(json_gisaid_dict)
 
     if exclude_omitted_file:
-        if 'omitted_file' in json_gisaid_dict['edin_flag']:
+        if has_edin_flag(json_gisaid_dict, 'omitted_file'):
             json_gisaid_dict['edin_omitted'] = 'True'
             return(json_gisaid_dict)
 
     return(json_gisaid_dict)
 
 
+"""Record processing stages
+"""
+
+"""Stages that are run on every record after the built-in ones, as
+(name, function, before) tuples. Add to it with register_stage():
+"""
+_user_stages = []
+
+
+def register_stage(name, function, before = None):
+    """
+    add a stage to the processing of new records. function takes one
+    record dict and returns it. It is run just before the stage called
+    before (or after all the other stages if before is None)
+    """
+    if name in [x[0] for x in _user_stages]:
+        sys.exit('A stage called ' + name + ' has already been registered')
+    _user_stages.append((name, function, before))
+
+
+def unregister_stage(name):
+    """
+    remove a stage added with register_stage()
+    """
+    _user_stages[:] = [x for x in _user_stages if x[0] != name]
+
+
+def load_stage(spec):
+    """
+    import a user stage function from a 'module.path:function' string
+    """
+    if ':' not in spec:
+        sys.exit('Stage ' + spec + ' should be in the format module.path:function')
+    module_name, function_name = spec.split(':', 1)
+    module = importlib.import_module(module_name)
+    return(getattr(module, function_name))
+
+
+def describe_user_stages():
+    """
+    the registered user stages as [name, 'module:function', before] lists,
+    for the checkpoint (they change what is in the records)
+    """
+    described = []
+    for name, function, before in _user_stages:
+        # (a partial is described by the function it wraps)
+        function = getattr(function, 'func', function)
+        described.append([name, str(getattr(function, '__module__', '')) + ':' + getattr(function, '__qualname__', name), before])
+    return(described)
+
+
+def add_user_stages(stages):
+    """
+    insert the registered user stages into a list of (name, function) stages
+    """
+    for name, function, before in _user_stages:
+        names = [x[0] for x in stages]
+        if before is None:
+            stages.append((name, function))
+        elif before in names:
+            stages.insert(names.index(before), (name, function))
+        else:
+            sys.exit('Cannot add stage ' + name + ' before ' + before + ', there is no stage called ' + before)
+    return(stages)
+
+
+def remove_skipped_stages(stages, skip_stages):
+    """
+    drop stages the user asked to skip
+    """
+    if not skip_stages:
+        return(stages)
+
+    names = [x[0] for x in stages]
+    for name in skip_stages:
+        if name not in names:
+            sys.exit('No stage called ' + name + ' to skip. Stages are: ' + ', '.join(names))
+
+    return([x for x in stages if x[0] not in skip_stages])
+
+
+def get_new_record_stages(omitted_IDs, omit_field_options, skip_stages = None):
+    """
+    the stages, in order, that each new record from the gisaid dump goes through,
+    as a list of (name, function) tuples
+    """
+    stages = [('expand_dict', partial(expand_dict,
+                                       fields_list_required = _fields_edin + _fields_gisaid,
+                                       fields_list_optional = fields)),
+              # FIRST THING TO DO: WIPE EDIN_OMITTED
+              ('wipe_edin_omit_field', wipe_edin_omit_field),
+              ('update_edin_date_stamp_field', update_edin_date_stamp_field),
+              ('get_admin_levels_from_json_dict', get_admin_levels_from_json_dict),
+              # include a header field in each dictionary (just for writing the fasta file):
+              ('add_header_to_json_dict', add_header_to_json_dict),
+              ('get_travel_history', get_travel_history),
+              # if gisaid collection date formatted correctly, we can add epi week and epi day
+              ('update_edin_epi_date_fields', update_edin_epi_date_fields),
+              ('check_gisaid_date', check_gisaid_date),
+              ('check_edin_omitted_file', partial(check_edin_omitted_file, omit_set = omitted_IDs)),
+              ('update_UK_sequence', update_UK_sequence),
+              # update omit field for this round of writing records only:
+              ('update_edin_omit_field', partial(update_edin_omit_field, **omit_field_options))]
+
+    stages = add_user_stages(stages)
+
+    return(remove_skipped_stages(stages, skip_stages))
+
+
+def get_old_record_stages(all_records_dict, omit_field_options, skip_stages = None):
+    """
+    the stages, in order, that each unchanged record from the previous metadata
+    goes through, as a list of (name, function) tuples
+    """
+    stages = [('repopulate_sequence_from_new_dump', partial(repopulate_sequence_from_new_dump,
+                                                            all_records_dict = all_records_dict)),
+              ('expand_dict', partial(expand_dict,
+                                       fields_list_required = _fields_edin + _fields_gisaid,
+                                       fields_list_optional = fields)),
+              # FIRST THING TO DO: WIPE EDIN_OMITTED
+              ('wipe_edin_omit_field', wipe_edin_omit_field),
+              # update omit field for this round of writing records only:
+              ('update_edin_omit_field', partial(update_edin_omit_field, **omit_field_options))]
+
+    if skip_stages:
+        skip_stages = [x for x in skip_stages if x in [y[0] for y in stages]]
+
+    return(remove_skipped_stages(stages, skip_stages))
+
+
+def run_stages(record, stages, timings = None):
+    """
+    run one record through every stage. If timings is a dict,
+    the time spent in each stage is added to timings[name]
+    """
+    if timings is None:
+        for name, function in stages:
+            record = function(record)
+        return(record)
+
+    for name, function in stages:
+        start = time.perf_counter()
+        record = function(record)
+        timings[name] += time.perf_counter() - start
+
+    return(record)
+
+
+def run_stages_with_checkpoint(records_list, records_dict, stages, timings, checkpoint, checkpoint_every):
+    """
+    run the stages on each record in records_list, saving the processed
+    records to the checkpoint every checkpoint_every records. Records
+    already in the checkpoint are taken from it instead.
+
+    sequences aren't saved (they're already in the dump), they are put
+    back into the checkpointed records from records_dict
+    """
+    if len(checkpoint) > 0:
+        eprint('resuming: ' + str(len(checkpoint)) + ' records already processed')
+
+    processed = {}
+    chunk = []
+    for x in records_list:
+        if x in checkpoint:
+            processed[x] = checkpoint.records[x]
+            processed[x]['sequence'] = records_dict[x]['sequence']
+            continue
+
+        processed[x] = run_stages(records_dict[x], stages, timings)
+        chunk.append({y: z for y,z in processed[x].items() if y != 'sequence'})
+        if len(chunk) >= checkpoint_every:
+            checkpoint.add(chunk)
+            chunk = []
+
+    checkpoint.add(chunk)
+
+    return(processed)
+
+
+def write_stage_timings(timings):
+    """
+    write the total time spent in each stage to stderr
+    """
+    eprint('stage\tseconds')
+    for name, seconds in timings.items():
+        eprint(name + '\t' + str(round(seconds, 3)))
+
+
 """Program
 """
 def process_gisaid_data(input_json,
@@ -600,22 +732,85 @@ def process_gisaid_data(input_json,
                         exclude_uk,
                         exclude_undated,
                         exclude_subsampled,
-                        exclude_omitted_file):
+                        exclude_omitted_file,
+                        location_cache_file = None,
+                        skip_stages = None,
+                        stage_timings = False,
+                        partition_by = None,
+                        partition_dir = 'partitions',
+                        max_open_files = 64,
+                        change_feed = None,
+                        checkpoint_file = None,
+                        checkpoint_every = 10000,
+                        resume = False):
 
     # logfile = open(output + '.log', 'w')
-    if input_omit_file_list:
-        temp = []
-        for file in input_omit_file_list:
-            temp.extend(parse_omissions_file(file))
+    if location_cache_file:
+        default_location_cache.load(location_cache_file)
 
-        omitted_IDs = set(temp)
-    else:
-        omitted_IDs = False
+    checkpoint = get_checkpoint(checkpoint_file, resume, input_json, input_metadata, input_omit_file_list,
+                                {'exclude_uk': exclude_uk,
+                                 'exclude_undated': exclude_undated,
+                                 'exclude_subsampled': exclude_subsampled,
+                                 'exclude_omitted_file': exclude_omitted_file,
+                                 'skip_stages': skip_stages,
+                                 'add_stages': describe_user_stages()})
+
+    temp_old_records_list, temp_old_records_dict = load_old_metadata(input_metadata)
+
+    all_records = get_json_order_and_record_dict(input_json,
+                                                fields_list_required = _fields_gisaid + _fields_edin,
+                                                fields_list_optional = fields)
 
+    process_gisaid_records(all_records = all_records,
+                           temp_old_records_list = temp_old_records_list,
+                           temp_old_records_dict = temp_old_records_dict,
+                           input_omit_file_list = input_omit_file_list,
+                           output_fasta = output_fasta,
+                           output_metadata = output_metadata,
+                           exclude_uk = exclude_uk,
+                           exclude_undated = exclude_undated,
+                           exclude_subsampled = exclude_subsampled,
+                           exclude_omitted_file = exclude_omitted_file,
+                           skip_stages = skip_stages,
+                           stage_timings = stage_timings,
+                           partition_by = partition_by,
+                           partition_dir = partition_dir,
+                           max_open_files = max_open_files,
+                           change_feed = change_feed,
+                           checkpoint = checkpoint,
+                           checkpoint_every = checkpoint_every)
+
+    if location_cache_file:
+        default_location_cache.save(location_cache_file)
 
+    # logfile.close()
+    pass
+
+
+def get_checkpoint(checkpoint_file, resume, input_json, input_metadata, input_omit_file_list, options):
+    """
+    a record_checkpoint for a run with these inputs, or None if there's no checkpoint_file
+    """
+    if not checkpoint_file:
+        if resume:
+            sys.exit('--resume needs a --checkpoint file to resume from')
+        return(None)
+
+    omit_files = list(input_omit_file_list) if input_omit_file_list else []
+    description = input_description([input_json, input_metadata] + omit_files, options)
+    return(record_checkpoint(checkpoint_file, description, resume = resume))
+
+
+def load_old_metadata(input_metadata):
+    """
+    read the previous metadata (if input_metadata isn't 'False'), adding
+    any extra columns it has to fields. Returns the list of IDs in the
+    order they were in the file and a dict of records
+    """
     if input_metadata != 'False':
         # Check that all required fields were in the csv file
-        csv_header = next(open(input_metadata, 'r')).strip().split(',')
+        csv_header = metadata_header(input_metadata)
         if not all([x in csv_header for x in _fields_gisaid + _fields_edin]):
             sys.exit('There were missing mandatory fields in ' + input_metadata)
 
@@ -637,15 +832,48 @@ def process_gisaid_data(input_json,
         for x in extra_fields:
             fields.append(x)
 
-
     else:
         temp_old_records_list = []
-        old_records_dict = {}
-
-
-    all_records = get_json_order_and_record_dict(input_json,
-                                                fields_list_required = _fields_gisaid + _fields_edin,
-                                                fields_list_optional = fields)
+        temp_old_records_dict = {}
+
+    return(temp_old_records_list, temp_old_records_dict)
+
+
+def process_gisaid_records(all_records,
+                           temp_old_records_list,
+                           temp_old_records_dict,
+                           input_omit_file_list,
+                           output_fasta,
+                           output_metadata,
+                           exclude_uk,
+                           exclude_undated,
+                           exclude_subsampled,
+                           exclude_omitted_file,
+                           skip_stages = None,
+                           stage_timings = False,
+                           partition_by = None,
+                           partition_dir = 'partitions',
+                           max_open_files = 64,
+                           write_fasta = True,
+                           change_feed = None,
+                           checkpoint = None,
+                           checkpoint_every = 10000):
+    """
+    everything process_gisaid_data does after reading its input:
+    all_records is (record_order, all_records_dict, extra_fields) as
+    returned by get_json_order_and_record_dict
+
+    if write_fasta is False no fasta is written at all (rather than
+    to stdout when there's no output_fasta)
+
+    change_feed: file to write the added / changed / removed records to
+
+    checkpoint: a record_checkpoint. New records are saved to it every
+    checkpoint_every records, and records already in it (from a run
+    that is being resumed) aren't processed again. It is removed once
+    the outputs have been written
+    """
+    omitted_IDs = make_omissions_matcher(input_omit_file_list, parse_omissions_file)
 
     all_records_list = all_records[0]
     all_records_dict = all_records[1]
@@ -660,99 +888,65 @@ def process_gisaid_data(input_json,
     # throw this record out of the list of old records - which means that
     # it will get re-processed
 
-    to_remove = []
+    old_record_counts = Counter(temp_old_records_list)
+    to_remove = set()
+    # what has changed since the last run, for the change feed:
+    removed = []
+    changed = {}
     for record in temp_old_records_list:
         # this record might have been removed.
         # so check if it is in all_records_dict before proceeding
         if record not in all_records_dict:
-            to_remove.append(record)
-        elif temp_old_records_list.count(record) > 1:
-            to_remove.append(record)
+            if record not in to_remove:
+                removed.append(record)
+            to_remove.add(record)
+        elif old_record_counts[record] > 1:
+            to_remove.add(record)
+            changed[record] = []
         else:
             old_record = temp_old_records_dict[record]
             new_record = all_records_dict[record]
             is_it_the_same = compare_records(old_record, new_record)
             if is_it_the_same == False:
-                # this could go into a log:
-                # print('\t'.join([old_record[x] for x in _fields_gisaid]))
-                # print('\t'.join([new_record[x] for x in _fields_gisaid]))
-                # print()
-                to_remove.append(record)
-    # this could go into a log:
-    # print('removed because different: '+ str(changecount_diff))
-    # print('removed because deleted: '+ str(changecount_del))
-    # print('removed old = '+str(len(to_remove)))
+                to_remove.add(record)
+                changed[record] = get_changed_fields(old_record, new_record)
 
     old_records_list = [x for x in temp_old_records_list if x not in to_remove]
+    old_records_set = set(old_records_list)
 
+    if stage_timings:
+        timings = defaultdict(float)
+    else:
+        timings = None
 
-    if input_metadata != 'False':
-
-        # repopulate the old records with sequence from the new dump:
-        old_records_dict = {x: repopulate_sequence_from_new_dump(temp_old_records_dict[x], all_records_dict) for x in set(old_records_list)}
-
-        # expand dict to include any extra columns
-        old_records_dict = {x: expand_dict(old_records_dict[x], fields_list_required = _fields_edin + _fields_gisaid, fields_list_optional = fields) for x in old_records_dict.keys()}
-
-        # FIRST THING TO DO: WIPE EDIN_OMITTED
-        old_records_dict = {x: wipe_edin_omit_field(old_records_dict[x]) for x in old_records_dict.keys()}
-
-        # # TEMPORARY THINGS TO DO TO BRING OLD METADATA INLINE WITH NEW METADATA:
-        # old_records_dict = {x: get_admin_levels_from_json_dict(old_records_dict[x]) for x in old_records_dict.keys()}
-        # old_records_dict = {x: get_travel_history(old_records_dict[x]) for x in old_records_dict.keys()}
+    omit_field_options = {'exclude_uk': exclude_uk,
+                          'exclude_undated': exclude_undated,
+                          'exclude_subsampled': exclude_subsampled,
+                          'exclude_omitted_file': exclude_omitted_file}
 
-        # update omit field for this round of writing records only:
-        old_records_dict = {x: update_edin_omit_field(old_records_dict[x],
-                                           exclude_uk = exclude_uk,
-                                           exclude_undated = exclude_undated,
-                                           exclude_subsampled = exclude_subsampled,
-                                           exclude_omitted_file = exclude_omitted_file)
-                                for x in old_records_dict.keys()}
+    old_stages = get_old_record_stages(all_records_dict, omit_field_options, skip_stages)
 
+    # each old record goes through all the stages in one go:
+    old_records_dict = {x: run_stages(temp_old_records_dict[x], old_stages, timings) for x in old_records_set}
 
 
     # get new records out of the new dump:
-    new_records_list = [x for x in all_records_list if x not in set(old_records_list)]
-    new_records_dict = {x: all_records_dict[x] for x in new_records_list}
+    new_records_list = [x for x in all_records_list if x not in old_records_set]
 
-    # expand dict to include any extra columns
-    new_records_dict = {x: expand_dict(new_records_dict[x], fields_list_required = _fields_edin + _fields_gisaid, fields_list_optional = fields) for x in new_records_dict.keys()}
+    new_stages = get_new_record_stages(omitted_IDs, omit_field_options, skip_stages)
 
-    # FIRST THING TO DO: WIPE EDIN_OMITTED
-    new_records_dict = {x: wipe_edin_omit_field(new_records_dict[x]) for x in new_records_dict.keys()}
-
-    # update date stamp field
-    new_records_dict = {x: update_edin_date_stamp_field(new_records_dict[x]) for x in new_records_dict.keys()}
-
-    # update admin level
-    new_records_dict = {x: get_admin_levels_from_json_dict(new_records_dict[x]) for x in new_records_dict.keys()}
-
-    # include a header field in each dictionary (just for writing the fasta file):
-    new_records_dict = {x: add_header_to_json_dict(new_records_dict[x]) for x in new_records_dict.keys()}
-
-    # get travel history
-    new_records_dict = {x: get_travel_history(new_records_dict[x]) for x in new_records_dict.keys()}
-
-    # if gisaid collection date formatted correctly, we can add epi week and epi day
-    new_records_dict = {x: update_edin_epi_date_fields(new_records_dict[x]) for x in new_records_dict.keys()}
-
-    # check gisaid collection date formatted correctly
-    new_records_dict = {x: check_gisaid_date(new_records_dict[x]) for x in new_records_dict.keys()}
-
-    # check if sequence is in omissions file
-    new_records_dict = {x: check_edin_omitted_file(new_records_dict[x], omitted_IDs) for x in new_records_dict.keys()}
+    # each new record goes through all the stages in one go:
+    if checkpoint is None:
+        new_records_dict = {x: run_stages(all_records_dict[x], new_stages, timings) for x in new_records_list}
+    else:
+        new_records_dict = run_stages_with_checkpoint(new_records_list, all_records_dict, new_stages,
+                                                      timings, checkpoint, checkpoint_every)
 
-    # record if sequence is from the UK
-    new_records_dict = {x: update_UK_sequence(new_records_dict[x]) for x in new_records_dict.keys()}
+    if stage_timings:
+        write_stage_timings(timings)
 
-    # update omit field for this round of writing records only:
-    new_records_dict = {x:
-        update_edin_omit_field(new_records_dict[x],
-                                   exclude_uk = exclude_uk,
-                                   exclude_undated = exclude_undated,
-                                   exclude_subsampled = exclude_subsampled,
-                                   exclude_omitted_file = exclude_omitted_file)
-                        for x in new_records_dict.keys()}
+    if change_feed:
+        write_change_feed(change_feed, new_records_list, changed, removed)
 
     if output_metadata:
         write_metadata_output(output = output_metadata,
@@ -763,16 +957,23 @@ def process_gisaid_data(input_json,
                               fields_list = _fields_edin + fields + _fields_gisaid)
 
 
-    write_fasta_output(output = output_fasta,
-                       new_records_list = new_records_list,
-                       new_records_dict = new_records_dict,
-                       old_records_list = old_records_list,
-                       old_records_dict = old_records_dict)
-
+    if write_fasta:
+        write_fasta_output(output = output_fasta,
+                           new_records_list = new_records_list,
+                           new_records_dict = new_records_dict,
+                           old_records_list = old_records_list,
+                           old_records_dict = old_records_dict)
 
+    if partition_by:
+        write_partitioned_output(partition_by = partition_by,
+                                 partition_dir = partition_dir,
+                                 records = chain((old_records_dict[x] for x in old_records_list),
+                                                 (new_records_dict[x] for x in new_records_list)),
+                                 fields_list = _fields_edin + fields + _fields_gisaid,
+                                 max_open_files = max_open_files)
 
-    # logfile.close()
-    pass
+    if checkpoint is not None:
+        checkpoint.remove()
 
 
 
@@ -4,25 +4,15 @@ from datetime import datetime
 import sys
 
 from datafunk.gisaid_json_2_metadata import get_admin_levels_from_json_dict
+from datafunk.omissions import make_omissions_matcher
+from datafunk import gisaid_common
 
 def fix_seq_in_gisaid_json_dict(gisaid_json_dict):
     """
     strip whitespace and newline characters from the
     ['sequence'] field of a gisaid json object
     """
-
-    def fix_seq(seq):
-        newseq = re.sub(r"\s+", '', seq).replace('\n','')
-        return(newseq)
-
-    newDict = {}
-    for x,y in gisaid_json_dict.items():
-        if x == 'sequence':
-            newDict['sequence'] = fix_seq(y)
-        else:
-            newDict[x] = y
-
-    return(newDict)
+    return(gisaid_common.fix_seq_in_gisaid_json_dict(gisaid_json_dict))
 
 
 def get_ID_from_json_dict(gisaid_json_dict):
@@ -56,14 +46,7 @@ def fix_header(header):
     """
     parse fasta header and remove problems
     """
-    fixed_header = header.replace(' ', '_')\
-        .replace("hCoV-19/","")\
-        .replace("hCov-19/","")\
-        .replace("PENDING", "")\
-        .replace("UPLOADED", "")\
-        .replace("None", "")
-
-    return(fixed_header)
+    return(gisaid_common.fix_header(header, strip = False, fix_wuhan = False))
 
 
 def parse_omissions_file(file):
@@ -73,26 +56,11 @@ def parse_omissions_file(file):
     Relies on there being a regex match to "EPI_ISL_\d{6}" in a line.
 
     Only returns the first match to the regex
+
+    Lines starting with "regex:" are regular expressions to match
+    against record headers, and are returned as they are
     """
-    # TO DO: allow regexes to e.g. 'bat', 'pangolin' in the omissions file
-
-    IDs = []
-    regex = re.compile('EPI_ISL_\d{6}')
-    file_is_fasta = file.split('.')[-1][0:2] == 'fa'
-
-    with open(file, 'r') as f:
-        for line in f:
-            if file_is_fasta:
-                if line[0] != '>':
-                    continue
-            elif line.startswith("#"):
-                continue
-            match = re.search(regex, line)
-            if match:
-                ID = match.group()
-                IDs.append(ID)
-
-    return(IDs)
+    return(gisaid_common.parse_omissions_file(file))
 
 def keep_entry(header, omitted=False, exclude_uk=False, exclude_undated=False):
     if omitted:
@@ -102,7 +70,9 @@ def keep_entry(header, omitted=False, exclude_uk=False, exclude_undated=False):
             return False
         epi_id = match.group()
 
-        if epi_id in omitted:
+        # omitted is an omissions_matcher: check the ID, then scan the header
+        # once for any of the omissions file entries
+        if epi_id in omitted or omitted.search(header):
             return False
 
     if exclude_uk:
@@ -120,6 +90,18 @@ def keep_entry(header, omitted=False, exclude_uk=False, exclude_undated=False):
     return True
 
 
+def get_fasta_entry_from_json_dict(gisaid_json_dict, omitted = False, exclude_uk = False, exclude_undated = False):
+    """
+    the fasta entry ('>header\nsequence\n') to write for one (already parsed)
+    record from a GISAID json dump, or None if it is excluded
+    """
+    jsonDict = fix_seq_in_gisaid_json_dict(gisaid_json_dict)
+    header = get_ID_from_json_dict(jsonDict)
+    if keep_entry(header, omitted, exclude_uk, exclude_undated):
+        return('>' + fix_header(header) + '\n' + jsonDict['sequence'] + '\n')
+    return(None)
+
+
 def process_gisaid_sequence_data(input, output = False, omit_file_list = False, exclude_uk = False, exclude_undated = False):
 
     def input_fasta_output(input, output, omitted, exclude_uk, exclude_undated):
@@ -145,24 +127,15 @@ def process_gisaid_sequence_data(input, output = False, omit_file_list = False,
             out = sys.stdout
         with open(input, 'r') as f:
                 for jsonObj in f:
-                    jsonDict = fix_seq_in_gisaid_json_dict(json.loads(jsonObj))
-                    header = get_ID_from_json_dict(jsonDict)
-                    if keep_entry(header, omitted, exclude_uk, exclude_undated):
-                        out.write('>' + fix_header(header) + '\n')
-                        out.write(jsonDict['sequence'] + '\n')
+                    entry = get_fasta_entry_from_json_dict(json.loads(jsonObj), omitted, exclude_uk, exclude_undated)
+                    if entry:
+                        out.write(entry)
         if output:
             out.close()
         pass
 
 
-    if omit_file_list:
-        temp = []
-        for file in omit_file_list:
-            temp.extend(parse_omissions_file(file))
-
-        omitted_IDs = set(temp)
-    else:
-        omitted_IDs = False
+    omitted_IDs = make_omissions_matcher(omit_file_list, parse_omissions_file)
 
     input_is_fasta = input.split('.')[-1][0:2].lower() == 'fa'
     input_is_json = input.split('.')[-1].lower() == 'json'
@@ -4,6 +4,8 @@ import re
 from Bio import SeqIO
 import sys
 
+from datafunk.columnar import load_metadata_dataframe, save_metadata_dataframe
+
 def strip_nasties(name):
     return name.lstrip()\
         .replace(" ","_")\
@@ -21,7 +23,7 @@ def load_dataframe(metadata_file):
     sep = ','
     if metadata_file.endswith('tsv'):
         sep = '\t'
-    df = pd.read_csv(metadata_file, sep=sep)
+    df = load_metadata_dataframe(metadata_file, sep=sep)
     return df
 
 def add_header_column(df, columns, column_name='sequence_name', extended=False):
@@ -180,7 +182,7 @@ def set_uniform_header(input_fasta, input_metadata, output_fasta, output_metadat
                     SeqIO.write(record, out_fasta, "fasta-2line")
 
 
-    metadata.to_csv(output_metadata, index=False)
+    save_metadata_dataframe(metadata, output_metadata)
 
     if log_handle:
         log_handle.close()
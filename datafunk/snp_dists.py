@@ -0,0 +1,240 @@
+"""
+pairwise SNP distances between all the sequences in an alignment: the number
+of sites where both sequences are A, C, G or T and they differ (the same
+comparison as distance_to_root.get_pairwise_difference).
+
+only the sites where more than one of A, C, G and T is found in the alignment
+can add to a distance, so the alignment is read once to find them and again to
+keep just those sites. Each sequence is held as three bit masks over those
+sites, packed into 64 bit words: where it is ACGT (valid), and the two bits of
+the base (A = 00, C = 01, G = 10, T = 11). The distance between two sequences
+is then popcount(valid1 & valid2 & ((low1 ^ low2) | (high1 ^ high2))).
+Distances are worked out a block of sequences against a block of sequences
+at a time, spread over processes.
+
+the output is either a long format tsv (sequence_1, sequence_2, distance,
+one line per pair) or a compressed numpy .npz file
+"""
+
+from Bio.SeqIO.FastaIO import SimpleFastaParser
+import numpy as np
+import sys
+
+from datafunk.distance_to_root import encode_sequences
+from datafunk.batches import iterate_fasta_batches, map_batches
+
+
+output_formats = ['tsv', 'npz']
+
+_masks = None
+
+popcount_table = np.array([bin(i).count('1') for i in range(256)], dtype = np.uint8)
+
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def popcount(words):
+    """
+    number of set bits along the last axis of an array of uint64 words
+    """
+    if hasattr(np, 'bitwise_count'):
+        return(np.bitwise_count(words).sum(axis = -1, dtype = np.int64))
+    return(popcount_table[words.view(np.uint8)].sum(axis = -1, dtype = np.int64))
+
+
+def pack_masks(codes):
+    """
+    (3, sequences, words) array of uint64 bit masks of where each sequence
+    (a row of nucleotide codes) is ACGT, and the low and high bits of the base
+    """
+    words = (codes.shape[1] + 63) // 64
+    valid = codes != 0
+    bases = np.where(valid, codes - 1, 0)
+    masks = np.zeros((3, codes.shape[0], words * 8), dtype = np.uint8)
+    for i, bits in enumerate([valid, bases & 1, bases >> 1]):
+        packed = np.packbits(bits, axis = 1)
+        masks[i, :, :packed.shape[1]] = packed
+    return(masks.view(np.uint64))
+
+
+def get_alignment_length(fasta_file):
+    """
+    the length of the first sequence in an alignment
+    """
+    with open(fasta_file, 'r') as f:
+        for title, seq in SimpleFastaParser(f):
+            return(len(seq))
+    sys.exit('no sequences in ' + fasta_file)
+
+
+def encode_batch(batch):
+    """
+    batch is a list of (ID, sequence). Returns (ids, matrix of nucleotide codes)
+    """
+    return(([x[0] for x in batch], encode_sequences([x[1] for x in batch], len(batch[0][1]))))
+
+
+def iterate_chunks(fasta_file, chunk_size = 1000):
+    """
+    yield (ids, matrix of nucleotide codes) for chunk_size sequences at a time
+    """
+    batches = iterate_fasta_batches(fasta_file, get_alignment_length(fasta_file), chunk_size)
+    return(map_batches(encode_batch, batches, length_error = 'unequal sequence lengths'))
+
+
+def get_variable_sites(fasta_file, chunk_size = 1000):
+    """
+    the sites where more than one of A, C, G and T is found in the alignment
+    """
+    found = None
+    for ids, codes in iterate_chunks(fasta_file, chunk_size):
+        if found is None:
+            found = np.zeros((5, codes.shape[1]), dtype = bool)
+        for i in range(1, 5):
+            found[i] |= (codes == i).any(axis = 0)
+
+    return(np.flatnonzero(found[1:].sum(axis = 0) > 1))
+
+
+def read_alignment(fasta_file, chunk_size = 1000):
+    """
+    the ids of the sequences in an alignment, and their bit masks at the variable
+    sites. Sequences are encoded a chunk at a time, so the whole alignment isn't
+    held as text
+    """
+    sites = get_variable_sites(fasta_file, chunk_size)
+
+    all_ids = []
+    chunks = []
+    for ids, codes in iterate_chunks(fasta_file, chunk_size):
+        all_ids.extend(ids)
+        chunks.append(pack_masks(codes[:, sites]))
+
+    return(all_ids, np.concatenate(chunks, axis = 1), len(sites))
+
+
+def set_masks(masks):
+    global _masks
+    _masks = masks
+
+
+def get_block_distances(masks, rows, columns):
+    """
+    distances between the sequences in the slice rows and the sequences in the slice columns
+    """
+    row_masks = masks[:, rows, np.newaxis, :]
+    column_masks = masks[:, np.newaxis, columns, :]
+
+    different = (row_masks[1] ^ column_masks[1]) | (row_masks[2] ^ column_masks[2])
+
+    return(popcount(row_masks[0] & column_masks[0] & different))
+
+
+def get_block(block):
+    """
+    block is (start of the rows, start of the columns, block size), run with the
+    masks set by set_masks (so they're only sent to each process once)
+    """
+    i, j, block_size = block
+    return((i, j, get_block_distances(_masks, slice(i, i + block_size), slice(j, j + block_size))))
+
+
+def iterate_row_blocks(masks, threads = 1, block_size = 64):
+    """
+    yield (first row, distances from those rows to every sequence) for each block of rows.
+    Only the blocks on or above the diagonal are worked out, the rest are mirrored from them
+    """
+    n = masks.shape[1]
+    blocks = [(i, j, block_size) for i in range(0, n, block_size) for j in range(i, n, block_size)]
+
+    strips = {}
+    for i, j, distances in map_batches(get_block, blocks, threads, initializer = set_masks, initargs = (masks,)):
+        if i not in strips:
+            strips[i] = np.zeros((min(block_size, n - i), n), dtype = np.int64)
+        strips[i][:, j:j + distances.shape[1]] = distances
+        if j + distances.shape[1] == n:
+            strip = strips.pop(i)
+            yield((i, strip))
+
+
+def write_tsv(output, ids, row_blocks, threshold = None):
+    """
+    one line per pair of sequences (each pair once),
+    only the pairs at most threshold apart if there is one
+    """
+    out = open(output, 'w')
+    out.write('sequence_1\tsequence_2\tdistance\n')
+
+    for i, strip in row_blocks:
+        for k in range(strip.shape[0]):
+            row = i + k
+            distances = strip[k, row + 1:]
+            if threshold is None:
+                columns = np.arange(len(distances))
+            else:
+                columns = np.flatnonzero(distances <= threshold)
+            out.write(''.join([ids[row] + '\t' + ids[row + 1 + c] + '\t' + str(d) + '\n' for c, d in zip(columns, distances[columns])]))
+
+    out.close()
+
+
+def write_npz(output, ids, row_blocks, length, threshold = None):
+    """
+    without a threshold, the full matrix (ids, distances). With one,
+    just the pairs at most threshold apart (ids, and arrays i, j, distance)
+    """
+    n = len(ids)
+    dtype = np.uint16 if length < 2**16 else np.uint32
+
+    if threshold is None:
+        matrix = np.zeros((n, n), dtype = dtype)
+        for i, strip in row_blocks:
+            # only the columns from i on were worked out, the rest are mirrored from them
+            matrix[i:i + strip.shape[0], i:] = strip[:, i:]
+            matrix[i:, i:i + strip.shape[0]] = strip[:, i:].T
+        np.savez_compressed(output, ids = np.array(ids), distances = matrix)
+        return
+
+    pairs_i = []
+    pairs_j = []
+    pairs_distance = []
+    for i, strip in row_blocks:
+        for k in range(strip.shape[0]):
+            row = i + k
+            distances = strip[k, row + 1:]
+            columns = np.flatnonzero(distances <= threshold)
+            pairs_i.append(np.full(len(columns), row, dtype = np.int64))
+            pairs_j.append(columns + row + 1)
+            pairs_distance.append(distances[columns].astype(dtype))
+
+    np.savez_compressed(output,
+                        ids = np.array(ids),
+                        i = np.concatenate(pairs_i),
+                        j = np.concatenate(pairs_j),
+                        distance = np.concatenate(pairs_distance))
+
+
+def get_output_format(output, output_format = None):
+    if output_format:
+        return(output_format)
+    if output.lower().endswith('.npz'):
+        return('npz')
+    return('tsv')
+
+
+def snp_dists(fasta_file, output, threshold = None, output_format = None, threads = 1, block_size = 64):
+    output_format = get_output_format(output, output_format)
+    if output_format not in output_formats:
+        sys.exit('Unknown output format ' + output_format + ', choose from ' + ', '.join(output_formats))
+
+    ids, masks, length = read_alignment(fasta_file)
+    eprint('Read ' + str(len(ids)) + ' sequences with ' + str(length) + ' variable sites from ' + fasta_file)
+
+    row_blocks = iterate_row_blocks(masks, threads, block_size)
+
+    if output_format == 'tsv':
+        write_tsv(output, ids, row_blocks, threshold)
+    else:
+        write_npz(output, ids, row_blocks, length, threshold)
@@ -1,55 +1,82 @@
-import argparse
-import collections
-from Bio import AlignIO
 from Bio import SeqIO
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from Bio.SeqIO.FastaIO import SimpleFastaParser
 import os
 import csv
 import sys
 
 cwd = os.getcwd()
 
-def find_snp(ref, member, position):
+def get_column_map(ref):
+    """
+    reference position (1-based, ignoring gaps in the reference) -> alignment column.
+    A position followed by gaps in the reference maps to the last of those gaps
+    """
+    column_map = {}
     index = 0
-    snp = ""
     for i in range(len(ref)):
         if ref[i] != '-':
             index += 1
+        column_map[index] = i
+    return column_map
 
-        if index == position:
-            col = [ref[i], member[i]]
-            snp = f"{col[1].upper()}"
-    return snp
 
+def get_snp_label(nucleotide, label_dict):
+    """
+    the label of a nucleotide, or "X" if it isn't one of the nucleotides in label_dict
+    """
+    if nucleotide in label_dict:
+        return label_dict[nucleotide]
+    return "X"
 
-def get_reference(aln):
+
+def get_reference(alignment_file):
+    """
+    the (last) record in the alignment with WH04 in its id, or WH04 from
+    the resources if there isn't one. Only this record's sequence is kept
+    """
     reference = None
-    for record in aln:
-        if "WH04" in record.id:
-            reference = record
+    with open(alignment_file) as f:
+        for title, seq in SimpleFastaParser(f):
+            id = title.split(None, 1)[0] if title else ''
+            if "WH04" in id:
+                reference = SeqRecord(Seq(seq), id = id)
     if reference is None:
         reference = SeqIO.read(os.path.dirname(os.path.realpath(__file__)) + '/resources/WH04_aligned.fa', 'fasta')
-    if aln.get_alignment_length() != len(reference.seq):
-        sys.stderr.write('Error: reference length is different from alignment length - have you trimmed already?!')
-        sys.exit(-1)
     return reference
 
 
-def get_all_snps(alignment_file, snp, position, outfile, label_dict):
-    aln = AlignIO.read(alignment_file, "fasta")
-
-    reference = get_reference(aln)
-    if reference is None:
-        sys.stderr.write('Error: couldnt find ref in file')
+def check_length(seq, reference):
+    if len(seq) != len(reference.seq):
+        sys.stderr.write('Error: reference length is different from alignment length - have you trimmed already?!')
         sys.exit(-1)
-    snp_dict = {}
-    for record in aln:
-        if record.id != reference.id:
-            nucleotide = find_snp(reference.seq, record.seq, position)
-            if nucleotide in label_dict:
-                snp_dict[record.id] = label_dict[nucleotide]
-            else:
-                snp_dict[record.id] = "X"
-    return snp_dict
+
+
+def get_all_snps(alignment_file, snps):
+    """
+    snps is a list of (position, label_dict). Reads the alignment once, and
+    returns the labels of every snp for each record: record id -> list of labels
+    ("X" if the nucleotide at a position isn't in its label_dict)
+    """
+    reference = get_reference(alignment_file)
+    ref = str(reference.seq)
+    column_map = get_column_map(ref)
+    columns = [column_map.get(position) for position, label_dict in snps]
+
+    tax_dict = {}
+    with open(alignment_file) as f:
+        for title, seq in SimpleFastaParser(f):
+            id = title.split(None, 1)[0] if title else ''
+            check_length(seq, reference)
+            if id == reference.id:
+                continue
+            labels = []
+            for column, (position, label_dict) in zip(columns, snps):
+                nucleotide = seq[column].upper() if column is not None else ""
+                labels.append(get_snp_label(nucleotide, label_dict))
+            tax_dict[id] = labels
+    return tax_dict
 
 
 def read_alignment_and_get_snps(alignment, snp_csv, outfile):
@@ -70,7 +97,7 @@ def read_alignment_and_get_snps(alignment, snp_csv, outfile):
 
     with open(outfile, "w") as fw:
 
-        tax_dict = collections.defaultdict(list)
+        snps = []
         header = "name,"
 
         with open(snp_file, newline="") as csvfile:
@@ -91,13 +118,15 @@ def read_alignment_and_get_snps(alignment, snp_csv, outfile):
                     print(f"Nuc: {k}, Label:{label_dict[k]}")
 
                 location = int(row["location"])
-                snp_dict = get_all_snps(alignment_file, row["name"], location, fw, label_dict)
-                for record in snp_dict:
-                    tax_dict[record].append(snp_dict[record])
-
-            header = header.rstrip(',')
-            fw.write(f"{header}\n")
-            for record in tax_dict:
-                snps = ",".join(tax_dict[record])
-                line = f"{record},{snps}\n"
-                fw.write(line)
+                snps.append((location, label_dict))
+
+        tax_dict = {}
+        if len(snps) > 0:
+            tax_dict = get_all_snps(alignment_file, snps)
+
+        header = header.rstrip(',')
+        fw.write(f"{header}\n")
+        for record in tax_dict:
+            labels = ",".join(tax_dict[record])
+            line = f"{record},{labels}\n"
+            fw.write(line)
@@ -0,0 +1,241 @@
+"""
+a compact form of an alignment to a reference (Wuhan-Hu-1 by default): each
+sequence is kept as its differences from the reference, instead of all of it.
+
+the sparse alignment is a tsv file (gzipped if its name ends in .gz). The first
+line is the reference it was made against (its ID and a hash of its sequence,
+like distance_cache.reference_id) and the alignment length, then a header, then
+one line per sequence:
+
+#reference	MN908947.3:<sha1>	29903
+sequence_name	substitutions	N	gaps
+seq1	241T,3037T,23403G	1-54,29837-29903	21765-21770
+
+substitutions are <1-based position><base> for every site that isn't the same
+as the reference (and isn't N or -), in order. N and gaps are the 1-based
+inclusive intervals of Ns and -s in the sequence. Sequences are upper case.
+
+sequences can be read straight from the sparse form (sparse_sequence), and
+compared with each other there (get_snp_distance) without making the whole
+sequence
+"""
+
+from Bio import SeqIO
+import numpy as np
+from bisect import bisect_right
+import gzip
+import sys
+
+from datafunk.batches import iterate_fasta_batches, map_batches
+from datafunk.del_finder import WuhanHu1
+from datafunk.distance_cache import reference_id
+
+
+_reference = None
+
+
+class sparse_sequence():
+    """
+    a sequence as its substitutions ({1-based position: base}) and its
+    intervals of N and gaps ([(1-based start, inclusive end)], in order)
+    """
+
+    def __init__(self, ID, substitutions, N, gaps):
+        self.ID = ID
+        self.substitutions = substitutions
+        self.N = N
+        self.gaps = gaps
+
+    def get_base(self, position, reference):
+        """
+        the base at a 1-based position, where reference is the reference sequence
+        """
+        if position in self.substitutions:
+            return(self.substitutions[position])
+        for intervals, base in [(self.N, 'N'), (self.gaps, '-')]:
+            i = bisect_right(intervals, (position, float('inf'))) - 1
+            if i >= 0 and intervals[i][1] >= position:
+                return(base)
+        return(reference[position - 1])
+
+    def get_sequence(self, reference):
+        """
+        the whole sequence, where reference is the reference sequence
+        """
+        seq = bytearray(reference.encode('ascii'))
+        for intervals, base in [(self.N, b'N'), (self.gaps, b'-')]:
+            for start, end in intervals:
+                seq[start - 1:end] = base * (end - start + 1)
+        for position, base in self.substitutions.items():
+            seq[position - 1] = ord(base)
+        return(seq.decode('ascii'))
+
+
+def get_snp_distance(seq1, seq2, reference):
+    """
+    the number of sites where both sparse sequences are A, C, G or T and they
+    differ (the same as distance_to_root.get_pairwise_difference). Only sites
+    where at least one of them has a substitution can differ
+    """
+    distance = 0
+    for position in set(seq1.substitutions) | set(seq2.substitutions):
+        base1 = seq1.get_base(position, reference)
+        base2 = seq2.get_base(position, reference)
+        if base1 != base2 and base1 in 'ACGT' and base2 in 'ACGT':
+            distance += 1
+    return(distance)
+
+
+def format_intervals(intervals):
+    return(','.join([str(start) + '-' + str(end) for start, end in intervals]))
+
+
+def parse_intervals(field):
+    if field == '':
+        return([])
+    intervals = []
+    for x in field.split(','):
+        start, end = x.split('-')
+        intervals.append((int(start), int(end)))
+    return(intervals)
+
+
+def format_sparse_sequence(seq):
+    return('\t'.join([seq.ID,
+                      ','.join([str(position) + base for position, base in sorted(seq.substitutions.items())]),
+                      format_intervals(seq.N),
+                      format_intervals(seq.gaps)]) + '\n')
+
+
+def parse_sparse_line(line):
+    ID, substitutions, N, gaps = line.rstrip('\n').split('\t')
+    if substitutions == '':
+        substitutions = {}
+    else:
+        substitutions = {int(x[:-1]): x[-1] for x in substitutions.split(',')}
+    return(sparse_sequence(ID, substitutions, parse_intervals(N), parse_intervals(gaps)))
+
+
+def open_sparse(file, mode):
+    if file.endswith('.gz'):
+        return(gzip.open(file, mode + 't'))
+    return(open(file, mode))
+
+
+def read_sparse_header(f):
+    """
+    (reference ID, alignment length) from the first lines of an open sparse alignment
+    """
+    l = f.readline().rstrip('\n').split('\t')
+    if len(l) != 3 or l[0] != '#reference':
+        sys.exit('Error: not a sparse alignment')
+    f.readline()
+    return(l[1], int(l[2]))
+
+
+def iterate_sparse_sequences(f):
+    """
+    the sparse_sequences in an open sparse alignment, after its header
+    """
+    for line in f:
+        if line.strip() != '':
+            yield(parse_sparse_line(line))
+
+
+def get_runs(mask):
+    """
+    every run of True in each row of a matrix, as arrays of
+    (row, 1-based start, 1-based inclusive end)
+    """
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype = np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis = 1)
+
+    # (the flat indices go along each row in turn, so the starts and ends pair up)
+    rows, starts = np.divmod(np.flatnonzero(edges == 1), edges.shape[1])
+    ends = np.flatnonzero(edges == -1) % edges.shape[1]
+
+    return(rows, starts + 1, ends)
+
+
+def group_by_row(n, rows, *columns):
+    """
+    the lists of values in columns for each of n rows
+    (rows is sorted, like np.nonzero gives)
+    """
+    bounds = np.searchsorted(rows, np.arange(n + 1))
+    columns = [x.tolist() for x in columns]
+    return([list(zip(*[x[bounds[i]:bounds[i + 1]] for x in columns])) for i in range(n)])
+
+
+def set_reference(reference):
+    global _reference
+    _reference = reference
+
+
+def encode_batch(batch):
+    """
+    batch is a list of (ID, sequence). Returns a list of sparse_sequences,
+    compared to the reference set by set_reference
+    """
+    length = len(_reference)
+    matrix = np.frombuffer(''.join([x[1] for x in batch]).upper().encode('ascii', 'replace'),
+                           dtype = np.uint8).reshape(len(batch), length)
+    reference = np.frombuffer(_reference.encode('ascii'), dtype = np.uint8)
+
+    N = matrix == ord('N')
+    gaps = matrix == ord('-')
+    substituted = (matrix != reference) & ~N & ~gaps
+
+    rows, positions = np.divmod(np.flatnonzero(substituted), length)
+    substitutions = group_by_row(len(batch), rows, positions + 1, matrix[rows, positions])
+    N_runs = group_by_row(len(batch), *get_runs(N))
+    gap_runs = group_by_row(len(batch), *get_runs(gaps))
+
+    return([sparse_sequence(ID, {position: chr(base) for position, base in substitutions[i]}, N_runs[i], gap_runs[i])
+            for i, (ID, seq) in enumerate(batch)])
+
+
+def get_reference(reference_file = None):
+    if reference_file:
+        return(SeqIO.read(reference_file, 'fasta'))
+    return(WuhanHu1)
+
+
+def sparse_encode(fasta_in, sparse_out, reference_file = None, threads = 1, batch_size = 1000):
+    """
+    write the alignment fasta_in (to the reference in reference_file, or
+    Wuhan-Hu-1) as a sparse alignment
+    """
+    reference = get_reference(reference_file)
+    reference_seq = str(reference.seq).upper()
+
+    batches = iterate_fasta_batches(fasta_in, len(reference_seq), batch_size)
+
+    out = open_sparse(sparse_out, 'w')
+    out.write('#reference\t' + reference_id(reference) + '\t' + str(len(reference_seq)) + '\n')
+    out.write('sequence_name\tsubstitutions\tN\tgaps\n')
+
+    for batch in map_batches(encode_batch, batches, threads, initializer = set_reference, initargs = (reference_seq,)):
+        out.write(''.join([format_sparse_sequence(x) for x in batch]))
+
+    out.close()
+
+
+def sparse_decode(sparse_in, fasta_out, reference_file = None):
+    """
+    write the sparse alignment sparse_in (made against the reference in
+    reference_file, or Wuhan-Hu-1) as an aligned fasta file
+    """
+    reference = get_reference(reference_file)
+    reference_seq = str(reference.seq).upper()
+
+    with open_sparse(sparse_in, 'r') as f:
+        ID, length = read_sparse_header(f)
+        if ID != reference_id(reference) or length != len(reference_seq):
+            sys.exit('Error: ' + sparse_in + ' was made against a different reference (' + ID + ')')
+
+        out = open(fasta_out, 'w')
+        for seq in iterate_sparse_sequences(f):
+            out.write('>' + seq.ID + '\n' + seq.get_sequence(reference_seq) + '\n')
+        out.close()
@@ -0,0 +1,7 @@
+from datafunk.aa_mutations import *
+
+def run(options):
+    aa_mutations(fasta_in = options.fasta_in,
+                 output = options.output,
+                 threads = options.threads,
+                 batch_size = options.batch_size)
@@ -5,5 +5,6 @@ def run(options):
                  out_metadata = options.output_metadata,
                  date_column = options.date_column,
                  epi_week_column_name = options.epi_week_column_name,
-                 epi_day_column_name = options.epi_day_column_name
+                 epi_day_column_name = options.epi_day_column_name,
+                 chunk_size = options.chunk_size
                 )
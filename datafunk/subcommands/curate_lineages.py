@@ -1,4 +1,4 @@
 from datafunk.curate_lineages import *
 
 def run(options):
-    curate_lineages(options.input_directory, options.output_file)
+    curate_lineages(options.input_directory, options.output_file, options.previous_file)
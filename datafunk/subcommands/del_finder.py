@@ -1,6 +1,17 @@
 from datafunk.del_finder import *
 
 def run(options):
+    if options.discover_file:
+        find_deletions(fasta_in = options.fasta_in,
+                       table_out = options.discover_file,
+                       min_count = options.min_count,
+                       examples = options.examples,
+                       threads = options.threads)
+        return
+
+    if not options.del_file or not options.genotypes_file:
+        sys.exit("Error: --deletions-file and --genotypes-table are needed to type deletions (or use --discover to find them).")
+
     if options.append_snp and not options.fasta_out:
         sys.exit("Error: If you want to append deletions as SNPs, you need to specify a fasta file to write. Use --output-fasta or -o.")
 
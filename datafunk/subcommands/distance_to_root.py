@@ -2,4 +2,8 @@ from datafunk.distance_to_root import *
 
 def run(options):
     distance_to_root(fasta_file = options.fasta_in,
-                     metadata_file = options.metadata_in)
+                     metadata_file = options.metadata_in,
+                     threads = options.threads,
+                     batch_size = options.batch_size,
+                     group_by = options.group_by,
+                     cache_file = options.cache_file)
@@ -0,0 +1,11 @@
+from datafunk.fetch_gisaid import *
+
+def run(options):
+    fetch_gisaid(input_json = options.json,
+                 output = options.output,
+                 accessions = options.accessions,
+                 accession_file = options.accession_file,
+                 virus_names = options.virus_names,
+                 virus_name_file = options.virus_name_file,
+                 output_format = options.output_format,
+                 index_file = options.index)
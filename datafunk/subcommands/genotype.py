@@ -0,0 +1,8 @@
+from datafunk.genotype import *
+
+def run(options):
+    genotype(fasta_in = options.fasta_in,
+             variants_file = options.variants_file,
+             genotypes_file = options.genotypes_file,
+             output_format = options.output_format,
+             threads = options.threads)
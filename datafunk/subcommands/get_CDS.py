@@ -3,4 +3,7 @@ from datafunk.get_CDS import *
 def run(options):
     get_CDS(fasta_in = options.fasta_in,
             fasta_out = options.fasta_out,
-            translate = options.translate)
+            translate = options.translate,
+            gene_prefix = options.gene_prefix,
+            gff3_file = options.gff3_file,
+            batch_size = options.batch_size)
@@ -0,0 +1,5 @@
+from datafunk.index_gisaid import *
+
+def run(options):
+    index_gisaid(input_json = options.json,
+                 index_file = options.index)
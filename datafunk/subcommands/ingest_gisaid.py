@@ -0,0 +1,27 @@
+from datafunk.ingest_gisaid import *
+
+def run(options):
+    ingest_gisaid(input_json = options.json,
+                  input_omit_file_list = options.exclude,
+                  input_metadata = options.input_metadata,
+                  output_fasta = options.output_fasta,
+                  output_metadata = options.output_metadata,
+                  output_sequences = options.output_sequences,
+                  output_json_metadata = options.output_json_metadata,
+                  json_metadata_csv = options.json_metadata_csv,
+                  lineages = options.lineages,
+                  exclude_uk = options.exclude_uk,
+                  exclude_undated = options.exclude_undated,
+                  exclude_subsampled = not(options.include_subsampled),
+                  exclude_omitted_file = not(options.include_omitted_file),
+                  location_cache_file = options.location_cache,
+                  skip_stages = options.skip_stage,
+                  add_stages = options.add_stage,
+                  stage_timings = options.stage_timings,
+                  partition_by = options.partition_by,
+                  partition_dir = options.partition_dir,
+                  max_open_files = options.max_open_files,
+                  change_feed = options.change_feed,
+                  checkpoint_file = options.checkpoint,
+                  checkpoint_every = options.checkpoint_every,
+                  resume = options.resume)
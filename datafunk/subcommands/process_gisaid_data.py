@@ -1,6 +1,10 @@
 from datafunk.process_gisaid_data import *
 
 def run(options):
+    if options.add_stage:
+        for spec in options.add_stage:
+            register_stage(name = spec, function = load_stage(spec))
+
     process_gisaid_data(input_json=options.json,
                         input_omit_file_list=options.exclude,
                         input_metadata=options.input_metadata,
@@ -9,4 +13,14 @@ def run(options):
                         exclude_uk=options.exclude_uk,
                         exclude_undated=options.exclude_undated,
                         exclude_subsampled = not(options.include_subsampled),
-                        exclude_omitted_file = not(options.include_omitted_file))
+                        exclude_omitted_file = not(options.include_omitted_file),
+                        location_cache_file = options.location_cache,
+                        skip_stages = options.skip_stage,
+                        stage_timings = options.stage_timings,
+                        partition_by = options.partition_by,
+                        partition_dir = options.partition_dir,
+                        max_open_files = options.max_open_files,
+                        change_feed = options.change_feed,
+                        checkpoint_file = options.checkpoint,
+                        checkpoint_every = options.checkpoint_every,
+                        resume = options.resume)
@@ -0,0 +1,9 @@
+from datafunk.snp_dists import *
+
+def run(options):
+    snp_dists(fasta_file = options.fasta_in,
+              output = options.output,
+              threshold = options.threshold,
+              output_format = options.output_format,
+              threads = options.threads,
+              block_size = options.block_size)
@@ -0,0 +1,6 @@
+from datafunk.sparse_alignment import *
+
+def run(options):
+    sparse_decode(sparse_in = options.sparse_in,
+                  fasta_out = options.fasta_out,
+                  reference_file = options.reference_file)
@@ -0,0 +1,8 @@
+from datafunk.sparse_alignment import *
+
+def run(options):
+    sparse_encode(fasta_in = options.fasta_in,
+                  sparse_out = options.sparse_out,
+                  reference_file = options.reference_file,
+                  threads = options.threads,
+                  batch_size = options.batch_size)
@@ -1,13 +1,26 @@
+"""
+travel history from the free text in covv_add_host_info.
+
+every place name we know about (countries, subdivisions, cities and some
+aliases / misspellings), including names of more than one word, is compiled
+once into a trie of lower case words, with the country each place is in
+already worked out. The text is split into words and scanned once, looking
+for every name that starts at each word.
+
+the same travel text turns up in many records, so the places found in each
+distinct string are cached
+"""
+
 import pycountry
 import pandas as pd
 import os
+from functools import lru_cache
 
-df = pd.read_csv(os.path.dirname(os.path.realpath(__file__)) + '/resources/cities50000.tsv', sep = '\t')
+df = pd.read_csv(os.path.dirname(os.path.realpath(__file__)) + '/resources/cities50000.tsv', sep = '\t',
+                 keep_default_na = False)
 
-cities_dict = {}
-for i in range(len(df)):
-    row = df.iloc[i,].squeeze()
-    cities_dict[row.at['city'].lower()] = row.at['country_code']
+# (NA is Namibia, so country codes aren't read as missing values)
+cities_dict = dict(zip(df['city'].str.lower(), df['country_code']))
 
 countries_list = [x.name.lower() for x in pycountry.countries]
 
@@ -31,76 +44,180 @@ others = {'hubei': ('China', 'Hubei'),
           'finnland': ('Finland', ''),
           'prague': ('Czech_Republic', 'Prague')}
 
+"""names of more than one word that are always written this way
+(instead of as any other place with the same name):
+"""
+multi_word_others = {'united kingdom': ('UK', ''),
+                     'saudi arabia': ('Saudia_Arabia', ''),
+                     'new york': ('USA', 'New_York')}
 
-def get_travel_history(json_dict):
+"""These are valid cities, which will be excluded because they match other words:
+"""
+excluded_words = ['of', 'holiday', 'asia', 'northern', 'sur', 'york']
+
+excluded_subdivisions = ['hubei', 'wuhan']
+excluded_cities = ['hubei', 'wuhan', 'prague']
+
+"""country codes that pycountry doesn't have a country for:
+"""
+other_country_names = {'XK': 'Kosovo'}
+
+strip_characters = ",.:;!?-'\""
+
+
+def get_country_name(alpha_2):
     """
-    travel history, if it exists, is in: json_dict['covv_add_host_info']
+    the name to write for the country with this two letter code
     """
-    country = []
-    subdivision = []
-    city = []
-    other = []
+    if alpha_2 in other_country_names:
+        return(other_country_names[alpha_2])
+    name = pycountry.countries.get(alpha_2 = alpha_2).name
+    if name == 'Iran, Islamic Republic of':
+        return('Iran')
+    return(name.replace(' ', '_'))
+
+
+def split_words(text):
+    return([word.rstrip(strip_characters).lstrip(strip_characters) for word in text.split()])
+
+
+class gazetteer():
+    """
+    trie of place names. Each node is a dict of next word -> node, and the
+    places that end at a node are in node[None], as (kind, value) tuples:
+
+    ('country', None): a country, written as it is in the text
+    ('place', country): a subdivision or city in country, written as in the text
+    ('fixed', (country, place)): written as (country, place) whatever the text
+    """
+
+    def __init__(self):
+        self.root = {}
+        self.max_words = 0
+
+    def add(self, name, entry, replace = False):
+        """
+        add a place name. If replace, it is the only
+        place with this name (instead of one of them)
+        """
+        words = split_words(name.lower())
+        if len(words) == 0:
+            return
+        node = self.root
+        for word in words:
+            node = node.setdefault(word, {})
+        if replace:
+            node[None] = []
+        entries = node.setdefault(None, [])
+        if entry not in entries:
+            entries.append(entry)
+        self.max_words = max(self.max_words, len(words))
+
+    def find(self, text):
+        """
+        (country, place) for every name in text, in the order they are in the text.
+        Where names overlap, the longest one starting first is used (so that
+        "South Africa" isn't also read as the city "South")
+        """
+        words = split_words(text)
+        lower = [x.lower() for x in words]
+        found = []
+
+        i = 0
+        while i < len(words):
+            node = self.root
+            longest = None
+            for j in range(i, min(i + self.max_words, len(words))):
+                if lower[j] not in node:
+                    break
+                node = node[lower[j]]
+                if None not in node:
+                    continue
+                if j == i and lower[i] in excluded_words:
+                    continue
+                longest = (j, node[None])
+
+            if longest is None:
+                i += 1
+                continue
+
+            j, entries = longest
+            matched = '_'.join(words[i:j + 1])
+            for kind, value in entries:
+                if kind == 'country':
+                    found.append((matched, ''))
+                elif kind == 'place':
+                    found.append((value, matched))
+                else:
+                    found.append(value)
+            i = j + 1
 
-    add_host_info = json_dict['covv_add_host_info']
-    add_host_info_split = add_host_info.split()
+        return(found)
 
-    if 'United Kingdom' in add_host_info:
-        country.append(('UK', ''))
 
-    if 'Saudi Arabia' in add_host_info:
-        country.append(('Saudia_Arabia', ''))
+def build_gazetteer():
+    g = gazetteer()
 
-    if 'New York' in add_host_info:
-        country.append(('USA', 'New_York'))
+    for name in countries_list:
+        g.add(name, ('country', None))
 
-    for word in add_host_info_split:
-        word = word.rstrip(",.:;!?-'\"").lstrip(",.:;!?-'\"")
+    country_names = {}
+    for name, code in subdivisions_dict.items():
+        if name in excluded_subdivisions:
+            continue
+        if code not in country_names:
+            country_names[code] = get_country_name(code)
+        g.add(name, ('place', country_names[code]))
 
-        # These are valid cities, which will be excluded because they match other words:
-        if word.lower() in ['of', 'holiday', 'asia', 'northern', 'sur', 'york']:
+    for name, code in cities_dict.items():
+        if name in excluded_cities:
             continue
+        if code not in country_names:
+            country_names[code] = get_country_name(code)
+        g.add(name, ('place', country_names[code]))
 
-        if word.lower() in countries_list:
-            country.append((word.replace(' ', '_'), ''))
+    for name, value in others.items():
+        g.add(name, ('fixed', value))
+
+    for name, value in multi_word_others.items():
+        g.add(name, ('fixed', value), replace = True)
+
+    return(g)
+
+
+_gazetteer = None
+
+def get_gazetteer():
+    global _gazetteer
+    if _gazetteer is None:
+        _gazetteer = build_gazetteer()
+    return(_gazetteer)
 
-        if word.lower() in subdivisions_dict:
-            if word.lower() not in ['hubei', 'wuhan']:
-                subdivision.append(word)
-                sd_country = pycountry.countries.get(alpha_2=subdivisions_dict[word.lower()]).name
-                if sd_country == 'Iran, Islamic Republic of':
-                    country.append(('Iran', word))
-                else:
-                    country.append((sd_country.replace(' ', '_'), word))
-
-        if word.lower() in cities_dict:
-            if word.lower() not in ['hubei', 'wuhan', 'prague']:
-                city.append(word)
-                city_country = pycountry.countries.get(alpha_2=cities_dict[word.lower()]).name
-                if city_country == 'Iran, Islamic Republic of':
-                    country.append(('Iran', word))
-                else:
-                    country.append((city_country.replace(' ', '_'), word))
 
-        if word.lower() in others:
-            country.append(others[word.lower()])
+@lru_cache(maxsize = 100000)
+def find_places(add_host_info):
+    """
+    the distinct (country, place) tuples in some travel text, in the order
+    they're first found
+    """
+    return(tuple(dict.fromkeys(get_gazetteer().find(add_host_info))))
 
-    locales = set(country)
+
+def get_travel_history(json_dict):
+    """
+    travel history, if it exists, is in: json_dict['covv_add_host_info']
+    """
+    locales = find_places(json_dict['covv_add_host_info'])
 
     # sometimes sampling country is represented in the text. Let's remove whereever
     # this is from the set, if it's in there
     sampling_country = json_dict['edin_admin_0'].replace(' ', '_')
 
-    def test_sampling_country(item):
-        return item[0] != sampling_country
-
-    locales = set(filter(test_sampling_country, locales))
-
-    country_only = [x for x in locales if len(x[1]) == 0]
-    country_and_subdivision = [x for x in locales if len(x[1]) > 0]
+    locales = [x for x in locales if x[0] != sampling_country]
 
-    for country in country_only:
-        if any([country[0] == x[0] for x in country_and_subdivision]):
-            locales.remove(country)
+    # a country on its own isn't needed if there's also a place in that country
+    countries_with_places = set([x[0] for x in locales if len(x[1]) > 0])
+    locales = [x for x in locales if len(x[1]) > 0 or x[0] not in countries_with_places]
 
     locales = [x[0] + '/' + x[1] if len(x[1]) > 0 else x[0] for x in locales]
 
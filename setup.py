@@ -17,9 +17,11 @@ setup(
         "pycountry>=pycountry-19.8.18",
         "pysam>=0.15.4",
         "datapackage",
-        "epiweeks",
         "unidecode",
     ],
+    extras_require={
+        "parquet": ["pyarrow"],
+    },
     classifiers=[
         "Development Status :: 4 - Beta",
         "Topic :: Scientific/Engineering :: Bio-Informatics",
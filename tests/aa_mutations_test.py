@@ -0,0 +1,45 @@
+import os
+import unittest
+
+from datafunk.aa_mutations import *
+
+from alignments import write_alignment
+
+this_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+data_dir = os.path.join(this_dir, 'tests', 'data', 'aa_mutations')
+
+alignment = [('ref', {}),
+             # D614G, and R203K with G204R
+             ('seq1', {23403: 'G', 28881: 'AAC'}),
+             # P323L in ORF1ab, after the frameshift, and a stop in ORF8 (Q27*)
+             ('seq2', {14408: 'T', 27972: 'T'}),
+             # synonymous, missing data and ambiguous codons aren't called
+             ('seq3', {3037: 'T', 23402: 'NNN', 23404: '-', 28881: 'R'}),
+             # GCN is always alanine
+             ('seq4', {21623: 'GCN'})]
+
+class TestAAMutations(unittest.TestCase):
+    def test_aa_mutations(self):
+        fasta_file = "%s/tmp.aligned.fasta" %data_dir
+        output_file = "%s/tmp.mutations.csv" %data_dir
+        write_alignment(fasta_file, str(WuhanHu1.seq), alignment)
+
+        for threads in [1, 2]:
+            aa_mutations(fasta_file, output_file, threads = threads, batch_size = 2)
+            with open(output_file) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(lines, ['sequence_name,aa_mutations',
+                                     'ref,',
+                                     'seq1,S:D614G;N:R203K;N:G204R',
+                                     'seq2,ORF1ab:P4715L;ORF8:Q27*',
+                                     'seq3,',
+                                     'seq4,S:R21A'])
+        os.unlink(fasta_file)
+        os.unlink(output_file)
+
+    def test_translation(self):
+        t = translation()
+        self.assertEqual(len(t.reference), len(t.prefixes))
+        self.assertEqual(t.prefixes[:2], ['ORF1ab:M1', 'ORF1ab:E2'])
+        self.assertIn('S:D614', t.prefixes)
+        self.assertNotIn(ord('*'), t.reference)
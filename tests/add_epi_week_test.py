@@ -0,0 +1,44 @@
+import os
+import unittest
+import filecmp
+
+from datafunk.add_epi_week import *
+from datafunk.epicalendar import *
+
+this_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+data_dir = os.path.join(this_dir, 'tests', 'data', 'add_epi_week')
+
+class TestAddEpiWeek(unittest.TestCase):
+    def test_epi_week_and_day(self):
+        self.assertEqual(date_string_to_epi_week_and_day('2019-12-21'), ('', ''))
+        self.assertEqual(date_string_to_epi_week_and_day('2019-12-22'), ('0', '1'))
+        self.assertEqual(date_string_to_epi_week_and_day('2019-12-29'), ('1', '8'))
+        self.assertEqual(date_string_to_epi_week_and_day('2021-01-03'), ('54', '379'))
+        self.assertEqual(date_string_to_epi_week_and_day('2020-03'), ('', ''))
+
+    def test_dates_outside_calendar(self):
+        self.assertEqual(date_string_to_epi_week('2031-01-04'), date_string_to_epi_week('2030-12-29'))
+        self.assertEqual(date_string_to_epi_day('2031-01-01'), '4029')
+        self.assertEqual(date_string_to_epi_week_and_day('2021-1-4'), ('54', '380'))
+
+    def test_column_matches_single_dates(self):
+        dates = ['2020-03-15', '2019-12-21', '2020-02-30', 'None', '2020-12-31', '2024-02-29', None]
+        epi_weeks, epi_days = date_column_to_epi_weeks_and_days(dates)
+        for date, epi_week, epi_day in zip(dates, epi_weeks, epi_days):
+            self.assertEqual((epi_week, epi_day), date_string_to_epi_week_and_day(date))
+
+    def test_run(self):
+        input_file = "%s/metadata.csv" %data_dir
+        output_file = "%s/tmp.metadata.csv" %data_dir
+        expected = "%s/expected.csv" %data_dir
+        add_epi_week_column(input_file, output_file, 'sample_date', 'edin_epi_week', 'edin_epi_day')
+        self.assertTrue(filecmp.cmp(output_file, expected, shallow=False))
+        os.unlink(output_file)
+
+    def test_run_in_chunks(self):
+        input_file = "%s/metadata.csv" %data_dir
+        output_file = "%s/tmp.chunked.csv" %data_dir
+        expected = "%s/expected.csv" %data_dir
+        add_epi_week_column(input_file, output_file, 'sample_date', 'edin_epi_week', 'edin_epi_day', chunk_size=2)
+        self.assertTrue(filecmp.cmp(output_file, expected, shallow=False))
+        os.unlink(output_file)
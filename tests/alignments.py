@@ -0,0 +1,26 @@
+"""
+aligned sequences for the tests: a reference with some of its sites changed
+"""
+
+
+def mutate(seq, changes):
+    """
+    seq with the bases from each 1-based position in changes replaced
+    (by as many bases as there are)
+    """
+    seq = list(seq)
+    for position, bases in changes.items():
+        seq[position - 1: position - 1 + len(bases)] = bases
+    return(''.join(seq))
+
+
+def write_alignment(fasta_file, reference, changes, description = ''):
+    """
+    write a sequence for each (ID, changes to the reference) in changes to
+    fasta_file (with description after each ID), and return the (ID, sequence)s
+    """
+    sequences = [(ID, mutate(reference, x)) for ID, x in changes]
+    with open(fasta_file, 'w') as f:
+        for ID, seq in sequences:
+            f.write('>' + ID + description + '\n' + seq + '\n')
+    return(sequences)
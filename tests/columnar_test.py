@@ -0,0 +1,80 @@
+import os
+import unittest
+
+import pandas as pd
+
+from datafunk.columnar import *
+from datafunk.add_epi_week import add_epi_week_column
+from datafunk.process_gisaid_data import process_gisaid_data
+
+this_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+data_dir = os.path.join(this_dir, 'tests', 'data')
+
+
+class TestColumnar(unittest.TestCase):
+    def test_round_trip(self):
+        input_file = "%s/add_epi_week/expected.csv" %data_dir
+        original = pd.read_csv(input_file, dtype=str, keep_default_na=False)
+        for extension in ['parquet', 'feather']:
+            output_file = "%s/add_epi_week/tmp.metadata.%s" %(data_dir, extension)
+            save_metadata_dataframe(original, output_file)
+            self.assertTrue(read_metadata_table(output_file, as_strings=True).equals(original))
+            os.unlink(output_file)
+
+    def test_typed_columns_and_filters(self):
+        input_file = "%s/add_epi_week/expected.csv" %data_dir
+        output_file = "%s/add_epi_week/tmp.typed.parquet" %data_dir
+        add_epi_week_column(input_file, output_file, 'sample_date', 'edin_epi_week', 'edin_epi_day', chunk_size=2)
+
+        schema = get_dataset(output_file).schema
+        self.assertEqual(str(schema.field('edin_epi_week').type), 'int32')
+        self.assertEqual(str(schema.field('edin_epi_day').type), 'int32')
+
+        df = read_metadata_table(output_file, columns=['sequence_name', 'edin_epi_week'],
+                                 filters=[('edin_epi_week', '>=', 12)])
+        expected = read_metadata_table(input_file, columns=['sequence_name', 'edin_epi_week'],
+                                       filters=[('edin_epi_week', '>=', 12)], as_strings=True)
+        self.assertEqual(list(df.columns), ['sequence_name', 'edin_epi_week'])
+        self.assertTrue(len(df) > 0)
+        self.assertEqual([str(x) for x in df['edin_epi_week']], list(expected['edin_epi_week']))
+        self.assertEqual(list(df['sequence_name']), list(expected['sequence_name']))
+        os.unlink(output_file)
+
+    def test_process_gisaid_data_parquet_output(self):
+        input_json = "%s/process_gisaid_data/gisaid.json" %data_dir
+        omissions = "%s/process_gisaid_data/omissions.txt" %data_dir
+        output_fasta = "%s/process_gisaid_data/tmp.columnar.fasta" %data_dir
+        output_metadata = "%s/process_gisaid_data/tmp.columnar.parquet" %data_dir
+        process_gisaid_data(input_json, [omissions], 'False', output_fasta, output_metadata,
+                            exclude_uk = False, exclude_undated = False,
+                            exclude_subsampled = True, exclude_omitted_file = True)
+
+        df = read_metadata_table(output_metadata, as_strings=True)
+        expected = pd.read_csv("%s/process_gisaid_data/expected_new.csv" %data_dir, dtype=str, keep_default_na=False)
+        self.assertEqual(list(df.columns), list(expected.columns))
+        self.assertTrue(df.drop(columns='edin_date_stamp').equals(expected.drop(columns='edin_date_stamp')))
+
+        schema = get_dataset(output_metadata).schema
+        self.assertEqual(str(schema.field('edin_epi_week').type), 'int32')
+        self.assertEqual(str(schema.field('edin_date_stamp').type), 'date32[day]')
+        os.unlink(output_fasta)
+        os.unlink(output_metadata)
+
+    def test_process_gisaid_data_parquet_input(self):
+        input_json = "%s/process_gisaid_data/gisaid.json" %data_dir
+        omissions = "%s/process_gisaid_data/omissions.txt" %data_dir
+        input_metadata = "%s/process_gisaid_data/tmp.metadata.parquet" %data_dir
+        output_fasta = "%s/process_gisaid_data/tmp.columnar_update.fasta" %data_dir
+        output_metadata = "%s/process_gisaid_data/tmp.columnar_update.csv" %data_dir
+        save_metadata_dataframe(pd.read_csv("%s/process_gisaid_data/metadata.csv" %data_dir, dtype=str, keep_default_na=False),
+                                input_metadata)
+        process_gisaid_data(input_json, [omissions], input_metadata, output_fasta, output_metadata,
+                            exclude_uk = True, exclude_undated = False,
+                            exclude_subsampled = True, exclude_omitted_file = True)
+
+        df = pd.read_csv(output_metadata, dtype=str, keep_default_na=False)
+        expected = pd.read_csv("%s/process_gisaid_data/expected_update.csv" %data_dir, dtype=str, keep_default_na=False)
+        self.assertTrue(df.drop(columns='edin_date_stamp').equals(expected.drop(columns='edin_date_stamp')))
+        os.unlink(input_metadata)
+        os.unlink(output_fasta)
+        os.unlink(output_metadata)
@@ -0,0 +1,53 @@
+import os
+import unittest
+import filecmp
+from collections import Counter
+
+from datafunk.curate_lineages import *
+
+this_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+data_dir = os.path.join(this_dir, 'tests', 'data', 'curate_lineages')
+
+class TestCurateLineages(unittest.TestCase):
+    def test_run(self):
+        input_file = "%s/deltrans_traits.csv" %data_dir
+        output_file = "%s/tmp.assignments.csv" %data_dir
+        expected = "%s/deltrans_assignments.csv" %data_dir
+        curate_lineages(input_file, output_file)
+        self.assertTrue(filecmp.cmp(output_file, expected, shallow=False))
+        os.unlink(output_file)
+
+    def test_run_with_previous(self):
+        input_file = "%s/deltrans_traits.csv" %data_dir
+        previous_file = "%s/previous_assignments.csv" %data_dir
+        output_file = "%s/tmp.incremental_assignments.csv" %data_dir
+        expected = "%s/incremental_assignments.csv" %data_dir
+        curate_lineages(input_file, output_file, previous_file)
+        self.assertTrue(filecmp.cmp(output_file, expected, shallow=False))
+        os.unlink(output_file)
+
+    def test_remove_unchanged_lineages(self):
+        acc_name_counts = {'a': Counter(['UK1', 'UK1', 'UK2']),
+                           'b': Counter(['UK1', 'UK2']),
+                           'c': Counter(['UK1'])}
+        lin_acc_counts = {'UK1': Counter(['a', 'a', 'b', 'c']),
+                          'UK2': Counter(['a', 'b'])}
+        changed_acc_name_counts, changed_lin_acc_counts = remove_unchanged_lineages(acc_name_counts, lin_acc_counts, {'a': 'UK1'})
+        # UK1 is kept by a, so c has nothing to fall back on
+        self.assertEqual(changed_acc_name_counts, {'b': Counter(['UK2']), 'c': Counter({'': 1})})
+        self.assertEqual(changed_lin_acc_counts, {'UK2': Counter(['b'])})
+
+    def test_rename_lineages(self):
+        acc_name_counts = {'a': Counter(['UK1', 'UK1', 'UK2']),
+                           'b': Counter(['UK1', 'UK2', 'UK2', 'UK2']),
+                           'c': Counter(['UK2', 'UK3'])}
+        lin_acc_counts = {'UK1': Counter(['a', 'a', 'b']),
+                          'UK2': Counter(['a', 'b', 'b', 'b', 'c']),
+                          'UK3': Counter(['c'])}
+        acc_final_name_dict, new_names = rename_lineages(acc_name_counts, lin_acc_counts)
+        # b has more of UK2 than c does, so c falls back to UK3
+        self.assertEqual(dict(acc_final_name_dict), {'a': ['UK1'], 'b': ['UK2'], 'c': ['UK3']})
+
+    def test_name_new_lineages(self):
+        acc_final, test_counter = name_new_lineages({'a': ['UK1'], 'b': ['UK3'], 'c': [''], 'd': [''], 'e': ['']})
+        self.assertEqual(acc_final, {'a': 'UK1', 'b': 'UK3', 'c': 'UK2', 'd': 'UK4', 'e': 'UK5'})
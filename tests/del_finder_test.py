@@ -0,0 +1,58 @@
+import os
+import unittest
+
+from datafunk.del_finder import *
+
+from alignments import write_alignment
+
+this_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+data_dir = os.path.join(this_dir, 'tests', 'data', 'del_finder')
+
+alignment = [('ref', {}),
+             ('seq1', {1605: '---', 28881: '-', 1: '---'}),
+             ('seq2', {1605: '---', 11288: '-' * 9}),
+             ('seq3', {1605: '---', 29900: '-' * (len(WuhanHu1.seq) - 29899)})]
+
+class TestDelFinder(unittest.TestCase):
+    def test_find_deletions(self):
+        fasta_file = "%s/tmp.aligned.fasta" %data_dir
+        table_file = "%s/tmp.deletions.csv" %data_dir
+        write_alignment(fasta_file, str(WuhanHu1.seq), alignment)
+
+        for threads in [1, 2]:
+            find_deletions(fasta_file, table_file, threads = threads, batch_size = 2)
+            with open(table_file) as f:
+                lines = f.read().splitlines()
+            # the gaps at the ends of seq1 and seq3 aren't deletions
+            self.assertEqual(lines, ['start,length,count,frequency,examples',
+                                     '1605,3,3,0.75,seq1;seq2;seq3',
+                                     '11288,9,1,0.25,seq2',
+                                     '28881,1,1,0.25,seq1'])
+
+        find_deletions(fasta_file, table_file, min_count = 2, examples = 1)
+        with open(table_file) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines, ['start,length,count,frequency,examples',
+                                 '1605,3,3,0.75,seq1'])
+
+        os.unlink(fasta_file)
+        os.unlink(table_file)
+
+    def test_discovered_deletions_file(self):
+        fasta_file = "%s/tmp.aligned.fasta" %data_dir
+        table_file = "%s/tmp.deletions.csv" %data_dir
+        genotypes_file = "%s/tmp.genotypes.csv" %data_dir
+        write_alignment(fasta_file, str(WuhanHu1.seq), alignment)
+
+        find_deletions(fasta_file, table_file)
+        self.assertEqual(parse_del_file(table_file), [(1605, 3), (11288, 9), (28881, 1)])
+
+        del_finder(fasta_file, None, table_file, genotypes_file)
+        with open(genotypes_file) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], 'sequence_name,del_1605_3,del_11288_9,del_28881_1')
+        self.assertEqual(lines[2:], ['seq1,del,ref,del', 'seq2,del,del,ref', 'seq3,del,ref,ref'])
+
+        os.unlink(fasta_file)
+        os.unlink(table_file)
+        os.unlink(genotypes_file)
@@ -0,0 +1,94 @@
+import os
+import unittest
+import numpy as np
+
+from datafunk.distance_to_root import *
+
+from alignments import write_alignment
+
+this_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+data_dir = os.path.join(this_dir, 'tests', 'data', 'distance_to_root')
+
+def get_alignment(reference):
+    return([('seq1', {}),
+            ('seq2', {1001: 'N' if reference[1000] != 'N' else 'A',
+                      2001: 'A' if reference[2000] != 'A' else 'C'}),
+            ('seq3', {101: 'G' if reference[100] != 'G' else 'T'}),
+            ('seq5', {})])
+
+class TestDistanceToRoot(unittest.TestCase):
+    def test_get_pairwise_difference(self):
+        self.assertEqual(get_pairwise_difference('ACGTACGT', 'ACGTACGT'), (8, 0, 8))
+        self.assertEqual(get_pairwise_difference('ACGTACGT', 'acgTTCGN'), (7, 1, 8))
+        self.assertEqual(get_pairwise_difference('ACGT-CGT', 'ACGTAYGA'), (6, 1, 8))
+
+    def test_get_distances(self):
+        reference = str(WH04_align.seq)
+        fasta_file = "%s/tmp.aligned.fasta" %data_dir
+        sequences = dict(write_alignment(fasta_file, reference, get_alignment(reference)))
+
+        metadata_file = "%s/metadata.csv" %data_dir
+        metadata = read_metadata(metadata_file)
+
+        for threads, batch_size in [(1, 1000), (2, 1)]:
+            distances = dict(get_distances(fasta_file, metadata, metadata_file, threads, batch_size))
+            self.assertEqual(sorted(distances), ['seq1', 'seq2', 'seq3'])
+            for id, distance in distances.items():
+                self.assertEqual(distance, distance_per_genome(get_pairwise_difference(reference, sequences[id])))
+            self.assertEqual(distances['seq1'], 0)
+            self.assertGreater(distances['seq2'], distances['seq3'])
+        os.unlink(fasta_file)
+
+    def test_running_stats(self):
+        distances = [0, 3.5, 2.25, 10, 3.5]
+        stats = running_stats()
+        for x in distances:
+            stats.add(x)
+        self.assertAlmostEqual(stats.get_mean(), np.mean(distances))
+        self.assertAlmostEqual(stats.get_std(), np.std(distances))
+
+    def test_group_by(self):
+        fasta_file = "%s/tmp.aligned.fasta" %data_dir
+        write_alignment(fasta_file, str(WH04_align.seq), get_alignment(str(WH04_align.seq)))
+        metadata_file = "%s/metadata.csv" %data_dir
+
+        cwd = os.getcwd()
+        os.chdir(data_dir)
+        try:
+            distance_to_root(fasta_file, metadata_file, group_by = ['lineage'])
+            with open('distances.tsv') as f:
+                lines = [l.rstrip('\n').split('\t') for l in f]
+            os.unlink('distances.tsv')
+        finally:
+            os.chdir(cwd)
+        os.unlink(fasta_file)
+
+        self.assertEqual(lines[0], ['sequence_name', 'lineage', 'lineage_mean_distance', 'lineage_stdev_distance', 'sample_distance', 'distance_stdevs'])
+        self.assertEqual([l[:2] for l in lines[1:]], [['seq1', 'B.1'], ['seq2', 'B.1.1'], ['seq3', 'B.1']])
+        self.assertEqual(lines[1][2], lines[3][2])
+        self.assertEqual(lines[1][4], '0')
+
+    def test_cache(self):
+        fasta_file = "%s/tmp.aligned.fasta" %data_dir
+        write_alignment(fasta_file, str(WH04_align.seq), get_alignment(str(WH04_align.seq)))
+        metadata_file = "%s/metadata.csv" %data_dir
+        metadata = read_metadata(metadata_file)
+        cache_file = "%s/tmp.distances.sqlite" %data_dir
+
+        cache = distance_cache(cache_file, reference_id(WH04_align))
+        distances = dict(get_distances(fasta_file, metadata, metadata_file, cache = cache))
+        self.assertEqual((cache.hits, cache.misses), (0, 3))
+        cache.close()
+
+        cache = distance_cache(cache_file, reference_id(WH04_align))
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(dict(get_distances(fasta_file, metadata, metadata_file, threads = 2, cache = cache)), distances)
+        self.assertEqual((cache.hits, cache.misses), (3, 0))
+        cache.close()
+
+        cache = distance_cache(cache_file, 'another reference')
+        self.assertEqual(cache.get(sequence_hash(WH04_align.seq)), None)
+        cache.close()
+
+        os.unlink(cache_file)
+        os.unlink(fasta_file)
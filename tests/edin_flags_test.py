@@ -0,0 +1,35 @@
+import unittest
+
+from datafunk.edin_flags import *
+
+
+class TestEdinFlags(unittest.TestCase):
+    def test_round_trip(self):
+        for text in ['', 'check_country', 'check_country:omitted_date:uk_sequence', 'omitted_file:subsample_omit']:
+            self.assertEqual(flags_to_string(flags_from_string(text)), text)
+
+    def test_add_and_has(self):
+        record = {'edin_flag': ''}
+        record = add_edin_flag(record, 'omitted_file')
+        record = add_edin_flag(record, 'check_country')
+        record = add_edin_flag(record, 'omitted_file')
+        self.assertTrue(has_edin_flag(record, 'omitted_file'))
+        self.assertFalse(has_edin_flag(record, 'uk_sequence'))
+        # in the order they were set
+        self.assertEqual(edin_flag_to_string(record['edin_flag']), 'omitted_file:check_country')
+
+        record = {'edin_flag': 'uk_sequence', 'sequence_name': 'x'}
+        self.assertTrue(has_edin_flag(record, 'uk_sequence'))
+        self.assertEqual(metadata_values(add_edin_flag(record, 'a_new_flag'), ['sequence_name', 'edin_flag']),
+                         ['x', 'uk_sequence:a_new_flag'])
+
+    def test_text_kept(self):
+        for text in ['uk_sequence:check_country', 'foo:check_date', 'check_date:check_date']:
+            record = {'edin_flag': text}
+            self.assertEqual(edin_flag_to_string(get_flags(text)), text)
+            self.assertEqual(edin_flag_to_string(add_edin_flag(record, 'check_date')['edin_flag']),
+                             text if 'check_date' in text else text + ':check_date')
+
+    def test_column(self):
+        values = ['uk_sequence', '', 'check_country:uk_sequence', None, 'omitted_date']
+        self.assertEqual(list(flags_column_has(values, 'uk_sequence')), [True, False, True, False, False])
@@ -0,0 +1,45 @@
+import os
+import unittest
+
+from datafunk.genotype import *
+
+from alignments import write_alignment
+
+this_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+data_dir = os.path.join(this_dir, 'tests', 'data', 'genotype')
+
+alignment = [('ref', {}),
+             ('seq1', {23403: 'G', 1605: '---', 28881: 'N'}),
+             ('seq2', {11288: '-' * 9, 21765: 'NNNNNN', 23402: 'G-T', 3037: 't'})]
+
+class TestGenotype(unittest.TestCase):
+    def test_wide(self):
+        fasta_file = "%s/tmp.aligned.fasta" %data_dir
+        output_file = "%s/tmp.genotypes.csv" %data_dir
+        write_alignment(fasta_file, str(WuhanHu1.seq), alignment)
+
+        for threads in [1, 2]:
+            genotype(fasta_file, "%s/variants.csv" %data_dir, output_file, threads = threads, batch_size = 2)
+            with open(output_file) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(lines, ['sequence_name,D614G_nuc,R203K,C3037T,del_1605_3,del_11288_9,del_21765_6,D614G,codon_3036',
+                                     'ref,D,R,ref,ref,ref,ref,D,S',
+                                     'seq1,G,X,ref,del,ref,ref,G,S',
+                                     'seq2,X,R,alt,ref,del,X,X,F'])
+        os.unlink(fasta_file)
+        os.unlink(output_file)
+
+    def test_long(self):
+        fasta_file = "%s/tmp.aligned.fasta" %data_dir
+        output_file = "%s/tmp.genotypes.csv" %data_dir
+        write_alignment(fasta_file, str(WuhanHu1.seq), alignment)
+
+        genotype(fasta_file, "%s/variants.csv" %data_dir, output_file, output_format = 'long')
+        with open(output_file) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 1 + 3 * 8)
+        self.assertEqual(lines[0], 'sequence_name,variant,type,genotype')
+        self.assertIn('seq1,del_1605_3,del,del', lines)
+        self.assertIn('seq2,D614G,aa,X', lines)
+        os.unlink(fasta_file)
+        os.unlink(output_file)
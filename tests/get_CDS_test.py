@@ -0,0 +1,109 @@
+import os
+import unittest
+
+from Bio.Seq import Seq
+
+from datafunk.get_CDS import *
+from datafunk.del_finder import WuhanHu1
+
+from alignments import write_alignment
+
+this_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+data_dir = os.path.join(this_dir, 'tests', 'data', 'get_CDS')
+
+alignment = [('ref', {}),
+             ('seq1', {23403: 'g', 28881: 'AAC', 21563: 'NNN', 26245: '---'}),
+             ('seq2', {21623: 'GCN', 13460: 'Y'})]
+
+class TestGetCDS(unittest.TestCase):
+    def get_expected(self, seq, translate):
+        """
+        the CDSs of seq, the way get_CDS used to take them out (with Biopython)
+        """
+        CDSs = []
+        for coords in CDS_coordinates:
+            if isinstance(coords[0], tuple):
+                CDS = Seq(seq[coords[0][0] - 1:coords[0][1]] + seq[coords[1][0] - 1:coords[1][1]])
+            else:
+                CDS = Seq(seq[coords[0] - 1:coords[1]])
+            CDS = CDS[:-3]
+            CDSs.append(str(CDS.translate()) if translate else str(CDS))
+        return(CDSs)
+
+    def test_get_CDS(self):
+        fasta_file = "%s/tmp.aligned.fasta" %data_dir
+        output_file = "%s/tmp.CDS.fasta" %data_dir
+        sequences = write_alignment(fasta_file, str(WuhanHu1.seq), alignment, description = ' description')
+
+        for translate in [False, True]:
+            get_CDS(fasta_file, output_file, translate = translate, batch_size = 2)
+            with open(output_file) as f:
+                lines = f.read().splitlines()
+            expected = []
+            for ID, seq in sequences:
+                expected += ['>' + ID, ''.join(self.get_expected(seq, translate))]
+            self.assertEqual(lines, expected)
+
+        os.unlink(fasta_file)
+        os.unlink(output_file)
+
+    def test_per_gene(self):
+        fasta_file = "%s/tmp.aligned.fasta" %data_dir
+        prefix = "%s/tmp." %data_dir
+        sequences = write_alignment(fasta_file, str(WuhanHu1.seq), alignment, description = ' description')
+
+        get_CDS(fasta_file, None, translate = True, gene_prefix = prefix)
+        for i, name in enumerate(CDS_names):
+            with open(prefix + name + '.fasta') as f:
+                lines = f.read().splitlines()
+            expected = []
+            for ID, seq in sequences:
+                expected += ['>' + ID, self.get_expected(seq, True)[i]]
+            self.assertEqual(lines, expected)
+            os.unlink(prefix + name + '.fasta')
+
+        os.unlink(fasta_file)
+
+    def test_parse_gff3(self):
+        coordinates, names = parse_gff3("%s/MN908947.3.gff3" %data_dir)
+        self.assertEqual(coordinates, CDS_coordinates)
+        self.assertEqual(names, CDS_names)
+
+    def test_gff3_file(self):
+        fasta_file = "%s/tmp.aligned.fasta" %data_dir
+        output_file = "%s/tmp.CDS.fasta" %data_dir
+        gff3_output_file = "%s/tmp.gff3_CDS.fasta" %data_dir
+        write_alignment(fasta_file, str(WuhanHu1.seq), alignment, description = ' description')
+
+        get_CDS(fasta_file, output_file, translate = True)
+        get_CDS(fasta_file, gff3_output_file, translate = True, gff3_file = "%s/MN908947.3.gff3" %data_dir)
+        with open(output_file) as f, open(gff3_output_file) as g:
+            self.assertEqual(f.read(), g.read())
+
+        os.unlink(fasta_file)
+        os.unlink(output_file)
+        os.unlink(gff3_output_file)
+
+    def test_gff3_clashing_names(self):
+        # ORF1a and ORF1ab are both in the ORF1ab gene, so ORF1a is called by its Name
+        coordinates, names = parse_gff3("%s/NC_045512.2.gff3" %data_dir)
+        self.assertEqual(coordinates, [CDS_coordinates[0], (266, 13483)] + CDS_coordinates[1:])
+        self.assertEqual(names, ['ORF1ab', 'YP_009725295.1'] + CDS_names[1:])
+
+        fasta_file = "%s/tmp.aligned.fasta" %data_dir
+        prefix = "%s/tmp." %data_dir
+        sequences = write_alignment(fasta_file, str(WuhanHu1.seq), alignment)
+
+        get_CDS(fasta_file, None, translate = True, gene_prefix = prefix, gff3_file = "%s/NC_045512.2.gff3" %data_dir)
+        with open(prefix + 'ORF1ab.fasta') as f:
+            self.assertEqual(f.read().splitlines(), ['>ref', self.get_expected(sequences[0][1], True)[0],
+                                                     '>seq1', self.get_expected(sequences[1][1], True)[0],
+                                                     '>seq2', self.get_expected(sequences[2][1], True)[0]])
+        with open(prefix + 'YP_009725295.1.fasta') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[::2], ['>ref', '>seq1', '>seq2'])
+        self.assertEqual(lines[1::2], [str(Seq(seq[265:13480]).translate()) for ID, seq in sequences])
+
+        for name in names:
+            os.unlink(prefix + name + '.fasta')
+        os.unlink(fasta_file)
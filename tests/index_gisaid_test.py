@@ -0,0 +1,105 @@
+import os
+import json
+import unittest
+
+from Bio import bgzf
+
+from datafunk.index_gisaid import *
+from datafunk.fetch_gisaid import fetch_gisaid
+
+this_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+data_dir = os.path.join(this_dir, 'tests', 'data', 'process_gisaid_data')
+
+
+def read_dump(file):
+    with open(file, 'r') as f:
+        return [json.loads(l) for l in f]
+
+
+class TestIndexGisaid(unittest.TestCase):
+    def fetch_all(self, input_json):
+        records = read_dump("%s/gisaid.json" %data_dir)
+        output = "%s/tmp.fetched.json" %data_dir
+        accessions = [records[7]['covv_accession_id'], records[2]['covv_accession_id'], 'EPI_ISL_999999']
+        fetch_gisaid(input_json, output, accessions = accessions, virus_names = [records[0]['covv_virus_name']])
+        fetched = read_dump(output)
+        self.assertEqual(fetched, [records[7], records[2], records[0]])
+        os.unlink(output)
+
+    def test_plain(self):
+        input_json = "%s/gisaid.json" %data_dir
+        index_file = "%s/tmp.gisaid.json.idx" %data_dir
+        index_gisaid(input_json, index_file)
+        index = gisaid_index(input_json, index_file)
+        self.assertEqual(len(index), 10)
+        os.rename(index_file, input_json + '.idx')
+        try:
+            self.fetch_all(input_json)
+        finally:
+            os.unlink(input_json + '.idx')
+
+    def test_bgzip(self):
+        input_json = "%s/tmp.gisaid.json.gz" %data_dir
+        with open("%s/gisaid.json" %data_dir, 'rb') as f:
+            data = f.read()
+        # small blocks, so that records cross block boundaries
+        out = bgzf.BgzfWriter(input_json, 'wb')
+        for i in range(0, len(data), 1000):
+            out.write(data[i:i + 1000])
+            out.flush()
+        out.close()
+
+        self.assertTrue(is_bgzip(input_json))
+        index_gisaid(input_json)
+        self.fetch_all(input_json)
+        os.unlink(input_json + '.idx')
+        os.unlink(input_json)
+
+    def test_changed_dump(self):
+        input_json = "%s/tmp.changed.json" %data_dir
+        with open("%s/gisaid.json" %data_dir, 'r') as f:
+            lines = f.readlines()
+        with open(input_json, 'w') as f:
+            f.writelines(lines)
+        index_gisaid(input_json)
+        stat = os.stat(input_json)
+
+        # the same size and modification time, but with two records swapped
+        with open(input_json, 'w') as f:
+            f.writelines([lines[1], lines[0]] + lines[2:])
+        os.utime(input_json, ns = (stat.st_atime_ns, stat.st_mtime_ns))
+        with self.assertRaises(SystemExit):
+            gisaid_index(input_json)
+
+        # a line that isn't the record the index says it is
+        index_gisaid(input_json)
+        index = gisaid_index(input_json).open()
+        first = json.loads(lines[1])['covv_accession_id']
+        second = json.loads(lines[0])['covv_accession_id']
+        self.assertEqual(json.loads(index.get_line(first)), json.loads(lines[1]))
+        index.accessions[first] = index.accessions[second]
+        with self.assertRaises(SystemExit):
+            index.get_line(first)
+        index.close()
+
+        os.unlink(input_json + '.idx')
+        os.unlink(input_json)
+
+    def test_fasta_and_metadata(self):
+        input_json = "%s/gisaid.json" %data_dir
+        index_gisaid(input_json)
+        records = read_dump(input_json)
+        output = "%s/tmp.fetched.fasta" %data_dir
+        fetch_gisaid(input_json, output, accessions = [records[1]['covv_accession_id']], output_format = 'fasta')
+        with open(output) as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn(records[1]['covv_accession_id'], lines[0])
+
+        fetch_gisaid(input_json, output, accessions = [records[1]['covv_accession_id']], output_format = 'metadata')
+        with open(output) as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('edin_header,'))
+        os.unlink(output)
+        os.unlink(input_json + '.idx')
@@ -0,0 +1,84 @@
+import os
+import unittest
+import filecmp
+import io
+from contextlib import redirect_stderr
+
+from datafunk.ingest_gisaid import *
+from datafunk.process_gisaid_data import process_gisaid_data, _user_stages
+from datafunk.process_gisaid_sequence_data import process_gisaid_sequence_data
+from datafunk.gisaid_json_2_metadata import gisaid_json_2_metadata
+
+this_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+data_dir = os.path.join(this_dir, 'tests', 'data', 'process_gisaid_data')
+
+
+def read_csv_without_date_stamp(file):
+    with open(file, 'r') as f:
+        lines = [line.rstrip('\n').split(',') for line in f]
+    i = lines[0].index('edin_date_stamp')
+    for l in lines[1:]:
+        l[i] = ''
+    return lines
+
+
+counted = []
+def count_record(record):
+    counted.append(record['covv_accession_id'])
+    return record
+
+
+class TestIngestGisaid(unittest.TestCase):
+    def test_one_pass_matches_separate_commands(self):
+        input_json = "%s/gisaid.json" %data_dir
+        omissions = "%s/omissions.txt" %data_dir
+        input_metadata = "%s/metadata.csv" %data_dir
+
+        process_gisaid_data(input_json, [omissions], input_metadata, "%s/tmp.pgd.fasta" %data_dir, "%s/tmp.pgd.csv" %data_dir,
+                            exclude_uk = True, exclude_undated = False,
+                            exclude_subsampled = True, exclude_omitted_file = True)
+        process_gisaid_sequence_data(input_json, "%s/tmp.pgsd.fasta" %data_dir, [omissions], exclude_uk = True)
+        gisaid_json_2_metadata(input_json, "%s/tmp.gj2m.csv" %data_dir, 'False', [omissions], None)
+
+        ingest_gisaid(input_json,
+                      input_omit_file_list = [omissions],
+                      input_metadata = input_metadata,
+                      output_fasta = "%s/tmp.ingest.fasta" %data_dir,
+                      output_metadata = "%s/tmp.ingest.csv" %data_dir,
+                      output_sequences = "%s/tmp.ingest_sequences.fasta" %data_dir,
+                      output_json_metadata = "%s/tmp.ingest_json.csv" %data_dir,
+                      exclude_uk = True)
+
+        self.assertTrue(filecmp.cmp("%s/tmp.pgd.fasta" %data_dir, "%s/tmp.ingest.fasta" %data_dir, shallow=False))
+        self.assertTrue(filecmp.cmp("%s/tmp.pgsd.fasta" %data_dir, "%s/tmp.ingest_sequences.fasta" %data_dir, shallow=False))
+        self.assertEqual(read_csv_without_date_stamp("%s/tmp.pgd.csv" %data_dir),
+                         read_csv_without_date_stamp("%s/tmp.ingest.csv" %data_dir))
+        self.assertEqual(read_csv_without_date_stamp("%s/tmp.gj2m.csv" %data_dir),
+                         read_csv_without_date_stamp("%s/tmp.ingest_json.csv" %data_dir))
+
+        for x in ['pgd.fasta', 'pgd.csv', 'pgsd.fasta', 'gj2m.csv', 'ingest.fasta', 'ingest.csv',
+                  'ingest_sequences.fasta', 'ingest_json.csv']:
+            os.unlink("%s/tmp.%s" %(data_dir, x))
+
+    def test_only_sequences(self):
+        input_json = "%s/gisaid.json" %data_dir
+        output = "%s/tmp.only_sequences.fasta" %data_dir
+        ingest_gisaid(input_json, output_sequences = output, exclude_undated = True)
+        with open(output) as f:
+            headers = [l for l in f if l.startswith('>')]
+        self.assertTrue(len(headers) > 0)
+        self.assertFalse(os.path.exists("%s/tmp.pgd.fasta" %data_dir))
+        os.unlink(output)
+
+    def test_add_stages_and_timings(self):
+        input_json = "%s/gisaid.json" %data_dir
+        output = "%s/tmp.stages.csv" %data_dir
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            ingest_gisaid(input_json, output_metadata = output,
+                          add_stages = [__name__ + ':count_record'], stage_timings = True)
+        self.assertEqual(len(counted), 10)
+        self.assertIn(__name__ + ':count_record\t', stderr.getvalue())
+        # the stage was only added for that run
+        self.assertEqual(_user_stages, [])
+        os.unlink(output)
@@ -0,0 +1,71 @@
+import os
+import random
+import unittest
+
+from datafunk.omissions import *
+from datafunk.process_gisaid_data import check_edin_omitted_file, parse_omissions_file
+from datafunk.process_gisaid_sequence_data import keep_entry
+from datafunk.gisaid_json_2_metadata import update_edin_omitted_field
+from datafunk.edin_flags import edin_flag_to_string
+
+this_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+data_dir = os.path.join(this_dir, 'tests', 'data', 'omissions')
+
+class TestOmissions(unittest.TestCase):
+    def test_aho_corasick_matches_substring_search(self):
+        random.seed(0)
+        patterns = [''.join(random.choice('ACG') for _ in range(random.randint(1, 5))) for _ in range(30)]
+        automaton = aho_corasick(patterns)
+        for i in range(500):
+            text = ''.join(random.choice('ACGT') for _ in range(random.randint(0, 12)))
+            self.assertEqual(automaton.search(text), any([x in text for x in patterns]))
+
+    def test_aho_corasick_overlapping_patterns(self):
+        automaton = aho_corasick(['abcd', 'bc', 'cde'])
+        self.assertTrue(automaton.search('xabcx'))
+        self.assertTrue(automaton.search('abcde'))
+        self.assertFalse(automaton.search('abdce'))
+        self.assertFalse(aho_corasick([]).search('abc'))
+
+    def test_matcher(self):
+        matcher = omissions_matcher(['EPI_ISL_400001', 'Atlantis/', 'regex:^bat/', 'regex:/20(19|18)$'])
+        self.assertTrue(matcher)
+        self.assertIn('EPI_ISL_400001', matcher)
+        self.assertNotIn('EPI_ISL_400003', matcher)
+        self.assertTrue(matcher.search('England/X|EPI_ISL_400001||UK'))
+        self.assertTrue(matcher.search('Atlantis/X-4/2020'))
+        self.assertTrue(matcher.search('bat/Yunnan/RaTG13/2013'))
+        self.assertTrue(matcher.search('China/WH04/2019'))
+        self.assertFalse(matcher.search('Italy/bat/2020'))
+        self.assertFalse(omissions_matcher([]))
+
+    def test_omissions_file(self):
+        entries = parse_omissions_file("%s/omissions.txt" %data_dir)
+        self.assertEqual(entries, ['EPI_ISL_400002', 'regex:/X-\\d+/', 'Brazil/SP-9'])
+        matcher = omissions_matcher(entries)
+
+        record = {'covv_accession_id': 'EPI_ISL_400004', 'covv_virus_name': 'hCoV-19/Atlantis/X-4/2020',
+                  'covv_host': 'Human', 'edin_header': 'Atlantis/X-4/2020|EPI_ISL_400004||Atlantis|||2020-05-01',
+                  'edin_flag': ''}
+        self.assertEqual(edin_flag_to_string(check_edin_omitted_file(record, matcher)['edin_flag']), 'omitted_file')
+
+        record = {'covv_accession_id': 'EPI_ISL_400007', 'covv_virus_name': 'hCoV-19/Italy/LOM-7/2020',
+                  'covv_host': 'Human', 'edin_header': 'Italy/LOM-7/2020|EPI_ISL_400007||Italy|Lombardy||2020-12-30',
+                  'edin_flag': ''}
+        self.assertEqual(edin_flag_to_string(check_edin_omitted_file(record, matcher)['edin_flag']), '')
+
+        self.assertFalse(keep_entry('Atlantis/X-4/2020|EPI_ISL_400004||Atlantis|||2020-05-01', matcher))
+        self.assertFalse(keep_entry('Italy/LOM-2/2020|EPI_ISL_400002||Italy|||2020-05-01', matcher))
+        self.assertTrue(keep_entry('Italy/LOM-7/2020|EPI_ISL_400007||Italy|||2020-12-30', matcher))
+
+    def test_gisaid_json_2_metadata_omissions(self):
+        matcher = omissions_matcher(parse_omissions_file("%s/omissions.txt" %data_dir))
+
+        def record(ID, virus_name):
+            return({'covv_accession_id': ID, 'covv_virus_name': virus_name, 'covv_collection_date': '2020-05-01',
+                    'edin_admin_0': 'Italy', 'edin_admin_1': '', 'edin_admin_2': '', 'edin_omitted': ''})
+
+        self.assertEqual(update_edin_omitted_field(record('EPI_ISL_400002', 'hCoV-19/Italy/LOM-2/2020'), matcher)['edin_omitted'], 'True')
+        self.assertEqual(update_edin_omitted_field(record('EPI_ISL_400004', 'hCoV-19/Atlantis/X-4/2020'), matcher)['edin_omitted'], 'True')
+        self.assertEqual(update_edin_omitted_field(record('EPI_ISL_400005', 'hCoV-19/Brazil/SP-9/2020'), matcher)['edin_omitted'], 'True')
+        self.assertEqual(update_edin_omitted_field(record('EPI_ISL_400007', 'hCoV-19/Italy/LOM-7/2020'), matcher)['edin_omitted'], '')
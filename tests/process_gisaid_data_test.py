@@ -0,0 +1,334 @@
+import os
+import unittest
+import filecmp
+import hashlib
+
+from datafunk.process_gisaid_data import *
+from datafunk.location_cache import location_cache
+from datafunk.edin_flags import edin_flag_to_string
+
+this_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+data_dir = os.path.join(this_dir, 'tests', 'data', 'process_gisaid_data')
+
+
+def read_csv_without_date_stamp(file):
+    """
+    the date stamp of new records is today's date, so blank it before comparing
+    """
+    with open(file, 'r') as f:
+        lines = [line.rstrip('\n').split(',') for line in f]
+    i = lines[0].index('edin_date_stamp')
+    for l in lines[1:]:
+        l[i] = ''
+    return lines
+
+
+class TestProcessGisaidData(unittest.TestCase):
+    def test_new_metadata(self):
+        input_json = "%s/gisaid.json" %data_dir
+        omissions = "%s/omissions.txt" %data_dir
+        output_fasta = "%s/tmp.new.fasta" %data_dir
+        output_metadata = "%s/tmp.new.csv" %data_dir
+        process_gisaid_data(input_json, [omissions], 'False', output_fasta, output_metadata,
+                            exclude_uk = False, exclude_undated = False,
+                            exclude_subsampled = True, exclude_omitted_file = True)
+        self.assertTrue(filecmp.cmp(output_fasta, "%s/expected_new.fasta" %data_dir, shallow=False))
+        self.assertEqual(read_csv_without_date_stamp(output_metadata),
+                         read_csv_without_date_stamp("%s/expected_new.csv" %data_dir))
+        os.unlink(output_fasta)
+        os.unlink(output_metadata)
+
+    def test_update_metadata(self):
+        input_json = "%s/gisaid.json" %data_dir
+        omissions = "%s/omissions.txt" %data_dir
+        input_metadata = "%s/metadata.csv" %data_dir
+        output_fasta = "%s/tmp.update.fasta" %data_dir
+        output_metadata = "%s/tmp.update.csv" %data_dir
+        process_gisaid_data(input_json, [omissions], input_metadata, output_fasta, output_metadata,
+                            exclude_uk = True, exclude_undated = False,
+                            exclude_subsampled = True, exclude_omitted_file = True)
+        self.assertTrue(filecmp.cmp(output_fasta, "%s/expected_update.fasta" %data_dir, shallow=False))
+        self.assertEqual(read_csv_without_date_stamp(output_metadata),
+                         read_csv_without_date_stamp("%s/expected_update.csv" %data_dir))
+        os.unlink(output_fasta)
+        os.unlink(output_metadata)
+
+    def test_change_feed(self):
+        input_json = "%s/gisaid.json" %data_dir
+        omissions = "%s/omissions.txt" %data_dir
+        input_metadata = "%s/metadata.csv" %data_dir
+        output_fasta = "%s/tmp.feed.fasta" %data_dir
+        output_metadata = "%s/tmp.feed.csv" %data_dir
+        change_feed = "%s/tmp.changes.tsv" %data_dir
+        process_gisaid_data(input_json, [omissions], input_metadata, output_fasta, output_metadata,
+                            exclude_uk = True, exclude_undated = False,
+                            exclude_subsampled = True, exclude_omitted_file = True,
+                            change_feed = change_feed)
+        changes = read_change_feed(change_feed)
+        self.assertEqual(changes, {'added': ['EPI_ISL_400010'],
+                                   'changed': {'EPI_ISL_400006': ['covv_lineage']},
+                                   'removed': ['EPI_ISL_399999']})
+        os.unlink(output_fasta)
+        os.unlink(output_metadata)
+        os.unlink(change_feed)
+
+    def test_checkpoint_and_resume(self):
+        input_json = "%s/gisaid.json" %data_dir
+        omissions = "%s/omissions.txt" %data_dir
+        output_fasta = "%s/tmp.resume.fasta" %data_dir
+        output_metadata = "%s/tmp.resume.csv" %data_dir
+        checkpoint_file = "%s/tmp.checkpoint.jsonl" %data_dir
+        processed = []
+        stop = ['EPI_ISL_400007']
+
+        # the same stage in both runs, since the stages are part of the checkpoint's description
+        def count(record):
+            if record['covv_accession_id'] in stop:
+                raise RuntimeError('stopped')
+            processed.append(record['covv_accession_id'])
+            return record
+
+        register_stage('count', count)
+        try:
+            with self.assertRaises(RuntimeError):
+                process_gisaid_data(input_json, [omissions], 'False', output_fasta, output_metadata,
+                                    exclude_uk = False, exclude_undated = False,
+                                    exclude_subsampled = True, exclude_omitted_file = True,
+                                    checkpoint_file = checkpoint_file, checkpoint_every = 2)
+
+            self.assertFalse(os.path.exists(output_metadata))
+            self.assertEqual(len(processed), 6)
+
+            processed = []
+            stop = []
+            process_gisaid_data(input_json, [omissions], 'False', output_fasta, output_metadata,
+                                exclude_uk = False, exclude_undated = False,
+                                exclude_subsampled = True, exclude_omitted_file = True,
+                                checkpoint_file = checkpoint_file, checkpoint_every = 2, resume = True)
+        finally:
+            unregister_stage('count')
+
+        # the first 6 were saved in 3 chunks of 2, so only the last 4 are processed again
+        self.assertEqual(len(processed), 4)
+        self.assertFalse(os.path.exists(checkpoint_file))
+        self.assertTrue(filecmp.cmp(output_fasta, "%s/expected_new.fasta" %data_dir, shallow=False))
+        self.assertEqual(read_csv_without_date_stamp(output_metadata),
+                         read_csv_without_date_stamp("%s/expected_new.csv" %data_dir))
+        os.unlink(output_fasta)
+        os.unlink(output_metadata)
+
+    def test_resume_with_other_stages(self):
+        input_json = "%s/gisaid.json" %data_dir
+        omissions = "%s/omissions.txt" %data_dir
+        output_fasta = "%s/tmp.stages.fasta" %data_dir
+        output_metadata = "%s/tmp.stages.csv" %data_dir
+        checkpoint_file = "%s/tmp.stages.checkpoint.jsonl" %data_dir
+
+        def stop(record):
+            raise RuntimeError('stopped')
+
+        register_stage('stop', stop)
+        try:
+            with self.assertRaises(RuntimeError):
+                process_gisaid_data(input_json, [omissions], 'False', output_fasta, output_metadata,
+                                    exclude_uk = False, exclude_undated = False,
+                                    exclude_subsampled = True, exclude_omitted_file = True,
+                                    checkpoint_file = checkpoint_file)
+        finally:
+            unregister_stage('stop')
+
+        # records from the checkpoint didn't go through the stages of this run
+        with self.assertRaises(SystemExit):
+            process_gisaid_data(input_json, [omissions], 'False', output_fasta, output_metadata,
+                                exclude_uk = False, exclude_undated = False,
+                                exclude_subsampled = True, exclude_omitted_file = True,
+                                checkpoint_file = checkpoint_file, resume = True)
+        os.unlink(checkpoint_file)
+
+    def test_resume_with_changed_input(self):
+        input_json = "%s/tmp.changed.json" %data_dir
+        omissions = "%s/omissions.txt" %data_dir
+        output_fasta = "%s/tmp.changed.fasta" %data_dir
+        output_metadata = "%s/tmp.changed.csv" %data_dir
+        checkpoint_file = "%s/tmp.changed.checkpoint.jsonl" %data_dir
+        with open("%s/gisaid.json" %data_dir) as f:
+            lines = f.readlines()
+        with open(input_json, 'w') as f:
+            f.writelines(lines)
+        stat = os.stat(input_json)
+
+        def stop(record):
+            raise RuntimeError('stopped')
+
+        register_stage('stop', stop)
+        try:
+            with self.assertRaises(RuntimeError):
+                process_gisaid_data(input_json, [omissions], 'False', output_fasta, output_metadata,
+                                    exclude_uk = False, exclude_undated = False,
+                                    exclude_subsampled = True, exclude_omitted_file = True,
+                                    checkpoint_file = checkpoint_file)
+
+            # a dump of the same size and modification time, but not the same records
+            with open(input_json, 'w') as f:
+                f.writelines([lines[1], lines[0]] + lines[2:])
+            os.utime(input_json, ns = (stat.st_atime_ns, stat.st_mtime_ns))
+            with self.assertRaises(SystemExit):
+                process_gisaid_data(input_json, [omissions], 'False', output_fasta, output_metadata,
+                                    exclude_uk = False, exclude_undated = False,
+                                    exclude_subsampled = True, exclude_omitted_file = True,
+                                    checkpoint_file = checkpoint_file, resume = True)
+        finally:
+            unregister_stage('stop')
+        os.unlink(checkpoint_file)
+        os.unlink(input_json)
+
+    def check_partitions(self, partition_by):
+        """
+        partition the test dump by partition_by, check the partitions hold the
+        same records as the unpartitioned outputs, and return the manifest
+        """
+        input_json = "%s/gisaid.json" %data_dir
+        omissions = "%s/omissions.txt" %data_dir
+        output_fasta = "%s/tmp.partition.fasta" %data_dir
+        output_metadata = "%s/tmp.partition.csv" %data_dir
+        partition_dir = "%s/tmp.partitions" %data_dir
+        process_gisaid_data(input_json, [omissions], 'False', output_fasta, output_metadata,
+                            exclude_uk = False, exclude_undated = False,
+                            exclude_subsampled = True, exclude_omitted_file = True,
+                            partition_by = partition_by, partition_dir = partition_dir, max_open_files = 1)
+
+        with open(partition_dir + '/manifest.tsv') as f:
+            manifest = [l.rstrip('\n').split('\t') for l in f][1:]
+        self.assertEqual(sum([int(x[2]) for x in manifest]), 10)
+
+        fasta_lines = []
+        metadata_lines = []
+        for partition, metadata_file, metadata_records, metadata_bytes, fasta_file, fasta_records, fasta_bytes in manifest:
+            with open(partition_dir + '/' + metadata_file) as f:
+                lines = f.readlines()
+            self.assertEqual(len(lines) - 1, int(metadata_records))
+            self.assertEqual(os.path.getsize(partition_dir + '/' + metadata_file), int(metadata_bytes))
+            metadata_lines.extend(lines[1:])
+            if fasta_file:
+                with open(partition_dir + '/' + fasta_file) as f:
+                    fasta_lines.extend(f.readlines())
+            os.unlink(partition_dir + '/' + metadata_file)
+            if fasta_file:
+                os.unlink(partition_dir + '/' + fasta_file)
+
+        with open(output_fasta) as f:
+            self.assertEqual(sorted(fasta_lines), sorted(f.readlines()))
+        with open(output_metadata) as f:
+            self.assertEqual(sorted(metadata_lines), sorted(f.readlines()[1:]))
+
+        os.unlink(partition_dir + '/manifest.tsv')
+        os.rmdir(partition_dir)
+        os.unlink(output_fasta)
+        os.unlink(output_metadata)
+        return manifest
+
+    def test_partition_by(self):
+        manifest = self.check_partitions('edin_admin_0')
+        self.assertEqual([x[0] for x in manifest], ['Atlantis', 'Brazil', 'China', 'Italy', 'South_Korea', 'UK', 'USA'])
+
+    def test_partition_by_edin_flag(self):
+        manifest = self.check_partitions('edin_flag')
+        # partitioned by the flags as they are written (records without any go into unknown)
+        self.assertEqual([x[0] for x in manifest], ['check_country', 'omitted_date', 'omitted_date_omitted_file',
+                                                    'omitted_file', 'uk_sequence', 'unknown'])
+
+    def test_partition_failure(self):
+        partition_dir = "%s/tmp.failed_partitions" %data_dir
+        fields_list = ['covv_accession_id', 'edin_admin_0']
+
+        def records(stop):
+            for i, country in enumerate(['UK', 'Italy', 'UK']):
+                ID = 'stopped' + str(i) if stop else str(i)
+                yield {'covv_accession_id': ID, 'edin_admin_0': country, 'edin_header': ID,
+                       'edin_omitted': 'False', 'sequence': 'ACGT'}
+            if stop:
+                raise RuntimeError('stopped')
+
+        write_partitioned_output('edin_admin_0', partition_dir, records(False), fields_list)
+        with open(partition_dir + '/UK.csv') as f:
+            before = f.read()
+
+        # nothing is replaced by a run that doesn't finish
+        with self.assertRaises(RuntimeError):
+            write_partitioned_output('edin_admin_0', partition_dir, records(True), fields_list, max_open_files = 1)
+        self.assertEqual(sorted(os.listdir(partition_dir)), ['Italy.csv', 'Italy.fasta', 'UK.csv', 'UK.fasta', 'manifest.tsv'])
+        with open(partition_dir + '/UK.csv') as f:
+            self.assertEqual(f.read(), before)
+
+        for x in os.listdir(partition_dir):
+            os.unlink(partition_dir + '/' + x)
+        os.rmdir(partition_dir)
+
+    def test_partition_names(self):
+        partition_dir = "%s/tmp.named_partitions" %data_dir
+        fields_list = ['covv_accession_id', 'edin_epi_week']
+        records = [{'covv_accession_id': str(i), 'edin_epi_week': week, 'edin_header': str(i),
+                    'edin_omitted': 'True', 'sequence': 'ACGT'}
+                   for i, week in enumerate(['53', 'A B', '8', 'A_B', '54', 'A B'])]
+        write_partitioned_output('edin_epi_week', partition_dir, records, fields_list)
+
+        with open(partition_dir + '/manifest.tsv') as f:
+            manifest = [l.rstrip('\n').split('\t') for l in f][1:]
+        # values that make the same file name are kept apart, and numbers are sorted by value
+        self.assertEqual([x[0] for x in manifest], ['8', '53', '54', 'A_B', 'A_B_' + hashlib.sha1(b'A_B').hexdigest()[:8]])
+        self.assertEqual([x[2] for x in manifest], ['1', '1', '1', '2', '1'])
+
+        for x in os.listdir(partition_dir):
+            os.unlink(partition_dir + '/' + x)
+        os.rmdir(partition_dir)
+
+    def test_stages_skip_and_register(self):
+        def add_flag(record):
+            record['edin_flag'] = 'custom'
+            return record
+
+        register_stage('add_flag', add_flag, before = 'update_edin_omit_field')
+        try:
+            stages = get_new_record_stages(False, {}, skip_stages = ['get_travel_history'])
+        finally:
+            unregister_stage('add_flag')
+
+        names = [x[0] for x in stages]
+        self.assertNotIn('get_travel_history', names)
+        self.assertEqual(names[-2:], ['add_flag', 'update_edin_omit_field'])
+
+        timings = defaultdict(float)
+        record = {'covv_location': 'Europe / Italy', 'covv_accession_id': 'EPI_ISL_1', 'covv_virus_name': 'hCoV-19/Italy/X/2020',
+                  'covv_collection_date': '2020-03-01', 'covv_host': 'Human'}
+        record = run_stages(record, stages, timings)
+        self.assertEqual(record['edin_flag'], 'custom')
+        self.assertEqual(record['edin_epi_week'], '10')
+        self.assertEqual(record['edin_travel'], '')
+        self.assertEqual(set(timings.keys()), set(names))
+
+    def test_location_cache_flags_unknown_country(self):
+        cache = location_cache(maxsize = 2)
+        d = {'covv_location': 'Europe / Atlantis', 'covv_accession_id': 'EPI_ISL_1', 'edin_flag': 'uk_sequence'}
+        d = get_admin_levels_from_json_dict(d, cache = cache)
+        self.assertEqual(edin_flag_to_string(d['edin_flag']), 'uk_sequence:check_country')
+        self.assertEqual(d['edin_admin_0'], 'Atlantis')
+
+        d = {'covv_location': 'Europe / Atlantis', 'covv_accession_id': 'EPI_ISL_2', 'edin_flag': ''}
+        d = get_admin_levels_from_json_dict(d, cache = cache)
+        self.assertEqual(edin_flag_to_string(d['edin_flag']), 'check_country')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_location_cache_save_and_load(self):
+        cache_file = "%s/tmp.locations.json" %data_dir
+        cache = location_cache(maxsize = 2)
+        cache.get('Europe / England / Cambridge')
+        cache.get('Europe / Atlantis')
+        cache.get('Asia / South Korea')
+        cache.save(cache_file)
+
+        reloaded = location_cache(maxsize = 2)
+        reloaded.load(cache_file)
+        self.assertEqual(list(reloaded.entries.keys()), ['Europe / Atlantis', 'Asia / South Korea'])
+        self.assertEqual(reloaded.get('Europe / Atlantis'), ('Atlantis', '', '', True))
+        self.assertEqual(reloaded.misses, 0)
+        os.unlink(cache_file)
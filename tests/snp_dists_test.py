@@ -0,0 +1,67 @@
+import os
+import unittest
+import filecmp
+import numpy as np
+
+from datafunk.snp_dists import *
+
+this_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+data_dir = os.path.join(this_dir, 'tests', 'data', 'snp_dists')
+
+class TestSnpDists(unittest.TestCase):
+    def test_run(self):
+        input_file = "%s/aligned.fasta" %data_dir
+        output_file = "%s/tmp.distances.tsv" %data_dir
+        expected = "%s/distances.tsv" %data_dir
+        snp_dists(input_file, output_file)
+        self.assertTrue(filecmp.cmp(output_file, expected, shallow=False))
+        os.unlink(output_file)
+
+    def test_blocks_and_processes(self):
+        input_file = "%s/aligned.fasta" %data_dir
+        output_file = "%s/tmp.distances.tsv" %data_dir
+        expected = "%s/distances.tsv" %data_dir
+        snp_dists(input_file, output_file, threads = 2, block_size = 3)
+        self.assertTrue(filecmp.cmp(output_file, expected, shallow=False))
+        os.unlink(output_file)
+
+    def test_npz(self):
+        input_file = "%s/aligned.fasta" %data_dir
+        output_file = "%s/tmp.distances.npz" %data_dir
+        snp_dists(input_file, output_file, block_size = 3)
+        npz = np.load(output_file)
+        self.assertEqual(list(npz['ids']), ['seq1', 'seq2', 'seq3', 'seq4'])
+        self.assertTrue((npz['distances'] == np.array([[0, 1, 2, 2],
+                                                       [1, 0, 1, 3],
+                                                       [2, 1, 0, 4],
+                                                       [2, 3, 4, 0]])).all())
+        npz.close()
+
+        snp_dists(input_file, output_file, threshold = 1)
+        npz = np.load(output_file)
+        self.assertEqual(list(npz['i']), [0, 1])
+        self.assertEqual(list(npz['j']), [1, 2])
+        self.assertEqual(list(npz['distance']), [1, 1])
+        npz.close()
+        os.unlink(output_file)
+
+    def test_no_variable_sites(self):
+        input_file = "%s/tmp.identical.fasta" %data_dir
+        output_file = "%s/tmp.distances.tsv" %data_dir
+        with open(input_file, 'w') as f:
+            f.write('>a\nACGTN\n>b\nACGT-\n')
+        snp_dists(input_file, output_file)
+        with open(output_file) as f:
+            self.assertEqual(f.read(), 'sequence_1\tsequence_2\tdistance\na\tb\t0\n')
+        os.unlink(input_file)
+        os.unlink(output_file)
+
+    def test_unequal_lengths(self):
+        input_file = "%s/tmp.unequal.fasta" %data_dir
+        with open("%s/aligned.fasta" %data_dir) as f:
+            lines = f.readlines()
+        with open(input_file, 'w') as f:
+            f.writelines(lines + ['>short\n', 'ACGT\n'])
+        with self.assertRaises(SystemExit):
+            snp_dists(input_file, "%s/tmp.distances.tsv" %data_dir)
+        os.unlink(input_file)
@@ -0,0 +1,26 @@
+import os
+import unittest
+import filecmp
+
+from datafunk.snp_finder import *
+
+this_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+data_dir = os.path.join(this_dir, 'tests', 'data', 'snp_finder')
+
+class TestSnpFinder(unittest.TestCase):
+    def test_run(self):
+        alignment_file = "%s/alignment.fasta" %data_dir
+        snp_file = "%s/snps.csv" %data_dir
+        output_file = "%s/tmp.genotypes.csv" %data_dir
+        expected = "%s/genotypes.csv" %data_dir
+        read_alignment_and_get_snps(alignment_file, snp_file, output_file)
+        self.assertTrue(filecmp.cmp(output_file, expected, shallow=False))
+        os.unlink(output_file)
+
+    def test_get_column_map(self):
+        column_map = get_column_map('-AC--GT-')
+        self.assertEqual(column_map[0], 0)
+        self.assertEqual(column_map[1], 1)
+        self.assertEqual(column_map[2], 4)
+        self.assertEqual(column_map[4], 7)
+        self.assertNotIn(5, column_map)
@@ -0,0 +1,61 @@
+import os
+import unittest
+
+from datafunk.sparse_alignment import *
+
+from alignments import write_alignment
+
+this_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+data_dir = os.path.join(this_dir, 'tests', 'data', 'sparse_alignment')
+
+reference = str(WuhanHu1.seq).upper()
+
+alignment = [('ref', {}),
+             ('seq1', {1: 'NNNN', 241: 'T', 3037: 'T', 23403: 'G', 29900: '----'}),
+             ('seq2', {241: 'T', 11288: '-' * 9, 21000: 'NNRNN', 28881: 'AAC'})]
+
+class TestSparseAlignment(unittest.TestCase):
+    def test_encode(self):
+        fasta_file = "%s/tmp.aligned.fasta" %data_dir
+        sparse_file = "%s/tmp.sparse.tsv" %data_dir
+        write_alignment(fasta_file, reference, alignment)
+
+        for threads in [1, 2]:
+            sparse_encode(fasta_file, sparse_file, threads = threads, batch_size = 2)
+            with open(sparse_file) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(lines, ['#reference\t' + reference_id(WuhanHu1) + '\t29903',
+                                     'sequence_name\tsubstitutions\tN\tgaps',
+                                     'ref\t\t\t',
+                                     'seq1\t241T,3037T,23403G\t1-4\t29900-29903',
+                                     'seq2\t241T,21002R,28881A,28882A,28883C\t21000-21001,21003-21004\t11288-11296'])
+
+        os.unlink(fasta_file)
+        os.unlink(sparse_file)
+
+    def test_decode(self):
+        fasta_file = "%s/tmp.aligned.fasta" %data_dir
+        sparse_file = "%s/tmp.sparse.tsv.gz" %data_dir
+        decoded_file = "%s/tmp.decoded.fasta" %data_dir
+        write_alignment(fasta_file, reference, alignment)
+
+        sparse_encode(fasta_file, sparse_file)
+        sparse_decode(sparse_file, decoded_file)
+        with open(fasta_file) as f, open(decoded_file) as g:
+            self.assertEqual(f.read(), g.read())
+
+        os.unlink(fasta_file)
+        os.unlink(sparse_file)
+        os.unlink(decoded_file)
+
+    def test_sparse_sequence(self):
+        seq1 = parse_sparse_line('seq1\t241T,3037T,23403G\t1-4\t29900-29903')
+        seq2 = parse_sparse_line('seq2\t241T,21002R,28881A\t21000-21001,23403-23403\t11288-11296')
+
+        self.assertEqual(format_sparse_sequence(seq1), 'seq1\t241T,3037T,23403G\t1-4\t29900-29903\n')
+        self.assertEqual([seq1.get_base(x, reference) for x in [1, 4, 5, 241, 29899, 29903]], ['N', 'N', reference[4], 'T', reference[29898], '-'])
+        self.assertEqual([seq2.get_base(x, reference) for x in [11287, 11288, 11296, 21001, 21002]], [reference[11286], '-', '-', 'N', 'R'])
+
+        # 3037 and 28881 differ, 23403 is N in seq2 and 241 is the same
+        self.assertEqual(get_snp_distance(seq1, seq2, reference), 2)
+        self.assertEqual(get_snp_distance(seq1, seq1, reference), 0)
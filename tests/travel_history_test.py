@@ -0,0 +1,31 @@
+import unittest
+
+from datafunk.travel_history import *
+
+
+def travel(text, sampling_country = 'UK'):
+    return get_travel_history({'covv_add_host_info': text, 'edin_admin_0': sampling_country})['edin_travel']
+
+
+class TestTravelHistory(unittest.TestCase):
+    def test_single_words(self):
+        self.assertEqual(travel('Returned from Italy.'), 'Italy')
+        self.assertEqual(travel('travel to Kyoto, Japan'), 'Japan/Kyoto')
+        self.assertEqual(travel('holiday in Wuhan'), 'China/Hubei')
+        self.assertEqual(travel('visited the UK'), '')
+        self.assertEqual(travel('visited the UK', 'Italy'), 'UK')
+        self.assertEqual(travel(''), '')
+
+    def test_multi_word_names(self):
+        self.assertEqual(travel('Travelled to United Kingdom', 'Italy'), 'UK')
+        self.assertEqual(travel('Trip to New York'), 'USA/New_York')
+        self.assertEqual(travel('Returned from South Africa'), 'South_Africa')
+        self.assertEqual(travel('Flew from Los Angeles then Italy'), 'United_States/Los_Angeles;Italy')
+
+    def test_order_and_cache(self):
+        self.assertEqual(travel('Spain then Italy then Spain'), 'Spain;Italy')
+        find_places.cache_clear()
+        travel('Spain then Italy')
+        travel('Spain then Italy', 'Spain')
+        self.assertEqual(find_places.cache_info().hits, 1)
+        self.assertEqual(travel('Spain then Italy', 'Spain'), 'Italy')